@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+from collections.abc import Mapping
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from segment import DocValueTable
+
+
+def doc_length_array(doc_lengths: Union[Mapping, Sequence[int]], doc_ids: np.ndarray) -> np.ndarray:
+    """
+    Return the lengths of doc_ids as a float array.
+    Dense length arrays are indexed directly and segment-backed tables are
+    read with a vectorized binary search; plain dicts (a freshly built index)
+    are looked up one by one.
+    """
+    if not isinstance(doc_lengths, Mapping):
+        return np.asarray(doc_lengths)[doc_ids].astype(np.float64)
+    if isinstance(doc_lengths, DocValueTable):
+        table_ids = np.asarray(doc_lengths.doc_ids)
+        table_lengths = np.asarray(doc_lengths.values_array)
+        return table_lengths[np.searchsorted(table_ids, doc_ids)].astype(np.float64)
+    return np.fromiter((doc_lengths.get(int(doc_id), 0) for doc_id in doc_ids),
+                       dtype=np.float64, count=len(doc_ids))
+
+
+# Upper bound on the queries x documents score cells held at once (8 bytes each)
+SCORE_BLOCK_CELLS = 1 << 22
+
+
+class TermDocumentMatrix:
+    """
+    BM25 weights of a set of terms in CSR form: row i holds the postings of
+    terms[i], with columns indexing into doc_ids.
+    Rows are ordered like top_k_scores orders query terms, rarest (highest
+    IDF) first, so scores sum in the same order as InvertedIndex.search.
+    """
+
+    def __init__(self, inverted_index, terms: Sequence[str], k1: float, b: float) -> None:
+        stats = inverted_index.stats
+        index = inverted_index.index
+        term_ids = {term: index.term_id(term) for term in terms}
+        self.terms = sorted(term_ids, key=lambda term: (-stats.bm25_idfs[term_ids[term]], term))
+        self.rows = {term: row for row, term in enumerate(self.terms)}
+
+        # Decode each posting list once
+        indptr = [0]
+        posting_docs: List[int] = []
+        posting_tfs: List[int] = []
+        idfs = np.empty(len(self.terms), dtype=np.float64)
+        for row, term in enumerate(self.terms):
+            term_id = term_ids[term]
+            for doc_id, tf in index.postings(term_id).items():
+                posting_docs.append(doc_id)
+                posting_tfs.append(tf)
+            indptr.append(len(posting_docs))
+            idfs[row] = stats.bm25_idfs[term_id]
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+
+        docs = np.asarray(posting_docs, dtype=np.int64)
+        tfs = np.asarray(posting_tfs, dtype=np.float64)
+        self.doc_ids, self.indices = np.unique(docs, return_inverse=True)
+
+        # BM25 weight of every posting, evaluated in the same operation order as top_k_scores
+        avg_doc_length = stats.avg_doc_length or 1.0
+        lengths = doc_length_array(stats.doc_lengths_by_id, self.doc_ids)[self.indices]
+        length_norm = 1 - b + b * lengths / avg_doc_length
+        row_idfs = np.repeat(idfs, np.diff(self.indptr))
+        self.data = row_idfs * ((tfs * (k1 + 1)) / (tfs + k1 * length_norm))
+
+    def query_matrix(self, queries: Sequence[Sequence[str]]) -> np.ndarray:
+        """Return the binary queries x terms matrix of the queries' terms."""
+        matrix = np.zeros((len(queries), len(self.terms)), dtype=bool)
+        for query, terms in enumerate(queries):
+            matrix[query, [self.rows[term] for term in terms]] = True
+        return matrix
+
+    def multiply(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Return the queries x documents score matrix of a binary queries x
+        terms matrix times this matrix. Each row of this matrix is added to
+        every query holding its term at once, in row order, so each score
+        is summed term by term exactly as top_k_scores sums it.
+        """
+        scores = np.zeros((len(queries), len(self.doc_ids)))
+        for row in range(len(self.terms)):
+            query_rows = np.flatnonzero(queries[:, row])
+            if len(query_rows):
+                start, end = self.indptr[row], self.indptr[row + 1]
+                # A term has one posting per document, so no cell is indexed twice
+                scores[np.ix_(query_rows, self.indices[start:end])] += self.data[start:end]
+        return scores
+
+
+def top_k(doc_ids: np.ndarray, scores: np.ndarray, limit: int) -> List[Tuple[int, float]]:
+    """
+    Return the `limit` highest scoring (doc_id, score) pairs, ordered like
+    InvertedIndex.search: by score, then by lower doc id.
+    """
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > limit:
+        # Keep everything tied with the k-th score so ties resolve by doc id
+        threshold = np.partition(scores[candidates], len(candidates) - limit)[len(candidates) - limit]
+        candidates = candidates[scores[candidates] >= threshold]
+    order = np.lexsort((doc_ids[candidates], -scores[candidates]))[:limit]
+    return [(int(doc_ids[candidates[i]]), float(scores[candidates[i]])) for i in order]
+
+
+def batch_search(inverted_index, queries: Sequence[str], limit: int,
+                 k1: float, b: float) -> List[List[Tuple[int, float]]]:
+    """
+    Rank documents for many queries at once with BM25.
+    All queries are analyzed up front and each posting list is decoded once
+    into a CSR term x document matrix. The distinct queries then form a
+    binary query x term matrix, which is multiplied by it in blocks of
+    queries that keep at most SCORE_BLOCK_CELLS scores in memory.
+    """
+    if limit <= 0:
+        return [[] for _ in queries]
+    index = inverted_index.index
+    # Queries that analyze to the same terms share one result
+    keys = [tuple(sorted({term for term in inverted_index.analyzer.analyze(query) if term in index}))
+            for query in queries]
+    distinct = [key for key in dict.fromkeys(keys) if key]
+    matrix = TermDocumentMatrix(inverted_index, sorted({term for key in distinct for term in key}), k1, b)
+
+    results: Dict[Tuple[str, ...], List[Tuple[int, float]]] = {(): []}
+    block_size = max(SCORE_BLOCK_CELLS // max(len(matrix.doc_ids), 1), 1)
+    for start in range(0, len(distinct), block_size):
+        block = distinct[start:start + block_size]
+        scores = matrix.multiply(matrix.query_matrix(block))
+        for key, row in zip(block, scores):
+            results[key] = top_k(matrix.doc_ids, row, limit)
+    return [results[key] for key in keys]
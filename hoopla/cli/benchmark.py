@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+DEFAULT_DOC_COUNTS = [10_000]
+DEFAULT_QUERY_COUNT = 1000
+DEFAULT_SEED = 42
+DEFAULT_LIMIT = 10
+BENCHMARK_FORMAT = 1
+
+# Synthetic corpora draw words from a Zipf distribution over this many
+# pseudo-words, mixed with stopwords, like real plot descriptions
+VOCABULARY_SIZE = 50_000
+STOPWORD_RATE = 0.3
+STOPWORDS = ("the", "a", "of", "and", "to", "in", "his", "her", "with", "an", "on", "for")
+CONSONANTS = "bcdfghjklmnprstvwz"
+VOWELS = "aeiou"
+# The query log repeats a pool of distinct queries (one per QUERY_REPEAT entries)
+# with Zipf popularity, so a small head of queries dominates
+QUERY_REPEAT = 5
+QUERY_LENGTHS = (1, 1, 2, 2, 2, 3, 3, 4)
+PERCENTILES = (50, 90, 95, 99)
+
+
+def default_work_dir() -> Path:
+    """Return the directory for corpora and benchmark caches (hoopla/cache/benchmark)."""
+    base = Path(__file__).resolve().parents[1]  # .../hoopla
+    return base / "cache" / "benchmark"
+
+
+def zipf_weights(count: int) -> List[float]:
+    """Cumulative Zipf (s=1) weights for ranks 1..count, for random.choices."""
+    cumulative = []
+    total = 0.0
+    for rank in range(1, count + 1):
+        total += 1 / rank
+        cumulative.append(total)
+    return cumulative
+
+
+def make_vocabulary(rng: random.Random, size: int) -> List[str]:
+    """Return `size` distinct pronounceable pseudo-words, most frequent first."""
+    words: Dict[str, None] = {}
+    while len(words) < size:
+        syllables = rng.randint(2, 4)
+        words["".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(syllables))] = None
+    return list(words)
+
+
+def generate_corpus(path: Path, doc_count: int, seed: int) -> List[str]:
+    """
+    Write a synthetic corpus of doc_count movies in the movies.json shape to
+    path and return its vocabulary. The same seed gives the same corpus.
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, VOCABULARY_SIZE)
+    weights = zipf_weights(len(vocabulary))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as fh:
+        fh.write('{"movies": [')
+        for doc_id in range(1, doc_count + 1):
+            title = rng.choices(vocabulary, cum_weights=weights, k=rng.randint(1, 4))
+            words = rng.choices(vocabulary, cum_weights=weights, k=rng.randint(20, 80))
+            words = [rng.choice(STOPWORDS) if rng.random() < STOPWORD_RATE else word for word in words]
+            record = {
+                "id": doc_id,
+                "title": " ".join(word.capitalize() for word in title),
+                "description": " ".join(words) + ".",
+            }
+            fh.write((", " if doc_id > 1 else "") + json.dumps(record))
+        fh.write("]}\n")
+    os.replace(tmp_path, path)
+    return vocabulary
+
+
+def generate_queries(vocabulary: List[str], count: int, seed: int) -> List[str]:
+    """Return a query log of `count` queries where popular queries repeat."""
+    rng = random.Random(seed)
+    weights = zipf_weights(len(vocabulary))
+    pool = [" ".join(rng.choices(vocabulary, cum_weights=weights, k=rng.choice(QUERY_LENGTHS)))
+            for _ in range(max(count // QUERY_REPEAT, 1))]
+    return rng.choices(pool, cum_weights=zipf_weights(len(pool)), k=count)
+
+
+def prepare_inputs(work_dir: Path, doc_count: int, query_count: int, seed: int) -> Dict[str, Path]:
+    """Generate the corpus and query log for a run, reusing files from earlier runs."""
+    corpus = work_dir / f"corpus-{doc_count}-{seed}.json"
+    queries = work_dir / f"queries-{doc_count}-{query_count}-{seed}.txt"
+    if not corpus.exists() or not queries.exists():
+        log(f"Generating {doc_count} documents and {query_count} queries...")
+        vocabulary = generate_corpus(corpus, doc_count, seed)
+        queries.write_text("\n".join(generate_queries(vocabulary, query_count, seed + 1)) + "\n",
+                           encoding="utf-8")
+    return {"corpus": corpus, "queries": queries}
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def time_operation(operation: Callable[[Any], Any], inputs: Iterable[Any]) -> Dict[str, float]:
+    """Call operation on every input and summarize the latencies in milliseconds."""
+    latencies = []
+    start = time.perf_counter()
+    for item in inputs:
+        call_start = time.perf_counter()
+        operation(item)
+        latencies.append(time.perf_counter() - call_start)
+    total = time.perf_counter() - start
+    latencies.sort()
+    summary = {"count": len(latencies),
+               "mean_ms": 1000 * sum(latencies) / len(latencies) if latencies else 0.0}
+    for percent in PERCENTILES:
+        summary[f"p{percent}_ms"] = 1000 * percentile(latencies, percent)
+    summary["max_ms"] = 1000 * latencies[-1] if latencies else 0.0
+    summary["throughput_qps"] = len(latencies) / total if total else 0.0
+    return summary
+
+
+def peak_rss() -> Dict[str, Optional[int]]:
+    """Peak resident set size of this process and of its finished children, in bytes."""
+    if resource is None:
+        return {"peak_rss_bytes": None, "peak_children_rss_bytes": None}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "peak_children_rss_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+
+def directory_size(path: Path) -> int:
+    """Total size in bytes of the files in a directory."""
+    return sum(entry.stat().st_size for entry in path.iterdir() if entry.is_file())
+
+
+def drop_page_cache(path: Path) -> bool:
+    """
+    Ask the OS to evict a file from the page cache, so the next load reads it
+    from disk. Returns False where this is not supported.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+
+def stage_build(corpus: Path, workers: int) -> Dict[str, Any]:
+    """Build and save the index of corpus; runs in its own process."""
+    from keyword_search_cli import InvertedIndex
+
+    start = time.perf_counter()
+    index = InvertedIndex()
+    index.build(workers=workers, filename=str(corpus))
+    index.save()
+    result = {"documents": len(index.docmap), "build_seconds": time.perf_counter() - start}
+    result.update(peak_rss())
+    return result
+
+
+def stage_query(queries_path: Path, limit: int, seed: int) -> Dict[str, Any]:
+    """Time cold and warm loads and the query hot paths; runs in its own process."""
+    from keyword_search_cli import SEGMENT_FILENAME, InvertedIndex
+
+    queries = [line for line in queries_path.read_text(encoding="utf-8").splitlines() if line]
+    page_cache_dropped = drop_page_cache(InvertedIndex.cache_path() / SEGMENT_FILENAME)
+
+    # Cold: a fresh process, including the analyzer setup, with the segment out of the page cache
+    start = time.perf_counter()
+    index = InvertedIndex()
+    index.load()
+    cold_load = time.perf_counter() - start
+    start = time.perf_counter()
+    index.search(queries[0], limit)
+    first_query = time.perf_counter() - start
+    start = time.perf_counter()
+    InvertedIndex().load()
+    warm_load = time.perf_counter() - start
+
+    rng = random.Random(seed)
+    doc_ids = list(index.docmap)
+    terms = [query.split()[0] for query in queries]
+    lookups = [(rng.choice(doc_ids), term) for term in terms]
+    operations = {
+        "search": time_operation(lambda query: index.search(query, limit), queries),
+        "get_documents": time_operation(index.get_documents, queries),
+        "get_tf": time_operation(lambda lookup: index.get_tf(*lookup), lookups),
+        "get_idf": time_operation(index.get_idf, terms),
+    }
+    result = {
+        "load": {"cold_seconds": cold_load, "warm_seconds": warm_load,
+                 "first_query_seconds": first_query, "page_cache_dropped": page_cache_dropped},
+        "operations": operations,
+    }
+    result.update(peak_rss())
+    return result
+
+
+def run_stage(arguments: List[str], cache_dir: Path) -> Dict[str, Any]:
+    """Run a stage in a fresh interpreter with its own cache directory; returns its JSON result."""
+    env = dict(os.environ, HOOPLA_CACHE_DIR=str(cache_dir))
+    completed = subprocess.run([sys.executable, str(Path(__file__).resolve()), "stage", *arguments],
+                               env=env, check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark(doc_count: int, query_count: int, workers: int, limit: int, seed: int,
+                  work_dir: Path) -> Dict[str, Any]:
+    """Benchmark build, load and queries on a corpus of doc_count documents."""
+    inputs = prepare_inputs(work_dir, doc_count, query_count, seed)
+    cache_dir = work_dir / f"cache-{doc_count}-{seed}"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for entry in cache_dir.iterdir():
+        if entry.is_file():
+            entry.unlink()
+
+    log(f"Building index of {doc_count} documents...")
+    build = run_stage(["build", "--corpus", str(inputs["corpus"]), "--workers", str(workers)], cache_dir)
+    log(f"Running {query_count} queries...")
+    queries = run_stage(["query", "--queries", str(inputs["queries"]), "--limit", str(limit),
+                         "--seed", str(seed)], cache_dir)
+    return {
+        "documents": doc_count,
+        "queries": query_count,
+        "corpus_bytes": inputs["corpus"].stat().st_size,
+        "cache_bytes": directory_size(cache_dir),
+        "build": build,
+        "load": queries.pop("load"),
+        "operations": queries.pop("operations"),
+        "query_peak_rss_bytes": queries["peak_rss_bytes"],
+    }
+
+
+def git_commit() -> Optional[str]:
+    """Return the current git commit, with a -dirty suffix for local changes, or None."""
+    repo = Path(__file__).resolve().parent
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo,
+                               check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def log(message: str) -> None:
+    """Progress messages go to stderr so stdout stays machine-readable."""
+    print(message, file=sys.stderr, flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark index build, load and query performance")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    run_parser = subparsers.add_parser("run", help="Benchmark synthetic corpora and write JSON results")
+    run_parser.add_argument("--docs", type=int, nargs="+", default=DEFAULT_DOC_COUNTS,
+                            help="Corpus sizes to benchmark, e.g. 10000 100000 1000000 (default: 10000)")
+    run_parser.add_argument("--queries", type=int, default=DEFAULT_QUERY_COUNT,
+                            help=f"Queries in the query log (default: {DEFAULT_QUERY_COUNT})")
+    run_parser.add_argument("--workers", type=int, default=1,
+                            help="Worker processes for the build (default: 1)")
+    run_parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT,
+                            help=f"Results per search (default: {DEFAULT_LIMIT})")
+    run_parser.add_argument("--seed", type=int, default=DEFAULT_SEED,
+                            help=f"Seed for the corpus and query log (default: {DEFAULT_SEED})")
+    run_parser.add_argument("--work-dir", type=str, default=str(default_work_dir()),
+                            help="Directory for generated corpora and indexes (default: hoopla/cache/benchmark)")
+    run_parser.add_argument("--output", type=str, default="-",
+                            help="File to write the JSON results to (default: stdout)")
+
+    generate_parser = subparsers.add_parser("generate", help="Only write a synthetic corpus and query log")
+    generate_parser.add_argument("--docs", type=int, default=DEFAULT_DOC_COUNTS[0],
+                                 help="Number of documents (default: 10000)")
+    generate_parser.add_argument("--queries", type=int, default=DEFAULT_QUERY_COUNT,
+                                 help=f"Queries in the query log (default: {DEFAULT_QUERY_COUNT})")
+    generate_parser.add_argument("--seed", type=int, default=DEFAULT_SEED,
+                                 help=f"Random seed (default: {DEFAULT_SEED})")
+    generate_parser.add_argument("--work-dir", type=str, default=str(default_work_dir()),
+                                 help="Directory to write the files to (default: hoopla/cache/benchmark)")
+
+    # Internal: one measured stage, run in a fresh process by `run`
+    stage_parser = subparsers.add_parser("stage")
+    stage_parser.add_argument("stage", choices=("build", "query"))
+    stage_parser.add_argument("--corpus", type=str)
+    stage_parser.add_argument("--queries", type=str)
+    stage_parser.add_argument("--workers", type=int, default=1)
+    stage_parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    stage_parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+
+    args = parser.parse_args()
+
+    match args.command:
+        case "run":
+            parameters = {"docs": args.docs, "queries": args.queries, "workers": args.workers,
+                          "limit": args.limit, "seed": args.seed}
+            runs = [run_benchmark(doc_count, args.queries, args.workers, args.limit, args.seed,
+                                  Path(args.work_dir))
+                    for doc_count in args.docs]
+            report = {
+                "format": BENCHMARK_FORMAT,
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "parameters": parameters,
+                "runs": runs,
+            }
+            output = json.dumps(report, indent=2)
+            if args.output == "-":
+                print(output)
+            else:
+                Path(args.output).write_text(output + "\n", encoding="utf-8")
+                log(f"Results written to {args.output}")
+
+        case "generate":
+            inputs = prepare_inputs(Path(args.work_dir), args.docs, args.queries, args.seed)
+            print(f"Corpus: {inputs['corpus']}")
+            print(f"Queries: {inputs['queries']}")
+
+        case "stage":
+            if args.stage == "build":
+                result = stage_build(Path(args.corpus), args.workers)
+            else:
+                result = stage_query(Path(args.queries), args.limit, args.seed)
+            print(json.dumps(result))
+
+        case _:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+
+import re
+from bisect import bisect_left
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from postings import NO_MORE_DOCS, CompactIndex, PostingCursor
+from text_analysis import TextAnalyzer
+
+# Query tokens: "quoted phrases" (possibly unterminated), parentheses and bare words
+QUERY_TOKEN = re.compile(r'"[^"]*"?|\(|\)|[^\s()"]+')
+OPERATORS = ("AND", "OR", "NOT")
+
+
+class Term:
+    """A single stemmed term."""
+
+    def __init__(self, term: str) -> None:
+        self.term = term
+
+
+class Phrase:
+    """Stemmed terms that must appear at fixed offsets from each other."""
+
+    def __init__(self, terms: List[Tuple[str, int]]) -> None:
+        self.terms = terms
+
+
+class And:
+    def __init__(self, children: List["Node"]) -> None:
+        self.children = children
+
+
+class Or:
+    def __init__(self, children: List["Node"]) -> None:
+        self.children = children
+
+
+class Not:
+    def __init__(self, child: "Node") -> None:
+        self.child = child
+
+
+Node = Union[Term, Phrase, And, Or, Not]
+
+
+class QueryParser:
+    """
+    Recursive descent parser for boolean queries:
+
+        query   := or
+        or      := and ("OR" and)*
+        and     := not (["AND"] not)*      adjacent operands are ANDed
+        not     := "NOT" not | primary
+        primary := "(" query ")" | "quoted phrase" | word
+
+    Words and phrases go through the same analyzer as indexing. Operands that
+    analyze to nothing (stopwords, punctuation) are dropped.
+    """
+
+    def __init__(self, analyzer: TextAnalyzer) -> None:
+        self.analyzer = analyzer
+        self.tokens: List[str] = []
+        self.pos = 0
+
+    def parse(self, query: str) -> Optional[Node]:
+        """Parse query; returns None if nothing searchable is left."""
+        self.tokens = QUERY_TOKEN.findall(query)
+        self.pos = 0
+        node = self.__or()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.pos]}' in query.")
+        return node
+
+    def __peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def __or(self) -> Optional[Node]:
+        children = [self.__and()]
+        while self.__peek() == "OR":
+            self.pos += 1
+            children.append(self.__and())
+        return _combine(Or, children)
+
+    def __and(self) -> Optional[Node]:
+        children = [self.__not()]
+        while self.__peek() not in (None, ")", "OR"):
+            if self.__peek() == "AND":
+                self.pos += 1
+            children.append(self.__not())
+        return _combine(And, children)
+
+    def __not(self) -> Optional[Node]:
+        if self.__peek() == "NOT":
+            self.pos += 1
+            child = self.__not()
+            return None if child is None else Not(child)
+        return self.__primary()
+
+    def __primary(self) -> Optional[Node]:
+        token = self.__peek()
+        if token is None or token == ")" or token in OPERATORS:
+            expected = "end of query" if token is None else f"'{token}'"
+            raise ValueError(f"Expected a term but found {expected}.")
+        self.pos += 1
+        if token == "(":
+            node = self.__or()
+            if self.__peek() != ")":
+                raise ValueError("Missing closing parenthesis in query.")
+            self.pos += 1
+            return node
+        if token.startswith('"'):
+            if len(token) < 2 or not token.endswith('"'):
+                raise ValueError("Unterminated phrase in query.")
+            return self.__phrase(token[1:-1])
+        stemmed_tokens = self.analyzer.analyze(token)
+        return _combine(And, [Term(stem) for stem in stemmed_tokens])
+
+    def __phrase(self, text: str) -> Optional[Node]:
+        analyzed = self.analyzer.analyze_positions(text)
+        if len(analyzed) <= 1:
+            return _combine(And, [Term(stem) for stem, _ in analyzed])
+        first = analyzed[0][1]
+        return Phrase([(stem, position - first) for stem, position in analyzed])
+
+
+def _combine(node_type, children: List[Optional[Node]]) -> Optional[Node]:
+    """Build an And/Or node, dropping empty operands and unwrapping single ones."""
+    children = [child for child in children if child is not None]
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return node_type(children)
+
+
+# Cursors share PostingCursor's interface: doc_id (-1 before the first call,
+# NO_MORE_DOCS when exhausted), next(), advance(target) and cost.
+
+class ListCursor:
+    """Cursor over a sorted sequence of doc ids."""
+
+    def __init__(self, doc_ids: Sequence[int]) -> None:
+        self.doc_ids = doc_ids
+        self.doc_id = -1
+        self.i = 0
+
+    @property
+    def cost(self) -> int:
+        return len(self.doc_ids)
+
+    def next(self) -> int:
+        if self.i >= len(self.doc_ids):
+            self.doc_id = NO_MORE_DOCS
+        else:
+            self.doc_id = self.doc_ids[self.i]
+            self.i += 1
+        return self.doc_id
+
+    def advance(self, target: int) -> int:
+        if self.doc_id >= target:
+            return self.doc_id
+        self.i = bisect_left(self.doc_ids, target, self.i)
+        return self.next()
+
+
+class Conjunction:
+    """
+    Doc ids present in every child cursor.
+    The cheapest child leads and the others are advanced to its candidates,
+    so expensive lists are only decoded around the lead's doc ids.
+    """
+
+    def __init__(self, cursors: List) -> None:
+        cursors = sorted(cursors, key=lambda cursor: cursor.cost)
+        self.lead = cursors[0]
+        self.others = cursors[1:]
+        self.doc_id = -1
+
+    @property
+    def cost(self) -> int:
+        return self.lead.cost
+
+    def next(self) -> int:
+        return self.__align(self.lead.next())
+
+    def advance(self, target: int) -> int:
+        if self.doc_id >= target:
+            return self.doc_id
+        return self.__align(self.lead.advance(target))
+
+    def __align(self, doc_id: int) -> int:
+        while doc_id != NO_MORE_DOCS:
+            for cursor in self.others:
+                candidate = cursor.advance(doc_id)
+                if candidate != doc_id:
+                    break
+            else:
+                break
+            if candidate == NO_MORE_DOCS:
+                doc_id = NO_MORE_DOCS
+                break
+            doc_id = self.lead.advance(candidate)
+        self.doc_id = doc_id
+        return doc_id
+
+
+class Disjunction:
+    """Doc ids present in any child cursor."""
+
+    def __init__(self, cursors: List) -> None:
+        self.cursors = cursors
+        self.doc_id = -1
+
+    @property
+    def cost(self) -> int:
+        return sum(cursor.cost for cursor in self.cursors)
+
+    def next(self) -> int:
+        return self.advance(self.doc_id + 1)
+
+    def advance(self, target: int) -> int:
+        if self.doc_id >= target:
+            return self.doc_id
+        doc_id = NO_MORE_DOCS
+        for cursor in self.cursors:
+            if cursor.doc_id < target:
+                cursor.advance(target)
+            doc_id = min(doc_id, cursor.doc_id)
+        self.doc_id = doc_id
+        return doc_id
+
+
+class Exclusion:
+    """Doc ids of `include` that are not in `exclude`."""
+
+    def __init__(self, include, exclude) -> None:
+        self.include = include
+        self.exclude = exclude
+        self.doc_id = -1
+
+    @property
+    def cost(self) -> int:
+        return self.include.cost
+
+    def next(self) -> int:
+        return self.__skip_excluded(self.include.next())
+
+    def advance(self, target: int) -> int:
+        if self.doc_id >= target:
+            return self.doc_id
+        return self.__skip_excluded(self.include.advance(target))
+
+    def __skip_excluded(self, doc_id: int) -> int:
+        while doc_id != NO_MORE_DOCS and self.exclude.advance(doc_id) == doc_id:
+            doc_id = self.include.next()
+        self.doc_id = doc_id
+        return doc_id
+
+
+class PhraseCursor:
+    """
+    Documents where the phrase terms occur at their query offsets.
+    Candidates come from a conjunction of the terms; positions are only
+    decoded for those candidates.
+    """
+
+    def __init__(self, cursors: List[PostingCursor], offsets: List[int]) -> None:
+        self.terms = list(zip(cursors, offsets))
+        self.conjunction = Conjunction(cursors)
+        self.doc_id = -1
+
+    @property
+    def cost(self) -> int:
+        return self.conjunction.cost
+
+    def next(self) -> int:
+        return self.__verify(self.conjunction.next())
+
+    def advance(self, target: int) -> int:
+        if self.doc_id >= target:
+            return self.doc_id
+        return self.__verify(self.conjunction.advance(target))
+
+    def __verify(self, doc_id: int) -> int:
+        while doc_id != NO_MORE_DOCS and not self.__matches():
+            doc_id = self.conjunction.next()
+        self.doc_id = doc_id
+        return doc_id
+
+    def __matches(self) -> bool:
+        """Check whether some start position lines up every term with its offset."""
+        starts = None
+        for cursor, offset in sorted(self.terms, key=lambda term: term[0].tf):
+            term_starts = {position - offset for position in cursor.positions()}
+            starts = term_starts if starts is None else starts & term_starts
+            if not starts:
+                return False
+        return True
+
+
+def compile_query(node: Node, index: CompactIndex, all_doc_ids: Callable[[], Sequence[int]]):
+    """Turn a parsed query into a cursor over the matching doc ids."""
+    if isinstance(node, Term):
+        postings = index.get(node.term)
+        return ListCursor(()) if postings is None else postings.cursor()
+    if isinstance(node, Phrase):
+        lists = [index.get(term) for term, _ in node.terms]
+        if any(postings is None for postings in lists):
+            return ListCursor(())
+        return PhraseCursor([postings.cursor() for postings in lists], [offset for _, offset in node.terms])
+    if isinstance(node, Or):
+        return Disjunction([compile_query(child, index, all_doc_ids) for child in node.children])
+    if isinstance(node, Not):
+        return Exclusion(ListCursor(all_doc_ids()), compile_query(node.child, index, all_doc_ids))
+
+    # AND: intersect the positive operands, then drop the negated ones
+    positives = [compile_query(child, index, all_doc_ids) for child in node.children
+                 if not isinstance(child, Not)]
+    negatives = [compile_query(child.child, index, all_doc_ids) for child in node.children
+                 if isinstance(child, Not)]
+    cursor = Conjunction(positives) if positives else ListCursor(all_doc_ids())
+    if negatives:
+        cursor = Exclusion(cursor, Disjunction(negatives))
+    return cursor
+
+
+def match_documents(node: Optional[Node], index: CompactIndex,
+                    all_doc_ids: Callable[[], Sequence[int]]) -> List[int]:
+    """
+    Return the sorted doc ids matching a parsed query.
+    all_doc_ids is only called when a NOT has nothing to subtract from.
+    """
+    if node is None:
+        return []
+    cursor = compile_query(node, index, all_doc_ids)
+    doc_ids = []
+    doc_id = cursor.next()
+    while doc_id != NO_MORE_DOCS:
+        doc_ids.append(doc_id)
+        doc_id = cursor.next()
+    return doc_ids
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import math
+from array import array
+from collections.abc import Mapping
+from typing import Optional, Sequence
+
+from postings import SKIP_INTERVAL
+
+# BM25 tuning parameters: k1 controls term frequency saturation,
+# b controls how strongly scores are normalized by document length.
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Document lengths are also stored densely, indexed directly by doc id, when
+# ids are small enough that the array stays within this factor of the corpus.
+DENSE_ID_FACTOR = 4
+DENSE_ID_SLACK = 1024
+
+
+def smoothed_idf(doc_count: int, doc_freq: int) -> float:
+    """IDF = log((N + 1) / (df + 1)), as used for TF-IDF."""
+    return math.log((doc_count + 1) / (doc_freq + 1))
+
+
+def bm25_idf(doc_count: int, doc_freq: int) -> float:
+    """BM25 IDF = log((N - df + 0.5) / (df + 0.5) + 1), which is always positive."""
+    return math.log((doc_count - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
+
+
+def bm25_saturation(tf: int, doc_length: int, avg_doc_length: float) -> float:
+    """
+    The tf and length dependent part of a BM25 term score, which is
+    multiplied by the term's BM25 IDF.
+    """
+    length_norm = 1 - BM25_B + BM25_B * doc_length / avg_doc_length
+    return (tf * (BM25_K1 + 1)) / (tf + BM25_K1 * length_norm)
+
+
+def dense_doc_lengths(doc_lengths: Mapping) -> array:
+    """
+    Return doc lengths as an array indexed by doc id, or an empty array when
+    the ids are too sparse (or negative) for a dense table.
+    """
+    if not doc_lengths:
+        return array("I")
+    max_id = max(doc_lengths)
+    if min(doc_lengths) < 0 or max_id >= DENSE_ID_FACTOR * len(doc_lengths) + DENSE_ID_SLACK:
+        return array("I")
+    lengths = array("I", bytes(4 * (max_id + 1)))
+    for doc_id, length in doc_lengths.items():
+        lengths[doc_id] = length
+    return lengths
+
+
+class CorpusStats:
+    """
+    Corpus statistics computed at build time and stored with the index.
+
+    Attributes:
+        doc_count: Number of documents (N).
+        total_doc_length: Sum of all document lengths.
+        doc_freqs: Document frequency per term id.
+        idfs: Smoothed TF-IDF IDF per term id.
+        bm25_idfs: BM25 IDF per term id.
+        term_max_scores: Largest bm25_saturation() of each term's postings.
+        block_max_scores: Largest bm25_saturation() of every posting block,
+            aligned with the index's skip entries.
+        doc_lengths_by_id: Document length lookup by doc id; a dense array
+            when ids allow it, otherwise the doc_lengths mapping itself.
+
+    Multiplied by a term's BM25 IDF, the max scores bound the score any of its
+    postings can contribute; top-k search uses them to skip documents.
+    """
+
+    def __init__(self, doc_count: int, total_doc_length: int, doc_freqs: Sequence[int],
+                 idfs: Sequence[float], bm25_idfs: Sequence[float], term_max_scores: Sequence[float],
+                 block_max_scores: Sequence[float], doc_lengths: Mapping,
+                 dense_lengths: Optional[Sequence[int]] = None) -> None:
+        self.doc_count = doc_count
+        self.total_doc_length = total_doc_length
+        self.doc_freqs = doc_freqs
+        self.idfs = idfs
+        self.bm25_idfs = bm25_idfs
+        self.term_max_scores = term_max_scores
+        self.block_max_scores = block_max_scores
+        self.dense_lengths = dense_lengths if dense_lengths is not None else array("I")
+        self.doc_lengths_by_id = self.dense_lengths if len(self.dense_lengths) else doc_lengths
+
+    @classmethod
+    def compute(cls, index, doc_lengths: Mapping, total_doc_length: int) -> "CorpusStats":
+        """
+        Compute the statistics of a CompactIndex and its document lengths.
+        Every posting is decoded once to find the per-term and per-block maxima.
+        """
+        doc_freqs = index.doc_freqs
+        doc_count = len(doc_lengths)
+        idfs = array("d", (smoothed_idf(doc_count, doc_freq) for doc_freq in doc_freqs))
+        bm25_idfs = array("d", (bm25_idf(doc_count, doc_freq) for doc_freq in doc_freqs))
+        dense_lengths = dense_doc_lengths(doc_lengths)
+        lengths = dense_lengths if len(dense_lengths) else doc_lengths
+        avg_doc_length = (total_doc_length / doc_count if doc_count else 0.0) or 1.0
+
+        term_max_scores = array("d", bytes(8 * len(doc_freqs)))
+        block_max_scores = array("d", bytes(8 * len(index.skip_doc_ids)))
+        for term_id in range(len(doc_freqs)):
+            postings = index.postings(term_id)
+            block = postings.skip_lo
+            for i, (doc_id, tf) in enumerate(postings.items()):
+                if i and i % SKIP_INTERVAL == 0:
+                    block += 1
+                score = bm25_saturation(tf, lengths[doc_id], avg_doc_length)
+                if score > block_max_scores[block]:
+                    block_max_scores[block] = score
+            term_max_scores[term_id] = max(block_max_scores[postings.skip_lo:postings.skip_hi], default=0.0)
+        return cls(doc_count, total_doc_length, doc_freqs, idfs, bm25_idfs, term_max_scores,
+                   block_max_scores, doc_lengths, dense_lengths)
+
+    @property
+    def avg_doc_length(self) -> float:
+        """Average number of indexed tokens per document."""
+        return self.total_doc_length / self.doc_count if self.doc_count else 0.0
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import json
+import zlib
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+# Records whose other fields are compressed together; one block is decoded per lookup
+DOCSTORE_BLOCK_SIZE = 16
+DOCSTORE_COMPRESSION_LEVEL = 6
+# Fields kept uncompressed in their own column, for rendering results
+DISPLAY_FIELD = "title"
+# Lists the implied fields (id and title) a record was stored without, so it reads back unchanged
+ABSENT_FIELDS = "\0absent"
+
+
+def split_record(record: Mapping[str, Any], doc_id: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Split a record into its display title and the remaining fields.
+    The id is implied by the doc id and the title by the title column, so
+    neither is repeated in the remaining fields unless it differs from them;
+    a record without one of them says so under ABSENT_FIELDS.
+    """
+    title = record.get(DISPLAY_FIELD, "")
+    if not isinstance(title, str):
+        title = ""
+    rest = {name: value for name, value in record.items()
+            if not (name == "id" and value == doc_id) and not (name == DISPLAY_FIELD and value == title)}
+    absent = [name for name in ("id", DISPLAY_FIELD) if name not in record]
+    if absent:
+        rest[ABSENT_FIELDS] = absent
+    return title, rest
+
+
+def docstore_chunks(docmap: Mapping, doc_ids: Iterable[int], title_offsets: array, title_blob: bytearray,
+                    block_offsets: array) -> Iterator[bytes]:
+    """
+    Yield the compressed blocks of the records' remaining fields, so records
+    never have to be held in memory all at once; fills the title column and
+    block_offsets as a side effect.
+    """
+    size = 0
+    block: List[Dict[str, Any]] = []
+    for doc_id in doc_ids:
+        title, rest = split_record(docmap[doc_id], doc_id)
+        title_blob += title.encode("utf-8")
+        title_offsets.append(len(title_blob))
+        block.append(rest)
+        if len(block) == DOCSTORE_BLOCK_SIZE:
+            payload = _compress_block(block)
+            size += len(payload)
+            block_offsets.append(size)
+            block = []
+            yield payload
+    if block:
+        payload = _compress_block(block)
+        size += len(payload)
+        block_offsets.append(size)
+        yield payload
+
+
+def _compress_block(block: List[Dict[str, Any]]) -> bytes:
+    payload = json.dumps(block, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(payload, DOCSTORE_COMPRESSION_LEVEL)
+
+
+def document_field(docmap: Mapping, doc_id: int, name: str, default: Any = None) -> Any:
+    """
+    Return one field of a document, or default if the document or field is
+    missing. Docmaps with a field() method (DocumentStore and the mappings
+    wrapping it) only decode what the field needs; plain dicts are indexed.
+    """
+    field = getattr(docmap, "field", None)
+    if field is not None:
+        return field(doc_id, name, default)
+    record = docmap.get(doc_id)
+    return default if record is None else record.get(name, default)
+
+
+class DocumentStore(Mapping):
+    """
+    Read-only doc id -> record mapping over the columnar document sections
+    of a segment.
+
+    Ids are the sorted doc_ids column and titles a utf-8 column with an
+    offsets table, so rendering results touches a few bytes per document.
+    All other fields, such as descriptions, are JSON in zlib-compressed
+    blocks of DOCSTORE_BLOCK_SIZE records, decompressed only when a caller
+    asks for them. The last decoded block is kept, so reading records in id
+    order decompresses each block once.
+    """
+
+    def __init__(self, doc_ids, title_offsets, title_blob, block_offsets, blocks) -> None:
+        self.doc_ids = doc_ids
+        self.title_offsets = title_offsets
+        self.title_blob = title_blob
+        self.block_offsets = block_offsets
+        self.blocks = blocks
+        self.__last_block: Tuple[int, List[Dict[str, Any]]] = (-1, [])
+
+    def __getitem__(self, doc_id: int) -> Dict[str, Any]:
+        i = self.__position(doc_id)
+        rest = self.__rest(i)
+        record = {"id": doc_id, DISPLAY_FIELD: self.__title(i)}
+        record.update(rest)
+        for name in record.pop(ABSENT_FIELDS, ()):
+            del record[name]
+        return record
+
+    def field(self, doc_id: int, name: str, default: Any = None) -> Any:
+        """Return one field of a document, decompressing its block only for non-display fields."""
+        i = bisect_left(self.doc_ids, doc_id)
+        if i == len(self.doc_ids) or self.doc_ids[i] != doc_id:
+            return default
+        if name == DISPLAY_FIELD and self.title_offsets[i + 1] > self.title_offsets[i]:
+            return self.__title(i)
+        rest = self.__rest(i)
+        if name in rest.get(ABSENT_FIELDS, ()):
+            return default
+        if name in rest and name != ABSENT_FIELDS:
+            return rest[name]
+        if name == "id":
+            return doc_id
+        if name == DISPLAY_FIELD:
+            return ""
+        return default
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.doc_ids)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def __contains__(self, doc_id: object) -> bool:
+        i = bisect_left(self.doc_ids, doc_id)
+        return i < len(self.doc_ids) and self.doc_ids[i] == doc_id
+
+    def __position(self, doc_id: int) -> int:
+        i = bisect_left(self.doc_ids, doc_id)
+        if i == len(self.doc_ids) or self.doc_ids[i] != doc_id:
+            raise KeyError(doc_id)
+        return i
+
+    def __title(self, i: int) -> str:
+        return self.title_blob[self.title_offsets[i]:self.title_offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __rest(self, i: int) -> Dict[str, Any]:
+        number, offset = divmod(i, DOCSTORE_BLOCK_SIZE)
+        last_number, block = self.__last_block
+        if number != last_number:
+            start, end = self.block_offsets[number], self.block_offsets[number + 1]
+            block = json.loads(zlib.decompress(self.blocks[start:end]))
+            self.__last_block = (number, block)
+        return block[offset]
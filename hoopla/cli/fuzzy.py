@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Optional, Set, Tuple
+
+MAX_DISTANCE = 2
+# Only the first PREFIX_LENGTH characters of terms and queries are expanded
+# into deletions; matches are verified against the full term afterwards.
+PREFIX_LENGTH = 7
+
+
+def auto_distance(term: str) -> int:
+    """Edit distance allowed for a term: 0 up to 2 chars, 1 up to 5, then 2."""
+    if len(term) <= 2:
+        return 0
+    if len(term) <= 5:
+        return 1
+    return MAX_DISTANCE
+
+
+def deletes(term: str, distance: int) -> Set[str]:
+    """Return term and every string obtained by deleting up to `distance` characters."""
+    variants = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def delete_hash(variant: str) -> int:
+    """Stable 32-bit hash of a deletion variant."""
+    return zlib.crc32(variant.encode("utf-8"))
+
+
+def osa_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Return the optimal string alignment distance between a and b, the
+    Levenshtein distance with swaps of two adjacent characters counted as a
+    single edit, or max_distance + 1 if it is larger. Only the diagonal band
+    of the table that can stay within max_distance is computed.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    beyond = max_distance + 1
+    before: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        lo, hi = max(1, i - max_distance), min(len(b), i + max_distance)
+        row = [beyond] * (len(b) + 1)
+        row[0] = i if i <= max_distance else beyond
+        for j in range(lo, hi + 1):
+            distance = min(row[j - 1] + 1, previous[j] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                distance = min(distance, before[j - 2] + 1)
+            row[j] = min(distance, beyond)
+        # Row i - 1 already bounds what a swap from row i - 2 can reach
+        if min(row[lo - 1:hi + 1]) > max_distance:
+            return beyond
+        before, previous = previous, row
+    return min(previous[len(b)], beyond)
+
+
+class DeletionIndex:
+    """
+    SymSpell-style deletion dictionary over the term lexicon.
+
+    Two strings within d edits always share a variant reachable by at most d
+    deletions from each, and so do their prefixes; a swap of two adjacent
+    characters is undone by deleting one of them on each side. A lookup therefore only
+    hashes the deletions of the query prefix and verifies the terms stored
+    under those hashes; the lexicon is never scanned. Entries are computed
+    for up to MAX_DISTANCE deletions of each term's PREFIX_LENGTH prefix.
+
+    Attributes:
+        hashes: Sorted delete_hash() of every (variant, term) entry.
+        term_ids: Lexicon term id of each entry of hashes.
+    """
+
+    def __init__(self) -> None:
+        self.hashes = array("I")
+        self.term_ids = array("I")
+
+    @classmethod
+    def from_terms(cls, terms: Iterable[str]) -> "DeletionIndex":
+        """Build from the term lexicon; a term's position is its term id."""
+        # Each entry is packed as hash << 32 | term_id so the sort is on plain ints
+        entries = array("Q")
+        for term_id, term in enumerate(terms):
+            entries.extend({delete_hash(variant) << 32 | term_id
+                            for variant in deletes(term[:PREFIX_LENGTH], MAX_DISTANCE)})
+        entries = array("Q", sorted(entries))
+        index = cls()
+        index.hashes = array("I", (entry >> 32 for entry in entries))
+        index.term_ids = array("I", (entry & 0xFFFFFFFF for entry in entries))
+        return index
+
+    def candidates(self, term: str, max_distance: int) -> Set[int]:
+        """Return the ids of terms sharing a deletion variant with term."""
+        term_ids: Set[int] = set()
+        for variant in deletes(term[:PREFIX_LENGTH], max_distance):
+            hash_value = delete_hash(variant)
+            lo = bisect_left(self.hashes, hash_value)
+            hi = bisect_right(self.hashes, hash_value, lo)
+            term_ids.update(self.term_ids[lo:hi])
+        return term_ids
+
+    def search(self, term: str, terms, max_distance: int) -> List[Tuple[int, int]]:
+        """
+        Return (term_id, distance) for every term of the lexicon `terms`
+        within max_distance edits of term (see osa_distance), closest first.
+        """
+        max_distance = min(max_distance, MAX_DISTANCE)
+        matches = []
+        for term_id in self.candidates(term, max_distance):
+            distance = osa_distance(term, terms[term_id], max_distance)
+            if distance <= max_distance:
+                matches.append((term_id, distance))
+        return sorted(matches, key=lambda match: (match[1], match[0]))
+
+    def closest(self, term: str, terms, max_distance: Optional[int] = None) -> List[int]:
+        """
+        Return the ids of the terms at the smallest distance from term that is
+        within max_distance (auto_distance(term) by default).
+        """
+        if max_distance is None:
+            max_distance = auto_distance(term)
+        matches = self.search(term, terms, max_distance)
+        if not matches:
+            return []
+        best = matches[0][1]
+        return [term_id for term_id, distance in matches if distance == best]
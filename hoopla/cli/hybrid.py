@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import heapq
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+import profiling
+
+FUSION_METHODS = ("rrf", "weighted")
+DEFAULT_FUSION = "rrf"
+# Damps the weight of the top ranks in reciprocal-rank fusion; 60 is the usual choice
+RRF_K = 60
+# Candidates fetched from each leg per requested result, and the cap on that
+DEFAULT_DEPTH_FACTOR = 4
+MAX_CANDIDATE_DEPTH = 1000
+# Seconds each leg may take before the fused result is returned without it
+DEFAULT_LEG_TIMEOUT = 2.0
+
+# (doc_id, score) pairs of one retriever, best first
+Ranking = List[Tuple[int, float]]
+# Returns the top `depth` results of one retriever for a query
+Retriever = Callable[[str, int], Ranking]
+
+
+def candidate_depth(limit: int, depth: Optional[int] = None) -> int:
+    """Candidates to fetch from each leg: `depth` if given, else a multiple of limit, both capped."""
+    if depth is None:
+        depth = limit * DEFAULT_DEPTH_FACTOR
+    return max(min(depth, MAX_CANDIDATE_DEPTH), limit)
+
+
+def reciprocal_rank_fusion(rankings: Mapping[str, Ranking], limit: int, weights: Optional[Mapping[str, float]] = None,
+                           k: int = RRF_K) -> Ranking:
+    """
+    Fuse rankings by summing weight / (k + rank) over the legs that found a
+    document. Only ranks count, so legs with incomparable scores (BM25 and
+    cosine) mix without calibration. Ties go to the lower doc id.
+    """
+    fused: Dict[int, float] = {}
+    for leg, ranking in rankings.items():
+        weight = 1.0 if weights is None else weights.get(leg, 1.0)
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+    return heapq.nlargest(limit, fused.items(), key=lambda item: (item[1], -item[0]))
+
+
+def weighted_score_fusion(rankings: Mapping[str, Ranking], limit: int,
+                          weights: Optional[Mapping[str, float]] = None) -> Ranking:
+    """
+    Fuse rankings by summing weight * score, with each leg's scores min-max
+    normalized to [0, 1] over its candidates. A document a leg did not
+    return gets 0 from it. Ties go to the lower doc id.
+    """
+    fused: Dict[int, float] = {}
+    for leg, ranking in rankings.items():
+        if not ranking:
+            continue
+        weight = 1.0 if weights is None else weights.get(leg, 1.0)
+        scores = [score for _, score in ranking]
+        low, high = min(scores), max(scores)
+        spread = high - low
+        for doc_id, score in ranking:
+            # A leg whose candidates all score the same ranks them all first
+            normalized = (score - low) / spread if spread > 0 else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+    return heapq.nlargest(limit, fused.items(), key=lambda item: (item[1], -item[0]))
+
+
+def fuse(rankings: Mapping[str, Ranking], limit: int, method: str = DEFAULT_FUSION,
+         weights: Optional[Mapping[str, float]] = None) -> Ranking:
+    """Fuse rankings with the named method; raises ValueError for unknown methods."""
+    if method == "rrf":
+        return reciprocal_rank_fusion(rankings, limit, weights)
+    if method == "weighted":
+        return weighted_score_fusion(rankings, limit, weights)
+    raise ValueError(f"Unknown fusion method {method}; choose one of {', '.join(FUSION_METHODS)}.")
+
+
+class HybridSearcher:
+    """
+    Runs several retrievers ("legs", such as BM25 and vector search) for the
+    same query concurrently and fuses their rankings into one top k.
+
+    Each leg runs in its own thread, so the query costs about as long as the
+    slowest leg rather than their sum; numpy matrix products and file reads
+    release the GIL. A leg that fails, or misses its timeout, is left out of
+    the fusion and reported, so one slow retriever degrades recall instead
+    of latency. Leg threads are daemons started per query: a leg stuck past
+    its timeout delays neither later queries nor interpreter exit. Every leg
+    fetches at most `depth` candidates, which bounds the cost of fusion.
+    """
+
+    def __init__(self, legs: Mapping[str, Retriever], timeout: float = DEFAULT_LEG_TIMEOUT,
+                 timeouts: Optional[Mapping[str, float]] = None) -> None:
+        """legs maps leg names to retrievers; timeouts overrides the timeout of single legs."""
+        if not legs:
+            raise ValueError("A hybrid search needs at least one retriever.")
+        self.legs = dict(legs)
+        self.timeouts = {leg: (timeouts or {}).get(leg, timeout) for leg in self.legs}
+        self.__closed = False
+
+    def search(self, query: str, limit: int = 5, depth: Optional[int] = None, method: str = DEFAULT_FUSION,
+               weights: Optional[Mapping[str, float]] = None) -> Tuple[Ranking, Dict[str, Ranking], Dict[str, str]]:
+        """
+        Return the fused top `limit` (doc_id, score) pairs, the ranking of
+        every leg that answered, and the legs that did not with the reason.
+        Raises ValueError once the searcher is closed.
+        """
+        if self.__closed:
+            raise ValueError("The hybrid searcher is closed.")
+        if method not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method {method}; choose one of {', '.join(FUSION_METHODS)}.")
+        if not query or limit <= 0:
+            return [], {}, {}
+        depth = candidate_depth(limit, depth)
+        started = time.monotonic()
+        futures: Dict[str, Future] = {}
+        for leg, retriever in self.legs.items():
+            futures[leg] = Future()
+            threading.Thread(target=self.__run_leg, args=(futures[leg], leg, retriever, query, depth),
+                             name=f"hybrid-{leg}", daemon=True).start()
+
+        rankings: Dict[str, Ranking] = {}
+        failures: Dict[str, str] = {}
+        for leg, future in futures.items():
+            # Legs run concurrently, so every timeout counts from the submission
+            remaining = started + self.timeouts[leg] - time.monotonic()
+            try:
+                rankings[leg] = future.result(timeout=max(remaining, 0.0))
+            except TimeoutError:
+                failures[leg] = f"timed out after {self.timeouts[leg]:g}s"
+            except (ValueError, OSError) as e:
+                failures[leg] = str(e)
+
+        with profiling.stage("fuse"):
+            fused = fuse(rankings, limit, method, weights)
+        return fused, rankings, failures
+
+    @staticmethod
+    def __run_leg(future: Future, leg: str, retriever: Retriever, query: str, depth: int) -> None:
+        """Run one leg in its thread and hand its ranking, or its error, to the future."""
+        future.set_running_or_notify_cancel()
+        try:
+            with profiling.stage(leg):
+                ranking = retriever(query, depth)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(ranking)
+
+    def close(self) -> None:
+        """Refuse further searches; legs still running after their timeout are not waited for."""
+        self.__closed = True
+
+    def __enter__(self) -> "HybridSearcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
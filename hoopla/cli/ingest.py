@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, TypeVar
+
+T = TypeVar("T")
+
+# Characters read from the data file at a time while streaming
+CHUNK_SIZE = 1 << 16
+
+# Rough in-memory cost of buffered documents, used to decide when to flush
+# a partial segment: per record dict, per token of record text (including
+# its position entry) and per posting (set entry + positions list).
+BYTES_PER_RECORD = 400
+BYTES_PER_TOKEN = 48
+BYTES_PER_POSTING = 120
+
+JSON_LINES_SUFFIXES = (".jsonl", ".ndjson")
+
+# Number characters running up to the end of the buffer, which the next chunk may continue
+NUMBER_TAIL = re.compile(r"[0-9.eE+-]*\Z")
+
+
+class JsonStream:
+    """
+    Incremental reader for a JSON document.
+    Values are decoded one at a time with raw_decode, refilling the buffer in
+    chunks, so only the value being decoded has to be held in memory. A value
+    that does not fit is retried once at least as much again has been read,
+    so a value of n characters is decoded in O(n) time overall.
+    """
+
+    def __init__(self, fh: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def __fill(self, min_size: int = 0) -> bool:
+        """
+        Append chunks to the buffer until at least min_size characters follow
+        the current position (at least one chunk); returns False at end of file.
+        """
+        if self.eof:
+            return False
+        chunks = [self.buffer[self.pos:]]
+        size = len(chunks[0])
+        while True:
+            chunk = self.fh.read(self.chunk_size)
+            if not chunk:
+                self.eof = True
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= min_size:
+                break
+        if len(chunks) == 1:
+            return False
+        self.buffer = "".join(chunks)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at end of file)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.__fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char: str) -> None:
+        """Consume the next non-whitespace character, which must be `char`."""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Invalid JSON: expected '{char}' but found '{found or 'end of file'}'.")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Decoding restarts at the beginning of the value, so double what is buffered first
+                if not self.__fill(2 * (len(self.buffer) - self.pos)):
+                    raise
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if isinstance(value, (int, float)) and NUMBER_TAIL.match(self.buffer, end) and self.__fill():
+                continue
+            self.pos = end
+            return value
+
+    def array_items(self) -> Iterator[Any]:
+        """Yield the items of the JSON array starting at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def iter_records(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Stream movie records from a data file without loading it all at once.
+    Supports {"movies": [...]} documents, top-level arrays and JSON Lines
+    (.jsonl / .ndjson) files.
+    """
+    with path.open("r", encoding="utf-8") as fh:
+        if path.suffix in JSON_LINES_SUFFIXES:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+            return
+
+        stream = JsonStream(fh)
+        if stream.peek() == "[":
+            yield from stream.array_items()
+            return
+
+        # Walk the top-level object and stream the "movies" array
+        stream.expect("{")
+        while stream.peek() != "}":
+            key = stream.value()
+            stream.expect(":")
+            if key == "movies" and stream.peek() == "[":
+                yield from stream.array_items()
+            else:
+                stream.value()
+            if stream.peek() == ",":
+                stream.expect(",")
+
+
+def estimate_document_bytes(tokens: int, unique_terms: int) -> int:
+    """Estimate the memory a buffered document takes until it is flushed."""
+    return BYTES_PER_RECORD + tokens * BYTES_PER_TOKEN + unique_terms * BYTES_PER_POSTING
+
+
+def iter_batches(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Yield lists of up to `size` consecutive items."""
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
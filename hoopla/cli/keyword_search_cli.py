@@ -2,12 +2,39 @@
 
 import argparse
 import json
-import string
-import pickle
+import os
+import sys
+import time
+from collections import ChainMap
+from collections.abc import MutableMapping
 from pathlib import Path
-from typing import Any, Dict, List, Counter
-from nltk.stem import PorterStemmer
-
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from corpus_stats import BM25_B, BM25_K1, CorpusStats
+from docstore import document_field
+from fuzzy import DeletionIndex, auto_distance
+from hybrid import DEFAULT_FUSION, DEFAULT_LEG_TIMEOUT, FUSION_METHODS, HybridSearcher
+from ingest import estimate_document_bytes, iter_batches, iter_records
+from minhash import DEFAULT_DUPLICATE_THRESHOLD, DEFAULT_SIMILAR_LIMIT, MinHashIndex
+from parallel_build import PartialIndex, TermPositions, build_partial_indexes, document_text, term_positions_of
+import profiling
+from postings import CompactIndex, merge_indexes
+from query_server import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_THREADS, QueryClient, QueryServer, QueryService
+from result_cache import DEFAULT_RESULT_CACHE_SIZE, DEFAULT_RESULT_CACHE_TTL, RESULT_CACHE_FILENAME, ResultCache
+from segment import OverlayMapping, Segment, record_hash, write_segment
+from snippets import DEFAULT_SNIPPET_TOKENS, HIGHLIGHT_MARKERS, make_snippet
+from substring_index import SubstringIndex, merge_substring_indexes
+from suggest import DEFAULT_SUGGESTIONS, CompletionTrie, build_suggesters, normalize_prefix
+from text_analysis import TextAnalyzer, get_analyzer
+from top_k import TermScorer, top_k_scores
+
+SEGMENT_FILENAME = "index.seg"
+VECTOR_FILENAME = "vectors.seg"
+
+# Buffered documents are flushed to a partial segment beyond this many bytes
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+# Records handed to each worker per batch in a parallel build
+PARALLEL_BATCH_SIZE = 2000
 
 
 class InvertedIndex:
@@ -15,99 +42,315 @@ class InvertedIndex:
     Minimal inverted index container.
 
     Attributes:
-        index: Mapping from term -> set of document ids containing the term.
+        index: Compact term -> postings index; each posting holds a document id,
+            the term frequency and the token positions in that document.
         docmap: Mapping from document id -> original document payload.
-        term_frequency: Mapping from term -> frequency count across all documents.
+        doc_lengths: Mapping from document id -> number of indexed tokens.
+        doc_hashes: Mapping from document id -> content hash of its record.
+        token_starts: Mapping from document id -> character offset of every
+            token of its indexed text, by token position; used for snippets.
+        titles: Substring index over the stemmed title terms, for partial matches.
+        stats: Corpus statistics (N, average length, df and IDF per term id).
+        fuzzy_index: Deletion dictionary over the term lexicon for typo-tolerant lookups.
+        suggesters: Title and title word completion tries for autocomplete.
+        minhash: MinHash signatures and LSH index of the documents' term sets, for
+            similar documents and near-duplicates.
+        analyzer: Shared text analysis pipeline used for indexing and queries.
+        generation: Identifies this version of the index; it changes whenever
+            documents change and is stored in the segment on save.
+        cache_dir: Directory the segment is loaded from and saved to.
     """
 
-    def __init__(self) -> None:
-        self.index: Dict[str, set[int]] = {}
-        self.docmap: Dict[int, Dict[str, Any]] = {}
-        self.term_frequency: Dict[int, Counter[str]] = {}
+    def __init__(self, analyzer: Optional[TextAnalyzer] = None, cache_dir: Optional[Path] = None) -> None:
+        self.analyzer = analyzer or get_analyzer()
+        self.cache_dir = cache_dir or self.cache_path()
+        self.__index: CompactIndex = CompactIndex()
+        self.__titles: SubstringIndex = SubstringIndex()
+        self.docmap: MutableMapping[int, Dict[str, Any]] = {}
+        self.doc_lengths: MutableMapping[int, int] = {}
+        self.doc_hashes: MutableMapping[int, int] = {}
+        self.token_starts: MutableMapping[int, Sequence[int]] = {}
+        self.__total_doc_length = 0
+        # Statistics and fuzzy index of the current index, rebuilt on first use after a change
+        self.__stats: Optional[CorpusStats] = None
+        self.__fuzzy: Optional[DeletionIndex] = None
+        self.__suggesters: Optional[Tuple[CompletionTrie, CompletionTrie]] = None
+        self.__minhash: Optional[MinHashIndex] = None
+        # Pending changes, merged into the compact index the next time it is read:
+        # postings of added documents and ids whose existing postings are stale
+        self.__index_buffer: Dict[str, set[int]] = {}
+        self.__positions_buffer: Dict[int, TermPositions] = {}
+        self.__title_buffer: Dict[int, List[str]] = {}
+        self.__removed: set[int] = set()
+        self.__buffered_bytes = 0
+        # True while the cached segment matches this index
+        self.__on_disk = False
+        # The mapped segment the index was loaded from, if any
+        self.__segment: Optional[Segment] = None
+        self.generation = 0
+
+    @property
+    def index(self) -> CompactIndex:
+        """Compact term -> postings index, including any pending changes."""
+        if self.__index_buffer or self.__title_buffer or self.__removed:
+            self.__apply_pending()
+        return self.__index
+
+    @index.setter
+    def index(self, value: CompactIndex) -> None:
+        self.__index = value
+        self.__stats = None
+        self.__fuzzy = None
+        self.__suggesters = None
+        self.__minhash = None
+
+    @property
+    def titles(self) -> SubstringIndex:
+        """Title substring index, including any pending changes."""
+        if self.__index_buffer or self.__title_buffer or self.__removed:
+            self.__apply_pending()
+        return self.__titles
+
+    @property
+    def stats(self) -> CorpusStats:
+        """
+        Corpus statistics of the index, including any pending changes.
+        A loaded segment provides them precomputed; after documents change
+        they are recomputed once, on the next lookup.
+        """
+        index = self.index
+        if self.__stats is None:
+            with profiling.stage("stats"):
+                self.__stats = CorpusStats.compute(index, self.doc_lengths, self.__total_doc_length)
+        return self.__stats
+
+    @property
+    def fuzzy_index(self) -> DeletionIndex:
+        """
+        Deletion dictionary over the current term lexicon. A loaded segment
+        provides it precomputed; after the vocabulary changes it is rebuilt
+        on next use.
+        """
+        index = self.index
+        if self.__fuzzy is None:
+            with profiling.stage("fuzzy_index"):
+                self.__fuzzy = DeletionIndex.from_terms(index.terms)
+        return self.__fuzzy
+
+    @property
+    def suggesters(self) -> Tuple[CompletionTrie, CompletionTrie]:
+        """
+        Title and title word completion tries. A loaded segment provides them
+        precomputed; after documents change they are rebuilt on next use.
+        """
+        self.index  # applies pending changes, which resets the tries
+        if self.__suggesters is None:
+            with profiling.stage("suggest_index"):
+                self.__suggesters = build_suggesters(
+                    document_field(self.docmap, doc_id, "title", "") for doc_id in sorted(self.docmap))
+        return self.__suggesters
+
+    @property
+    def minhash(self) -> MinHashIndex:
+        """
+        MinHash signatures and LSH index of every document. A loaded segment
+        provides them precomputed; after documents change they are rebuilt
+        on next use.
+        """
+        index = self.index
+        if self.__minhash is None:
+            with profiling.stage("minhash_index"):
+                self.__minhash = MinHashIndex.from_index(index, sorted(self.docmap))
+        return self.__minhash
+
+    @property
+    def avg_doc_length(self) -> float:
+        """Average document length used by BM25."""
+        return self.__total_doc_length / len(self.doc_lengths) if self.doc_lengths else 0.0
 
     def load(self):
         """
-        Load the index from the pattern cache/index.pkl
-        Load the docmap from the pattern cache/docmap.pkl
-        Load term_frequency from cache/term_frequency.pkl
+        Open the index segment from the pattern cache/index.seg.
+        The segment is memory-mapped, so postings, docmap records and document
+        lengths are only read from disk when a lookup needs them.
+        """
+        segment_path = self.cache_dir / SEGMENT_FILENAME
+
+        # Raise error if the segment does not exist
+        if not segment_path.exists():
+            raise FileNotFoundError(f"Index segment {segment_path} not found; run the build command first.")
+
+        with profiling.stage("load"):
+            segment = Segment(segment_path)
+        if segment.partial:
+            segment.close()
+            raise ValueError(f"{segment_path} is a partial segment of an unfinished build; run the build command again.")
+        self.close()
+        self.__segment = segment
+        self.index = segment.index
+        self.docmap = segment.docmap
+        self.doc_lengths = segment.doc_lengths
+        self.doc_hashes = segment.doc_hashes
+        self.token_starts = segment.token_starts
+        self.__titles = segment.titles
+        self.__total_doc_length = segment.total_doc_length
+        self.__stats = segment.stats
+        self.__fuzzy = segment.fuzzy
+        self.__suggesters = segment.suggesters
+        self.__minhash = segment.minhash
+        self.__index_buffer = {}
+        self.__positions_buffer = {}
+        self.__title_buffer = {}
+        self.__removed = set()
+        self.__buffered_bytes = 0
+        self.__on_disk = True
+        self.generation = segment.generation
+
+    def close(self) -> None:
         """
+        Unmap the segment the index was loaded from. Documents and postings
+        read from it can no longer be used, so only call this when done.
+        """
+        if self.__segment is not None:
+            self.__segment.close()
+            self.__segment = None
+
+    def __touch(self) -> None:
+        """Mark the index as changed since it was saved, with a new generation."""
+        self.__on_disk = False
+        # Time-based, so a rebuilt index never reuses the generation of an older one
+        self.generation = max(time.time_ns(), self.generation + 1)
+
+    @staticmethod
+    def cache_path() -> Path:
+        """Return the cache directory: $HOOPLA_CACHE_DIR if set, else hoopla/cache."""
+        if os.environ.get("HOOPLA_CACHE_DIR"):
+            return Path(os.environ["HOOPLA_CACHE_DIR"])
         base = Path(__file__).resolve().parents[1]  # .../hoop
-        cache_path = base / "cache"
-        index_path = cache_path / "index.pkl"
-        docmap_path = cache_path / "docmap.pkl"
-        termfreq_path = cache_path / "term_frequency.pkl"
-
-        # Raise error if files do not exist
-        if not index_path.exists() or not docmap_path.exists() or not termfreq_path.exists():
-            raise FileNotFoundError("Index or docmap or termfreq file not found in cache directory.")
-
-        with index_path.open("rb") as fh:
-            self.index = pickle.load(fh)
-        with docmap_path.open("rb") as fh:
-            self.docmap = pickle.load(fh)
-        with termfreq_path.open("rb") as fh:
-            self.term_frequency = pickle.load(fh)
-
+        return base / "cache"
 
     def save(self) -> None:
         """
-        Save the index using the pattern cache/index.pkl
-        Save the docmap using the pattern cache/docmap.pkl
-        Save term_frequency using the pattern cache/term_frequency.pkl
-
+        Save the index, docmap and document lengths as one segment file
+        using the pattern cache/index.seg
         """
+        if self.__on_disk:
+            # The cached segment is already up to date
+            return
         # check if cache directory exists
-        base = Path(__file__).resolve().parents[1]  # .../hoop
-        cache_path = base / "cache"
+        cache_path = self.cache_dir
         if not cache_path.exists():
             cache_path.mkdir(parents=True, exist_ok=True)
-        index_path = cache_path / "index.pkl"
-        docmap_path = cache_path / "docmap.pkl"
-        termfreq_path = cache_path / "term_frequency.pkl"
-        with index_path.open("wb") as fh:
-            pickle.dump(self.index, fh)
-        with docmap_path.open("wb") as fh:
-            pickle.dump(self.docmap, fh)
-        with termfreq_path.open("wb") as fh:
-            pickle.dump(self.term_frequency, fh)
+        index, titles = self.index, self.titles
+        with profiling.stage("save"):
+            write_segment(cache_path / SEGMENT_FILENAME, index, titles, self.docmap,
+                          self.doc_lengths, self.doc_hashes, self.token_starts, self.generation,
+                          replacing=self.__segment)
+        if self.__segment is not None:
+            # Replacing the file closed the segment this index still reads from
+            self.__segment = None
+            self.load()
+        self.__on_disk = True
 
     def __add_document(self, doc_id: int, text: str) -> None:
         """
         Add a document to the inverted index.
-        First tokenize, clean, stem, then add each token to the index.
+        First tokenize, clean, stem, then add each token and its positions to the index.
+        The character offsets of the tokens are kept for snippets.
         """
-        # Initialize stemmer
-        stemmer = PorterStemmer()
-
-        text_lower = text.lower()
-        tokens = text_lower.split()
-
-        # Remove punctuation from tokens
-        table = str.maketrans('', '', string.punctuation)
-        tokens = [token.translate(table) for token in tokens]
-        tokens = [token.replace('`', "'") for token in tokens]
-        tokens = [token for token in tokens if token]  # Remove empty tokens
-
-        # Remove stopwords
-        base = Path(__file__).resolve().parents[1]
-        stopwords_path = base / "data" / "stopwords.txt"
-        with stopwords_path.open("r", encoding="utf-8") as fh:
-            stopwords = set(line.strip() for line in fh)
-
-        # Filter stopwords and stem the tokens
-        filtered_tokens = [token for token in tokens if token not in stopwords]
-        stemmed_tokens = [stemmer.stem(token) for token in filtered_tokens]
-
-        # Create Counter with stemmed tokens
-        token_counts = Counter(stemmed_tokens)
-        self.term_frequency[doc_id] = token_counts
-
-        # Add stemmed tokens to inverted index
-        for token in stemmed_tokens:
-            if token not in self.index:
-                self.index[token] = set()
-            self.index[token].add(doc_id)
+        analyzed, self.token_starts[doc_id] = self.analyzer.analyze_offsets(text)
+
+        # Group token positions by stemmed token
+        positions = term_positions_of(analyzed)
+        self.__positions_buffer[doc_id] = positions
+        self.doc_lengths[doc_id] = len(analyzed)
+        self.__total_doc_length += len(analyzed)
+        self.__buffered_bytes += estimate_document_bytes(len(analyzed), len(positions))
+        self.__touch()
+        self.__stats = None
+
+        # Add stemmed tokens to the build buffer
+        for token in positions:
+            if token not in self.__index_buffer:
+                self.__index_buffer[token] = set()
+            self.__index_buffer[token].add(doc_id)
+
+    def __add_title(self, doc_id: int, record: Dict[str, Any]) -> None:
+        """Buffer the stemmed title terms of a record for the title substring index."""
+        self.__title_buffer[doc_id] = self.analyzer.analyze(record.get("title", ""))
+
+    def __apply_pending(self) -> None:
+        """Merge buffered documents and removals into a new compact index and title index."""
+        with profiling.stage("merge"):
+            self.__index = self.__index.merged(self.__removed, self.__index_buffer, self.__positions_buffer)
+            self.__titles = self.__titles.merged(self.__removed, self.__title_buffer)
+        self.__index_buffer = {}
+        self.__positions_buffer = {}
+        self.__title_buffer = {}
+        self.__removed = set()
+        self.__stats = None
+        self.__fuzzy = None
+        self.__suggesters = None
+        self.__minhash = None
+
+    def __make_writable(self) -> None:
+        """Wrap read-only segment tables so documents can be changed in memory."""
+        if not isinstance(self.docmap, MutableMapping):
+            self.docmap = OverlayMapping(self.docmap)
+        if not isinstance(self.doc_lengths, MutableMapping):
+            self.doc_lengths = OverlayMapping(self.doc_lengths)
+        if not isinstance(self.doc_hashes, MutableMapping):
+            self.doc_hashes = OverlayMapping(self.doc_hashes)
+        if not isinstance(self.token_starts, MutableMapping):
+            self.token_starts = OverlayMapping(self.token_starts)
+
+    def add_document(self, record: Dict[str, Any]) -> None:
+        """
+        Add a new movie record to the index.
+        Raises ValueError if a document with the same id already exists.
+        """
+        doc_id = int(record.get("id", 0))
+        if doc_id in self.docmap:
+            raise ValueError(f"Document ID {doc_id} already exists in docmap.")
+        self.__make_writable()
+        self.docmap[doc_id] = record
+        self.doc_hashes[doc_id] = record_hash(record)
+        self.__add_title(doc_id, record)
+        self.__add_document(doc_id, document_text(record))
+
+    def update_document(self, record: Dict[str, Any]) -> None:
+        """
+        Replace an existing movie record and re-index its text.
+        Raises ValueError if no document with that id exists.
+        """
+        doc_id = int(record.get("id", 0))
+        self.delete_document(doc_id)
+        self.add_document(record)
 
+    def delete_document(self, doc_id: int) -> None:
+        """
+        Remove a document from the index, docmap and document statistics.
+        Raises ValueError if the document does not exist.
+        """
+        if doc_id not in self.docmap:
+            raise ValueError(f"Document ID {doc_id} not found in docmap.")
+        self.__make_writable()
+        del self.docmap[doc_id]
+        del self.doc_hashes[doc_id]
+        self.token_starts.pop(doc_id, None)
+        self.__touch()
+        self.__stats = None
+        self.__total_doc_length -= self.doc_lengths.pop(doc_id)
+
+        # Drop buffered postings, and mask postings already in the compact index
+        positions = self.__positions_buffer.pop(doc_id, None)
+        if positions is not None:
+            for token in positions:
+                self.__index_buffer[token].discard(doc_id)
+                if not self.__index_buffer[token]:
+                    del self.__index_buffer[token]
+        self.__title_buffer.pop(doc_id, None)
+        self.__removed.add(doc_id)
 
     def get_documents(self, term: str) -> List[int]:
         """
@@ -118,68 +361,374 @@ class InvertedIndex:
         if not term:
             return []
 
-        # Initialize stemmer
-        stemmer = PorterStemmer()
+        from boolean_query import Or, Term, match_documents
 
-        # Follow the same transform steps used in __add_document
-        term_lower = term.lower()
-        tokens = term_lower.split()
+        stemmed_tokens = self.analyzer.analyze(term)
 
-        # Clean tokens
-        table = str.maketrans('', '', string.punctuation)
-        tokens = [token.translate(table) for token in tokens]
-        tokens = [token.replace('`', "'") for token in tokens]
-        tokens = [token for token in tokens if token]  # remove empty tokens
+        # Stream the union of the sorted posting lists
+        query = Or([Term(token) for token in dict.fromkeys(stemmed_tokens)])
+        index = self.index
+        with profiling.stage("lookup"):
+            return match_documents(query, index, lambda: sorted(self.docmap))
 
-        # Remove stopwords
-        base = Path(__file__).resolve().parents[1]
-        stopwords_path = base / "data" / "stopwords.txt"
-        with stopwords_path.open("r", encoding="utf-8") as fh:
-            stopwords = set(line.strip() for line in fh)
+    def partial_search(self, query: str) -> List[int]:
+        """
+        Return the sorted ids of documents whose title has a term containing
+        any query term as a substring, both stemmed and without stopwords.
+        Matching terms are found in the title substring index, not by
+        scanning the titles.
+        """
+        fragments = self.analyzer.analyze(query)
+        titles = self.titles
+        with profiling.stage("lookup"):
+            return titles.find_documents(fragments)
 
-        # Filter stopwords and stem the tokens
-        filtered_tokens = [token for token in tokens if token not in stopwords]
-        stemmed_tokens = [stemmer.stem(token) for token in filtered_tokens]
+    def boolean_search(self, query: str) -> List[int]:
+        """
+        Return the sorted ids of documents matching a boolean query.
+        Operands are combined with AND (the default), OR and NOT, parentheses
+        group, and "quoted phrases" must appear as consecutive tokens.
+        Raises ValueError for malformed queries.
+        """
+        from boolean_query import QueryParser, match_documents
 
-        # Get postings for stemmed tokens
-        postings: set[int] = set()
-        for token in stemmed_tokens:
-            postings |= self.index.get(token, set())
+        node = QueryParser(self.analyzer).parse(query)
+        index = self.index
+        with profiling.stage("lookup"):
+            return match_documents(node, index, lambda: sorted(self.docmap))
 
-        return sorted(postings)
+    def get_bm25_idf(self, term: str) -> float:
+        """
+        Get the BM25 inverse document frequency of an already stemmed term.
+        IDF = log((N - df + 0.5) / (df + 0.5) + 1), which is always positive.
+        Read from the precomputed corpus statistics.
+        """
+        stats = self.stats
+        term_id = self.index.term_id(term)
+        if term_id is None:
+            return 0.0
+        return stats.bm25_idfs[term_id]
 
-    def build(self)-> None:
+    def fuzzy_terms(self, term: str, max_distance: Optional[int] = None) -> List[Tuple[str, int]]:
         """
-        Build the inverted index from the docmap.
+        Return (term, edit distance) for the indexed terms within max_distance
+        edits of the stemmed term, closest first. By default the allowed
+        distance grows with the term length (see fuzzy.auto_distance).
         """
-        data = self.__load_data()
-        for record in data:
-            doc_id = int(record.get("id", 0))
-            title = record.get("title", "")
-            description = record.get("description", "")
-            full_text = f"{title} {description}"
-            self.docmap[doc_id] = record
-            self.__add_document(doc_id, full_text)
+        stemmed_term = self.analyzer.analyze_term(term)
+        if not stemmed_term:
+            return []
+        if max_distance is None:
+            max_distance = auto_distance(stemmed_term)
+        terms = self.index.terms
+        fuzzy_index = self.fuzzy_index
+        with profiling.stage("lookup"):
+            matches = fuzzy_index.search(stemmed_term, terms, max_distance)
+        return [(terms[term_id], distance) for term_id, distance in matches]
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_SUGGESTIONS) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Complete a typed prefix. Returns up to `limit` "titles" (with the
+        number of documents so titled) and completions of its last word as
+        "words" (with the number of titles containing them), best first,
+        read from precomputed trie nodes.
+        """
+        title_trie, word_trie = self.suggesters
+        normalized = normalize_prefix(prefix)
+        with profiling.stage("lookup"):
+            if not normalized:
+                return {"titles": [], "words": []}
+            # Words are completed from the last typed word, none after a trailing space
+            last_word = normalized.rsplit(" ", 1)[-1]
+            return {"titles": title_trie.complete(normalized, limit),
+                    "words": word_trie.complete(last_word, limit) if last_word else []}
+
+    def similar_documents(self, doc_id: int, limit: int = DEFAULT_SIMILAR_LIMIT,
+                          threshold: float = 0.0) -> List[Tuple[int, float]]:
+        """
+        Return up to `limit` (doc_id, estimated Jaccard similarity) pairs of
+        the documents whose stemmed term sets are most like that of doc_id,
+        at least threshold similar, most similar first. Only documents
+        sharing an LSH band with doc_id are scored.
+        """
+        if doc_id not in self.docmap:
+            raise ValueError(f"Document ID {doc_id} not found in docmap.")
+        minhash = self.minhash
+        with profiling.stage("lookup"):
+            return minhash.similar(doc_id, limit, threshold)
 
+    def near_duplicates(self, threshold: float = DEFAULT_DUPLICATE_THRESHOLD) -> List[List[Tuple[int, float]]]:
+        """
+        Return groups of documents whose stemmed term sets are at least
+        threshold similar (estimated Jaccard) to the group's first, lowest
+        id, document, largest group first; see MinHashIndex.duplicates.
+        """
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("The duplicate threshold must be in (0, 1].")
+        minhash = self.minhash
+        with profiling.stage("dedupe"):
+            return minhash.duplicates(threshold)
 
-    def __load_data(self, filename: str = "movies.json") -> List[Dict[str, Any]]:
-        """Load JSON from data directory and sort by id in descending order"""
+    def search(self, query: str, limit: int = 5, fuzzy: bool = False) -> List[Tuple[int, float]]:
+        """
+        Rank documents for the query with BM25 and return the top `limit`
+        (doc_id, score) pairs, highest score first.
+        With fuzzy=True a query term missing from the index is replaced by
+        the closest indexed terms, so misspelled queries still match.
+
+        Only the posting lists of the query terms are visited, and documents
+        and posting blocks whose precomputed score bounds cannot reach the
+        top `limit` are skipped. The result is the same as scoring every
+        posting. IDFs, bounds and document lengths come from the precomputed
+        corpus statistics.
+        """
+        if not query or limit <= 0:
+            return []
 
-        base = Path(__file__).resolve().parents[1]  # .../hoopla
-        data_path = base / "data" / filename
+        stemmed_tokens = self.analyzer.analyze(query)
+        stats = self.stats
+        index = self.index
 
+        with profiling.stage("lookup"):
+            term_ids: set[int] = set()
+            for token in set(stemmed_tokens):
+                term_id = index.term_id(token)
+                if term_id is not None:
+                    term_ids.add(term_id)
+                elif fuzzy:
+                    term_ids.update(self.fuzzy_index.closest(token, index.terms))
 
-        with data_path.open("r", encoding="utf-8") as fh:
-            data = json.load(fh)
+        idfs = {term_id: stats.bm25_idfs[term_id] for term_id in term_ids}
+        return self.__rank(idfs, limit, stats.avg_doc_length or 1.0)
 
-        # Extract the movies list from the dictionary
-        if isinstance(data, dict) and "movies" in data:
-            data = data["movies"]
+    def score_terms(self, idfs: Dict[str, float], limit: int, avg_doc_length: float) -> List[Tuple[int, float]]:
+        """
+        Rank documents by BM25 over already stemmed terms, using the given
+        IDFs and average document length instead of this index's own.
+        A shard scores with the statistics of the whole corpus this way, so
+        its scores equal those of a single index over all documents.
+        """
+        if limit <= 0:
+            return []
+        stats = self.stats
+        index = self.index
+        with profiling.stage("lookup"):
+            term_ids = {term: index.term_id(term) for term in idfs}
+        # The stored bounds assume this index's average length; with a longer
+        # average no score grows by more than the ratio of the two
+        bound_scale = max(avg_doc_length / (stats.avg_doc_length or 1.0), 1.0)
+        return self.__rank({term_id: idfs[term] for term, term_id in term_ids.items() if term_id is not None},
+                           limit, avg_doc_length, bound_scale)
+
+    def __rank(self, idfs: Dict[int, float], limit: int, avg_doc_length: float,
+               bound_scale: float = 1.0) -> List[Tuple[int, float]]:
+        """Top `limit` (doc_id, score) pairs by BM25 over the terms with the given ids and IDFs."""
+        stats = self.stats
+        index = self.index
+        scorers = [TermScorer(index.terms[term_id], index.postings(term_id), idf, stats.term_max_scores[term_id],
+                              stats.block_max_scores, bound_scale)
+                   for term_id, idf in idfs.items()]
+        with profiling.stage("score"):
+            return top_k_scores(scorers, limit, stats.doc_lengths_by_id, avg_doc_length)
+
+    def snippets(self, query: str, doc_ids: List[int], size: int = DEFAULT_SNIPPET_TOKENS,
+                 markers: Tuple[str, str] = HIGHLIGHT_MARKERS) -> List[str]:
+        """
+        Return a highlighted description snippet for each document, cut
+        around its best cluster of query terms (see snippets.make_snippet).
+        The occurrences come from the positions stored in the query terms'
+        postings and the snippet is cut using the stored token offsets, so
+        the description is never tokenized again.
+        Raises ValueError for documents that are not in the index.
+        """
+        stemmed_tokens = set(self.analyzer.analyze(query))
+        stats = self.stats
+        index = self.index
+        term_ids = {token: index.term_id(token) for token in stemmed_tokens}
+        results = []
+        with profiling.stage("snippet"):
+            for doc_id in doc_ids:
+                if doc_id not in self.docmap:
+                    raise ValueError(f"Document ID {doc_id} not found in docmap.")
+                # document_text() indexes the title, a space, then the description,
+                # so the description's tokens follow those the title analyzes to
+                title = f"{document_field(self.docmap, doc_id, 'title', '')}"
+                description = f"{document_field(self.docmap, doc_id, 'description', '')}"
+                text_offset = len(title) + 1
+                first = len(self.analyzer.analyze_offsets(title)[1])
+                starts = self.token_starts[doc_id]
+                matches, weights = [], {}
+                for token, term_id in term_ids.items():
+                    if term_id is None:
+                        continue
+                    cursor = index.postings(term_id).cursor()
+                    if cursor.advance(doc_id) != doc_id:
+                        continue
+                    weights[token] = stats.bm25_idfs[term_id]
+                    matches.extend((position, token) for position in cursor.positions() if position >= first)
+                matches.sort()
+                results.append(make_snippet(description, text_offset, starts, first, matches, weights,
+                                            size, markers))
+        return results
+
+    def search_batch(self, queries: List[str], limit: int = 5) -> List[List[Tuple[int, float]]]:
+        """
+        Rank documents for many queries at once; returns one list of
+        (doc_id, score) pairs per query, as search() would.
+        Each posting list is decoded once into a CSR matrix, which is
+        multiplied by a matrix of the queries' terms with NumPy.
+        """
+        # NumPy is only needed for batch scoring, so it is imported on demand
+        from batch_search import batch_search
+        with profiling.stage("score"):
+            return batch_search(self, queries, limit, BM25_K1, BM25_B)
+
+    def build(self, workers: int = 1, filename: str = "movies.json",
+              memory_budget: int = DEFAULT_MEMORY_BUDGET, shard: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Build the inverted index from the data file.
+        Records are streamed from the file and indexed as they arrive. Whenever
+        the buffered documents exceed memory_budget bytes they are flushed to a
+        partial segment in the cache; partial segments are merged into the
+        final cache/index.seg at the end.
+        With workers > 1 each batch of records is split into shards that are
+        analyzed in a process pool and merged, giving the same index as a
+        serial build.
+        With shard=(number, count) only the documents whose id hashes to
+        that shard (see sharding.shard_of) are indexed.
+        """
+        partial_paths: List[Path] = []
+        records = self.__iter_data(filename)
+        if shard is not None:
+            from sharding import shard_of
+
+            number, count = shard
+            records = (record for record in records if shard_of(int(record.get("id", 0)), count) == number)
+        if workers > 1:
+            for batch in iter_batches(records, workers * PARALLEL_BATCH_SIZE):
+                for record in batch:
+                    self.__add_record(record)
+                for partial in build_partial_indexes(batch, workers, self.analyzer.stopwords_path):
+                    self.merge_partial(partial)
+                if self.__buffered_bytes >= memory_budget:
+                    partial_paths.append(self.__flush_partial(len(partial_paths)))
+        else:
+            for record in records:
+                doc_id = self.__add_record(record)
+                self.__add_document(doc_id, document_text(record))
+                if self.__buffered_bytes >= memory_budget:
+                    partial_paths.append(self.__flush_partial(len(partial_paths)))
+
+        if partial_paths:
+            partial_paths.append(self.__flush_partial(len(partial_paths)))
+            self.__merge_partials(partial_paths)
+        else:
+            self.__apply_pending()
+
+    def __add_record(self, record: Dict[str, Any]) -> int:
+        """Register a record from the data file in the docmap; returns its id."""
+        doc_id = int(record.get("id", 0))
+        if doc_id in self.docmap:
+            raise ValueError(f"Duplicate document ID {doc_id} in data file.")
+        self.docmap[doc_id] = record
+        self.doc_hashes[doc_id] = record_hash(record)
+        self.__add_title(doc_id, record)
+        return doc_id
+
+    def __flush_partial(self, number: int) -> Path:
+        """Write the buffered documents to a partial segment and clear the buffers."""
+        cache_path = self.cache_dir
+        cache_path.mkdir(parents=True, exist_ok=True)
+        path = cache_path / f"partial-{number:05d}.seg"
+        partial_index = CompactIndex.from_dicts(self.__index_buffer, self.__positions_buffer)
+        partial_titles = SubstringIndex.from_terms(self.__title_buffer)
+        write_segment(path, partial_index, partial_titles, self.docmap, self.doc_lengths, self.doc_hashes,
+                      self.token_starts, partial=True)
+        self.docmap = {}
+        self.doc_lengths = {}
+        self.doc_hashes = {}
+        self.token_starts = {}
+        self.__index_buffer = {}
+        self.__positions_buffer = {}
+        self.__title_buffer = {}
+        self.__buffered_bytes = 0
+        self.__stats = None
+        return path
+
+    def __merge_partials(self, partial_paths: List[Path]) -> None:
+        """
+        Merge partial segments into cache/index.seg, load it and remove the partials.
+        Postings are merged term by term and records are copied one at a time.
+        """
+        segments = [Segment(path) for path in partial_paths]
+        docmap = ChainMap(*(segment.docmap for segment in segments))
+        if len(docmap) != sum(len(segment.docmap) for segment in segments):
+            raise ValueError("Duplicate document IDs in data file.")
+        with profiling.stage("merge"):
+            write_segment(self.cache_dir / SEGMENT_FILENAME,
+                          merge_indexes([segment.index for segment in segments]),
+                          merge_substring_indexes([segment.titles for segment in segments]),
+                          docmap,
+                          ChainMap(*(segment.doc_lengths for segment in segments)),
+                          ChainMap(*(segment.doc_hashes for segment in segments)),
+                          ChainMap(*(segment.token_starts for segment in segments)),
+                          self.generation)
+        del docmap
+        for segment in segments:
+            segment.close()
+        self.load()
+        for path in partial_paths:
+            path.unlink()
+
+    def build_incremental(self, filename: str = "movies.json") -> Dict[str, int]:
+        """
+        Load the cached index and apply only the changes in the data file.
+        Records are matched by id; a record is re-indexed only if its content
+        hash differs from the cached one. Returns the number of added, updated
+        and deleted documents.
+        """
+        self.load()
+        changes = {"added": 0, "updated": 0, "deleted": 0}
+        seen: set[int] = set()
+        for record in self.__iter_data(filename):
+            doc_id = int(record.get("id", 0))
+            seen.add(doc_id)
+            if doc_id not in self.docmap:
+                self.add_document(record)
+                changes["added"] += 1
+            elif self.doc_hashes[doc_id] != record_hash(record):
+                self.update_document(record)
+                changes["updated"] += 1
+        for doc_id in [doc_id for doc_id in self.docmap if doc_id not in seen]:
+            self.delete_document(doc_id)
+            changes["deleted"] += 1
+        self.__apply_pending()
+        return changes
+
+    def merge_partial(self, partial: PartialIndex) -> None:
+        """
+        Merge a partial (index, term_positions, token_starts) triple built for a shard of the corpus.
+        """
+        shard_index, shard_term_positions, shard_token_starts = partial
+        self.token_starts.update(shard_token_starts)
+        for token, doc_ids in shard_index.items():
+            if token not in self.__index_buffer:
+                self.__index_buffer[token] = set()
+            self.__index_buffer[token].update(doc_ids)
+        for doc_id, positions in shard_term_positions.items():
+            self.__positions_buffer[doc_id] = positions
+            self.doc_lengths[doc_id] = sum(len(token_positions) for token_positions in positions.values())
+            self.__total_doc_length += self.doc_lengths[doc_id]
+            self.__buffered_bytes += estimate_document_bytes(self.doc_lengths[doc_id], len(positions))
+        self.__touch()
+        self.__stats = None
+
+    def __iter_data(self, filename: str = "movies.json") -> Iterator[Dict[str, Any]]:
+        """Stream records from a JSON or JSON Lines file in the data directory"""
 
-        try:
-            return sorted(data, key=lambda x: int(x.get("id", 0)), reverse=False)
-        except:
-            return data
+        base = Path(__file__).resolve().parents[1]  # .../hoopla
+        data_path = base / "data" / filename
+        return iter_records(data_path)
 
     def get_tf(self, doc_id: int, term: str) -> int:
         """
@@ -189,23 +738,14 @@ class InvertedIndex:
         if ' ' in term:
             raise ValueError("Term frequency can only be retrieved for single tokens.")
 
-        # Initialize stemmer and process the term
-        stemmer = PorterStemmer()
-        term_lower = term.lower()
-
-        # Clean the term
-        table = str.maketrans('', '', string.punctuation)
-        cleaned_term = term_lower.translate(table)
-        cleaned_term = cleaned_term.replace('`', "'")
-
-        if not cleaned_term:
+        stemmed_term = self.analyzer.analyze_term(term)
+        if not stemmed_term:
             return 0
 
-        # Stem the term
-        stemmed_term = stemmer.stem(cleaned_term)
-
-        # Look up frequency of stemmed term
-        return self.term_frequency[doc_id].get(stemmed_term, 0)
+        # Look up frequency of stemmed term in its posting list
+        index = self.index
+        with profiling.stage("lookup"):
+            return index.tf(stemmed_term, doc_id)
 
 
     def get_idf(self, term: str) -> float:
@@ -214,247 +754,644 @@ class InvertedIndex:
         IDF = log((N + 1) / (df + 1)) where N is total number of documents,
         and df is document frequency of the term.
         """
-        import math
 
         if ' ' in term:
             raise ValueError("IDF can only be calculated for single tokens.")
 
-        # Initialize stemmer and process the term
-        stemmer = PorterStemmer()
-        term_lower = term.lower()
-
-        # Clean the term
-        table = str.maketrans('', '', string.punctuation)
-        cleaned_term = term_lower.translate(table)
-        cleaned_term = cleaned_term.replace('`', "'")
-
-        if not cleaned_term:
+        stemmed_term = self.analyzer.analyze_term(term)
+        if not stemmed_term:
             return 0.0
 
-        # Stem the term
-        stemmed_term = stemmer.stem(cleaned_term)
+        # Look up the precomputed IDF; unknown terms have no document frequency
+        stats = self.stats
+        index = self.index
+        with profiling.stage("lookup"):
+            term_id = index.term_id(stemmed_term)
+            return 0.0 if term_id is None else stats.idfs[term_id]
 
-        # Calculate document frequency
-        doc_freq = len(self.index.get(stemmed_term, []))
-        total_docs = len(self.docmap)
+def get_tf(inverted_index: InvertedIndex, doc_id: int, term: str) -> int:
+    """
+    Get the term frequency of a term in a specific document using the inverted index.
+    """
+    if doc_id not in inverted_index.docmap:
+        raise ValueError(f"Document ID {doc_id} not found in docmap.")
 
-        if doc_freq == 0:
-            return 0.0
+    ## The index cleans and stems the term with its analyzer
+    frequency = inverted_index.get_tf(doc_id, term)
+    return frequency
+def build_shard(shard: int, shard_count: int, filename: str = "movies.json",
+                memory_budget: int = DEFAULT_MEMORY_BUDGET) -> int:
+    """
+    Build one shard of a sharded index into cache/shards/shard-NNN/index.seg;
+    returns its number of documents. Run in a worker process per shard.
+    """
+    from sharding import SHARDS_DIRNAME, shard_directory
+
+    index = InvertedIndex(cache_dir=shard_directory(InvertedIndex.cache_path() / SHARDS_DIRNAME, shard))
+    index.build(filename=filename, memory_budget=memory_budget, shard=(shard, shard_count))
+    index.save()
+    return len(index.docmap)
 
-        idf = math.log((total_docs + 1) / (doc_freq + 1))
-        return idf
 
-def isPartialMatch(record: str, query: str) -> bool:
+def build_shards(shard_count: int, workers: int = 1, filename: str = "movies.json",
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET) -> List[int]:
     """
-    Check if the query is a partial match in the title or description of the record.
+    Partition the data file by doc id hash into shard_count shards and build
+    each as its own index segment, up to `workers` shards at a time.
+    Every shard streams the whole file and keeps only its own documents, so
+    a build process needs the memory of one shard. Returns the document
+    count of each shard.
     """
+    from concurrent.futures import ProcessPoolExecutor
+    from sharding import SHARDS_DIRNAME, write_manifest
 
-    tokensTitle = record.split()
-    tokensQuery = query.split()
+    if shard_count < 1:
+        raise ValueError("The number of shards must be at least 1.")
+    shards = range(shard_count)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, shard_count)) as executor:
+            counts = list(executor.map(build_shard, shards, [shard_count] * shard_count,
+                                       [filename] * shard_count, [memory_budget] * shard_count))
+    else:
+        counts = [build_shard(shard, shard_count, filename, memory_budget) for shard in shards]
+    write_manifest(InvertedIndex.cache_path() / SHARDS_DIRNAME, shard_count, time.time_ns())
+    return counts
 
-    # read file stopwords.txt
-    base = Path(__file__).resolve().parents[1]  # .../hoop
-    stopwords_path = base / "data" / "stopwords.txt"
-    with stopwords_path.open("r", encoding="utf-8") as fh:
-        stopwords = set(line.strip() for line in fh)
 
-    # REMOVE empty tokens
-    tokensTitle = [token for token in tokensTitle if token]
-    tokensTitle = [token for token in tokensTitle if token not in stopwords]
-    tokensQuery = [token for token in tokensQuery if token]
-    tokensQuery = [token for token in tokensQuery if token not in stopwords]
+def open_shard(directory: Path) -> InvertedIndex:
+    """Load the index of one shard directory; used by the shard worker processes."""
+    inverted_index = InvertedIndex(cache_dir=directory)
+    inverted_index.load()
+    return inverted_index
 
-    # STEMMING
-    ps = PorterStemmer()
-    tokensTitle = [ps.stem(token) for token in tokensTitle]
-    tokensQuery = [ps.stem(token) for token in tokensQuery]
 
-    for qtoken in tokensQuery:
-        for ttoken in tokensTitle:
-            if qtoken in ttoken:
-                return True
+def open_sharded_index():
+    """Open the sharded index in cache/shards and start one worker process per shard."""
+    # The shard workers are only needed by search --sharded
+    from sharding import SHARDS_DIRNAME, ShardedIndex
 
+    return ShardedIndex(InvertedIndex.cache_path() / SHARDS_DIRNAME, get_analyzer(), open_shard, SEGMENT_FILENAME)
 
-    return False
 
+def build_vector_index(filename: str = "movies.json", encoder_name: str = "hashing", dimensions: int = 256,
+                       partitions: Optional[int] = None):
+    """
+    Embed every record of the data file and save a VectorIndex to
+    cache/vectors.seg; returns the index. Records are streamed and encoded
+    in batches, so only the float32 matrix itself is held in memory.
+    """
+    # numpy is only needed by the vector commands
+    from vector_index import VectorIndex, encode_batches, get_encoder
 
-def load_data(filename: str = "movies.json") -> List[Dict[str, Any]]:
-    """Load JSON from data directory and sort by id in descending order"""
+    encoder = get_encoder(encoder_name, dimensions)
     base = Path(__file__).resolve().parents[1]  # .../hoopla
-    data_path = base / "data" / filename
-
+    doc_ids: List[int] = []
+    doc_hashes: List[int] = []
 
-    with data_path.open("r", encoding="utf-8") as fh:
-        data = json.load(fh)
+    def texts() -> Iterator[str]:
+        for record in iter_records(base / "data" / filename):
+            doc_ids.append(int(record.get("id", 0)))
+            doc_hashes.append(record_hash(record))
+            yield document_text(record)
 
-    # Extract the movies list from the dictionary
-    if isinstance(data, dict) and "movies" in data:
-        data = data["movies"]
+    vectors = encode_batches(encoder, texts())
+    vector_index = VectorIndex.build(doc_ids, vectors, partitions,
+                                     encoder_spec={"name": encoder_name, "dimensions": dimensions},
+                                     doc_hashes=doc_hashes)
+    vector_index.save(InvertedIndex.cache_path() / VECTOR_FILENAME)
+    return vector_index
 
-    try:
-        return sorted(data, key=lambda x: int(x.get("id", 0)), reverse=False)
-    except:
-        return data
 
-def search_records(records: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+def update_vector_index(inverted_index: InvertedIndex) -> Optional[Dict[str, int]]:
     """
-    Simple search function that looks for query in title or description.
-    Returns matches sorted by id in descending order.
+    Bring cache/vectors.seg in line with the documents of a freshly built
+    keyword index: rows of deleted documents are dropped, and documents that
+    were added or whose record changed are encoded again with the vector
+    index's encoder. Returns the number of encoded and deleted rows, or
+    None if there is no vector index.
     """
-    query = query.lower()
-    santitizedQuery = query.translate(str.maketrans('', '', string.punctuation))
-    results = []
-
-    for record in records:
-        # Skip if record is not a dictionary
-        if not isinstance(record, dict):
-            continue
+    path = InvertedIndex.cache_path() / VECTOR_FILENAME
+    if not path.exists():
+        return None
+    # numpy is only needed once there is a vector index to update
+    from vector_index import VectorIndex, encode_batches
+
+    vector_index = VectorIndex.load(path)
+    stored = dict(zip(vector_index.doc_ids.tolist(), vector_index.doc_hashes.tolist()))
+    deleted = [doc_id for doc_id in stored if doc_id not in inverted_index.docmap]
+    encoded = [doc_id for doc_id in sorted(inverted_index.docmap)
+               if stored.get(doc_id) != inverted_index.doc_hashes[doc_id]]
+    if deleted or encoded:
+        vectors = encode_batches(vector_index.encoder,
+                                 (document_text(inverted_index.docmap[doc_id]) for doc_id in encoded))
+        vector_index = vector_index.updated(deleted + [doc_id for doc_id in encoded if doc_id in stored],
+                                            encoded, vectors, [inverted_index.doc_hashes[doc_id] for doc_id in encoded])
+        vector_index.save(path)
+    return {"encoded": len(encoded), "deleted": len(deleted)}
+
+
+def open_vector_index():
+    """Memory-map the vector index in cache/vectors.seg."""
+    from vector_index import VectorIndex
+
+    return VectorIndex.load(InvertedIndex.cache_path() / VECTOR_FILENAME)
+
+
+def open_hybrid_searcher(nprobe: Optional[int] = 8, lexical_timeout: float = DEFAULT_LEG_TIMEOUT,
+                         vector_timeout: float = DEFAULT_LEG_TIMEOUT) -> Tuple[HybridSearcher, InvertedIndex]:
+    """
+    Open the keyword and vector indexes and return a searcher running BM25
+    ("lexical") and vector search ("vector") side by side, along with the
+    keyword index for rendering. nprobe=None makes vector search exact.
+    """
+    inverted_index = InvertedIndex()
+    inverted_index.load()
+    vector_index = open_vector_index()
 
-        title = record.get("title", "").lower()
-        sanitized_title = title.translate(str.maketrans('', '', string.punctuation))
+    def lexical(query: str, depth: int) -> List[Tuple[int, float]]:
+        return inverted_index.search(query, depth)
 
-        if isPartialMatch(sanitized_title, santitizedQuery):
-            results.append(record)
+    def vector(query: str, depth: int) -> List[Tuple[int, float]]:
+        return vector_index.search([query], depth, nprobe)[0]
 
-    return sorted(results, key=lambda x: int(x.get("id", 0)))
+    searcher = HybridSearcher({"lexical": lexical, "vector": vector},
+                              timeouts={"lexical": lexical_timeout, "vector": vector_timeout})
+    return searcher, inverted_index
 
 
-def get_tf(inverted_index: InvertedIndex, doc_id: int, term: str) -> int:
+def open_query_service(server: Optional[str], cache_size: int = 0,
+                       cache_ttl: float = DEFAULT_RESULT_CACHE_TTL, sharded: bool = False):
     """
-    Get the term frequency of a term in a specific document using the inverted index.
+    Return a client for a running query server if one is given,
+    otherwise a QueryService over the cached index, or over the sharded
+    index in cache/shards with sharded=True. With a cache_size, the local
+    service keeps search results in cache/results.json (a cache_ttl of 0
+    never expires entries). Use it in a with block, or call close(), to
+    persist them and close the index.
     """
-    if doc_id not in inverted_index.docmap:
-        raise ValueError(f"Document ID {doc_id} not found in docmap.")
+    if server:
+        return QueryClient(server)
+    if sharded:
+        inverted_index = open_sharded_index()
+    else:
+        inverted_index = InvertedIndex()
+        inverted_index.load()
+    cache = None
+    if cache_size > 0:
+        cache = ResultCache.load(InvertedIndex.cache_path() / RESULT_CACHE_FILENAME, cache_size, cache_ttl or None)
+    return QueryService(inverted_index, cache)
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the result cache size and TTL options to a subcommand."""
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_RESULT_CACHE_SIZE,
+                        help=f"Search results kept in the result cache, 0 to disable (default: {DEFAULT_RESULT_CACHE_SIZE})")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_RESULT_CACHE_TTL,
+                        help=f"Seconds a cached result stays valid, 0 for no limit (default: {DEFAULT_RESULT_CACHE_TTL:g})")
+
 
-    # Clean the term
-    table = str.maketrans('', '', string.punctuation)
-    cleaned_term = term.lower().translate(table)
-    ## Use the PorterStemmer to stem the term
-    stemmer = PorterStemmer()
-    stemmed_term = stemmer.stem(cleaned_term)
-    ## Get the frequency from the inverted index
-    frequency = inverted_index.get_tf(doc_id, stemmed_term)
-    return frequency
 def main() -> None:
     parser = argparse.ArgumentParser(description="Simple Keyword Search CLI")
+    parser.add_argument("--server", type=str, default=os.environ.get("HOOPLA_SERVER"),
+                        help="URL of a running query server, e.g. http://127.0.0.1:8765 "
+                             "(default: $HOOPLA_SERVER); the query subcommands in the README's endpoint table "
+                             "are sent there")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
+    # Shared by every subcommand, so the option can follow the subcommand name
+    profile_parser = argparse.ArgumentParser(add_help=False)
+    profile_parser.add_argument("--profile", "--stats", nargs="?", const="table", choices=("table", "json"),
+                                help="Print per-stage wall time, call counts and peak memory to stderr "
+                                     "as a table (default) or JSON")
 
-    search_parser = subparsers.add_parser("search", help="Search movies by keyword")
+    search_parser = subparsers.add_parser("search", parents=[profile_parser], help="Search movies by keyword")
     search_parser.add_argument("query", type=str, help="Search query")
     search_parser.add_argument("--data-file", type=str, default="movies.json",
                               help="JSON filename located in hoopla/data (default: movies.json)")
-    build_parser = subparsers.add_parser("build", help="Build the inverted index and save to cache")
+    search_parser.add_argument("--limit", type=int, default=5,
+                              help="Maximum number of results to return (default: 5)")
+    search_parser.add_argument("--fuzzy", action="store_true",
+                              help="Replace query terms missing from the index with the closest indexed terms")
+    search_parser.add_argument("--snippets", action="store_true",
+                              help="Show a description snippet with the query terms highlighted under each result")
+    search_parser.add_argument("--sharded", action="store_true",
+                              help="Search the sharded index built with build --shards, one worker process per shard")
+    add_cache_arguments(search_parser)
+    build_parser = subparsers.add_parser("build", parents=[profile_parser], help="Build the inverted index and save to cache")
     build_parser.add_argument("--data-file", type=str, default="movies.json",
                               help="JSON filename located in hoopla/data (default: movies.json)")
-
-    tf_parser = subparsers.add_parser("tf", help="Get term frequency for a term in a document")
+    build_parser.add_argument("--workers", type=int, default=1,
+                              help="Number of worker processes used to analyze the corpus (default: 1)")
+    build_parser.add_argument("--memory-budget", type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                              help="Flush buffered documents to a partial segment beyond this many MB (default: 512)")
+    build_parser.add_argument("--incremental", action="store_true",
+                              help="Only re-index records that were added, changed or removed since the last build")
+    build_parser.add_argument("--shards", type=int, default=0,
+                              help="Partition documents by id hash into this many index shards in cache/shards; "
+                                   "--workers shards are built at a time (default: 0, a single index)")
+
+    tf_parser = subparsers.add_parser("tf", parents=[profile_parser], help="Get term frequency for a term in a document")
     tf_parser.add_argument("doc_id", type=int, help="Document ID")
     tf_parser.add_argument("term", type=str, help="Term to get frequency for")
 
-    idf_parser = subparsers.add_parser("idf", help="Get inverse document frequency for a term")
+    idf_parser = subparsers.add_parser("idf", parents=[profile_parser], help="Get inverse document frequency for a term")
     idf_parser.add_argument("term", type=str, help="Term to get IDF for")
 
-    tfidf_parser = subparsers.add_parser("tfidf", help="Get TF-IDF for a term in a document")
+    tfidf_parser = subparsers.add_parser("tfidf", parents=[profile_parser], help="Get TF-IDF for a term in a document")
     tfidf_parser.add_argument("doc_id", type=int, help="Document ID")
     tfidf_parser.add_argument("terms", type=str, help="Term(s) to get TF-IDF for (space-separated)")
 
-
+    fuzzy_parser = subparsers.add_parser("fuzzy", parents=[profile_parser], help="List indexed terms within a few edits of a term")
+    fuzzy_parser.add_argument("term", type=str, help="Possibly misspelled term")
+    fuzzy_parser.add_argument("--max-distance", type=int, choices=(0, 1, 2), default=None,
+                              help="Maximum edit distance (default: 0-2 depending on term length)")
+
+    partial_parser = subparsers.add_parser("partial", parents=[profile_parser], help="Find movies with a title term containing the query terms")
+    partial_parser.add_argument("query", type=str, help="Word fragments to look for in titles")
+    partial_parser.add_argument("--limit", type=int, default=10,
+                                help="Maximum number of matches to print (default: 10)")
+
+    boolean_parser = subparsers.add_parser("boolean", parents=[profile_parser], help="Find movies matching a boolean or phrase query")
+    boolean_parser.add_argument("query", type=str,
+                                help='Query such as \'"star wars" AND (empire OR jedi) NOT clone\'')
+    boolean_parser.add_argument("--limit", type=int, default=10,
+                                help="Maximum number of matches to print (default: 10)")
+
+    suggest_parser = subparsers.add_parser("suggest", parents=[profile_parser], help="Autocomplete a typed title prefix")
+    suggest_parser.add_argument("prefix", type=str, help="What has been typed so far")
+    suggest_parser.add_argument("--limit", type=int, default=DEFAULT_SUGGESTIONS,
+                                help=f"Completions of each kind to show, at most 10 (default: {DEFAULT_SUGGESTIONS})")
+    suggest_parser.add_argument("--keystrokes", action="store_true",
+                                help="Complete every prefix of the input in turn, as if it were typed")
+
+    similar_parser = subparsers.add_parser("similar", parents=[profile_parser],
+                                           help="Find the movies whose indexed terms are most like a document's")
+    similar_parser.add_argument("doc_id", type=int, help="Document ID")
+    similar_parser.add_argument("--limit", type=int, default=DEFAULT_SIMILAR_LIMIT,
+                                help=f"Maximum number of similar documents to print (default: {DEFAULT_SIMILAR_LIMIT})")
+    similar_parser.add_argument("--threshold", type=float, default=0.0,
+                                help="Minimum estimated Jaccard similarity of the term sets (default: 0)")
+
+    dedupe_parser = subparsers.add_parser("dedupe", parents=[profile_parser],
+                                          help="Report groups of near-duplicate movies")
+    dedupe_parser.add_argument("--threshold", type=float, default=DEFAULT_DUPLICATE_THRESHOLD,
+                               help="Minimum estimated Jaccard similarity of the term sets "
+                                    f"(default: {DEFAULT_DUPLICATE_THRESHOLD:g})")
+    dedupe_parser.add_argument("--limit", type=int, default=10,
+                               help="Maximum number of groups to print (default: 10)")
+
+    batch_parser = subparsers.add_parser("search-batch", parents=[profile_parser], help="Search many queries and print JSON Lines results")
+    batch_parser.add_argument("queries_file", type=str, nargs="?", default="-",
+                              help="File with one query per line (default: read from stdin)")
+    batch_parser.add_argument("--limit", type=int, default=5,
+                              help="Maximum number of results per query (default: 5)")
+    batch_parser.add_argument("--output", type=str, default="-",
+                              help="File to write JSON Lines results to (default: stdout)")
+
+    serve_parser = subparsers.add_parser("serve", parents=[profile_parser], help="Keep the index loaded and answer queries over HTTP")
+    serve_parser.add_argument("--host", type=str, default=DEFAULT_HOST,
+                              help=f"Interface to listen on (default: {DEFAULT_HOST})")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                              help=f"Port to listen on (default: {DEFAULT_PORT})")
+    serve_parser.add_argument("--threads", type=int, default=DEFAULT_THREADS,
+                              help=f"Worker threads for concurrent clients (default: {DEFAULT_THREADS})")
+    add_cache_arguments(serve_parser)
+
+    subparsers.add_parser("cache-stats", parents=[profile_parser], help="Show hit and miss counters of the search result cache")
+
+    vector_build_parser = subparsers.add_parser("vector-build", parents=[profile_parser],
+                                                help="Embed every movie and save a dense vector index to cache")
+    vector_build_parser.add_argument("--data-file", type=str, default="movies.json",
+                                     help="JSON filename located in hoopla/data (default: movies.json)")
+    vector_build_parser.add_argument("--encoder", type=str, default="hashing",
+                                     help="Registered encoder name or module:factory (default: hashing)")
+    vector_build_parser.add_argument("--dimensions", type=int, default=256,
+                                     help="Embedding dimensions (default: 256)")
+    vector_build_parser.add_argument("--partitions", type=int, default=None,
+                                     help="IVF partitions, 0 for exact search only "
+                                          "(default: about sqrt(N) from 4096 documents on)")
+
+    vector_search_parser = subparsers.add_parser("vector-search", parents=[profile_parser],
+                                                 help="Search movies by embedding similarity")
+    vector_search_parser.add_argument("query", type=str, help="Search query")
+    vector_search_parser.add_argument("--limit", type=int, default=5,
+                                      help="Maximum number of results to return (default: 5)")
+    vector_search_parser.add_argument("--nprobe", type=int, default=8,
+                                      help="IVF partitions searched per query (default: 8)")
+    vector_search_parser.add_argument("--exact", action="store_true",
+                                      help="Score every vector instead of probing partitions")
+
+
+    hybrid_parser = subparsers.add_parser("hybrid-search", parents=[profile_parser],
+                                          help="Search movies with BM25 and vector search at once and fuse the rankings")
+    hybrid_parser.add_argument("query", type=str, help="Search query")
+    hybrid_parser.add_argument("--limit", type=int, default=5,
+                               help="Maximum number of results to return (default: 5)")
+    hybrid_parser.add_argument("--method", choices=FUSION_METHODS, default=DEFAULT_FUSION,
+                               help="Reciprocal-rank fusion or min-max normalized weighted scores (default: rrf)")
+    hybrid_parser.add_argument("--depth", type=int, default=None,
+                               help="Candidates fetched from each retriever (default: 4 x limit, at most 1000)")
+    hybrid_parser.add_argument("--lexical-weight", type=float, default=1.0,
+                               help="Weight of the BM25 ranking in the fusion (default: 1)")
+    hybrid_parser.add_argument("--vector-weight", type=float, default=1.0,
+                               help="Weight of the vector ranking in the fusion (default: 1)")
+    hybrid_parser.add_argument("--lexical-timeout", type=float, default=DEFAULT_LEG_TIMEOUT,
+                               help=f"Seconds to wait for BM25 results (default: {DEFAULT_LEG_TIMEOUT:g})")
+    hybrid_parser.add_argument("--vector-timeout", type=float, default=DEFAULT_LEG_TIMEOUT,
+                               help=f"Seconds to wait for vector results (default: {DEFAULT_LEG_TIMEOUT:g})")
+    hybrid_parser.add_argument("--nprobe", type=int, default=8,
+                               help="IVF partitions searched per query (default: 8)")
+    hybrid_parser.add_argument("--exact", action="store_true",
+                               help="Score every vector instead of probing partitions")
 
     args = parser.parse_args()
 
+    profile_format = getattr(args, "profile", None)
+    if profile_format:
+        profiling.enable()
+    try:
+        run_command(parser, args)
+    finally:
+        report = profiling.finish(args.command)
+        if report is not None:
+            profiling.print_report(report, profile_format)
+
+
+def run_command(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Run the subcommand selected on the command line."""
     match args.command:
         case "search":
+            if args.sharded and args.server:
+                parser.error("--sharded searches the local shards and cannot be combined with --server or $HOOPLA_SERVER")
+            if args.sharded and args.fuzzy:
+                parser.error("--fuzzy is not supported with --sharded")
             print(f"Searching for: {args.query}")
             try:
-                inverted_index = InvertedIndex()
-                inverted_index.load()
-                # Clean query: remove punctuation and convert to lowercase
-                query = args.query.translate(str.maketrans('', '', string.punctuation)).lower()
-                results = set()
-                stemmer = PorterStemmer()
-                # Stem the search token
-                search_stems = [stemmer.stem(token) for token in query.split()]
-
-                for doc_id in inverted_index.docmap:
-                    record = inverted_index.docmap[doc_id]
-                    # Clean and stem the words in the document
-                    description = record.get('description', '').translate(str.maketrans('', '', string.punctuation)).lower()
-                    title = record.get('title', '').translate(str.maketrans('', '', string.punctuation)).lower()
-                    doc_words = description.split() + title.split()
-                    doc_stems = [stemmer.stem(word) for word in doc_words]
-
-                    # Check if any search stem matches document stems
-                    if any(stem in doc_stems for stem in search_stems):
-                        results.add(doc_id)
-
-                    if len(results) >= 5:
-                        results = set(sorted(list(results))[:5])
-                        break
-
-                for doc_id in sorted(results):
-                    record = inverted_index.docmap.get(doc_id, {})
-                    print(f"ID: {record.get('id', '')}, Title: {record.get('title', '')}")
-
-            except FileNotFoundError:
-                print(f"Data file not found: hoopla/data/{args.data_file}")
+                with open_query_service(args.server, args.cache_size, args.cache_ttl, args.sharded) as service:
+                    results = service.search(args.query, args.limit, args.fuzzy, args.snippets)
+
+                for result in results:
+                    print(f"ID: {result['id']}, Title: {result['title']}, Score: {result['score']:.2f}")
+                    if args.snippets:
+                        print(f"    {result['snippet']}")
+
+            except (FileNotFoundError, ValueError, ConnectionError) as e:
+                print(e)
         case "build":
 
-            print("Building inverted index...")
+            if args.shards:
+                if args.incremental:
+                    print("Incremental builds are not supported for a sharded index.")
+                    return
+                print(f"Building inverted index in {args.shards} shards...")
+                try:
+                    with profiling.stage("build"):
+                        counts = build_shards(args.shards, args.workers, args.data_file,
+                                              args.memory_budget * 1024 * 1024)
+                except ValueError as e:
+                    print(e)
+                    return
+                print(f"Sharded index built and saved to cache: {sum(counts)} documents "
+                      f"({', '.join(str(count) for count in counts)} per shard).")
+                return
+
             index = InvertedIndex()
-            index.build()
-            index.save()
-            print(f"Inverted index built and saved to cache.")
+            if args.incremental:
+                print("Updating inverted index...")
+                try:
+                    with profiling.stage("build"):
+                        changes = index.build_incremental(args.data_file)
+                except FileNotFoundError:
+                    print("No cached index found; run a full build first.")
+                    return
+                index.save()
+                print(f"Inverted index updated: {changes['added']} added, "
+                      f"{changes['updated']} updated, {changes['deleted']} deleted.")
+            else:
+                print("Building inverted index...")
+                with profiling.stage("build"):
+                    index.build(workers=args.workers, filename=args.data_file,
+                                memory_budget=args.memory_budget * 1024 * 1024)
+                index.save()
+                print(f"Inverted index built and saved to cache.")
+            try:
+                with profiling.stage("vectors"):
+                    vector_changes = update_vector_index(index)
+            except ValueError as e:
+                print(f"Vector index not updated: {e}")
+            else:
+                if vector_changes is not None:
+                    print(f"Vector index updated: {vector_changes['encoded']} encoded, "
+                          f"{vector_changes['deleted']} deleted.")
+            stats = index.analyzer.cache_stats()
+            # Worker processes keep their own caches, so only report a serial build
+            if stats['hits'] or stats['misses']:
+                print(f"Stem cache: {stats['hits']} hits, {stats['misses']} misses "
+                      f"({stats['hit_rate']:.1%} hit rate)")
 
         case "tf":
             try:
-                inverted_index = InvertedIndex()
-                inverted_index.load()
-                frequency = get_tf(inverted_index, args.doc_id, args.term)
+                with open_query_service(args.server) as service:
+                    frequency = service.tf(args.doc_id, args.term)
                 print(f"Term frequency of '{args.term}' in document {args.doc_id}: {frequency}")
-            except ValueError as e:
+            except (FileNotFoundError, ValueError, ConnectionError) as e:
                 print(e)
 
         case "idf":
             try:
-                inverted_index = InvertedIndex()
-                inverted_index.load()
                 term = args.term
-                # Clean the term
-                table = str.maketrans('', '', string.punctuation)
-                cleaned_term = term.lower().translate(table)
-                # Stem the term
-                stemmer = PorterStemmer()
-                stemmed_term = stemmer.stem(cleaned_term)
-
-                # Calculate document frequency
-                doc_freq = len(inverted_index.index.get(stemmed_term, []))
-                total_docs = len(inverted_index.docmap)
-                if doc_freq == 0:
+                with open_query_service(args.server) as service:
+                    result = service.idf(term)
+                if result["doc_freq"] == 0:
                     print(f"Term '{term}' not found in any document.")
                 else:
-                    import math
-                    idf = math.log((total_docs +1) / (doc_freq + 1) )
-                    print(f"Inverse Document Frequency (IDF) of '{term}': {idf:.2f}")
-            except ValueError     as e:
+                    print(f"Inverse Document Frequency (IDF) of '{term}': {result['idf']:.2f}")
+            except (FileNotFoundError, ValueError, ConnectionError) as e:
                 print(e)
 
         case "tfidf":
             try:
                 document_id = args.doc_id
                 terms = args.terms
-                inverted_index = InvertedIndex()
-                inverted_index.load()
-                # terms could be multiple words
-                tfidf = 0
-                for term in terms.split():
-                    # Get term frequency
-                    tf = inverted_index.get_tf(document_id, term)
-                    idf = inverted_index.get_idf(term)
-                    tfidf += tf * idf
+                with open_query_service(args.server) as service:
+                    # terms could be multiple words
+                    tfidf = service.tfidf(document_id, terms)
                 print(f"TF-IDF of '{terms}' in document {document_id}: {tfidf:.2f}")
+            except (FileNotFoundError, ValueError, ConnectionError) as e:
+                print(e)
+                return
+
+        case "fuzzy":
+            try:
+                with open_query_service(args.server) as service:
+                    matches = service.fuzzy(args.term, args.max_distance)
+                if not matches:
+                    print(f"No indexed terms close to '{args.term}'.")
+                for match in matches:
+                    print(f"{match['term']} (distance {match['distance']}, {match['doc_freq']} documents)")
+            except (FileNotFoundError, ValueError, ConnectionError) as e:
+                print(e)
+
+        case "partial":
+            try:
+                with open_query_service(args.server) as service:
+                    result = service.partial(args.query, args.limit)
+                print(f"Found {result['total']} matching documents")
+                for match in result["results"]:
+                    print(f"ID: {match['id']}, Title: {match['title']}")
+            except (FileNotFoundError, ValueError, ConnectionError) as e:
+                print(e)
+
+        case "boolean":
+            try:
+                with open_query_service(args.server) as service:
+                    result = service.boolean(args.query, args.limit)
+                print(f"Found {result['total']} matching documents")
+                for match in result["results"]:
+                    print(f"ID: {match['id']}, Title: {match['title']}")
+            except (FileNotFoundError, ValueError, ConnectionError) as e:
+                print(e)
+
+        case "suggest":
+            try:
+                with open_query_service(args.server) as service:
+                    prefixes = [args.prefix[:end] for end in range(1, len(args.prefix) + 1)] if args.keystrokes \
+                        else [args.prefix]
+                    for prefix in prefixes:
+                        started = time.perf_counter()
+                        completions = service.suggest(prefix, args.limit)
+                        elapsed = (time.perf_counter() - started) * 1e6
+                        titles = ", ".join(match["text"] for match in completions["titles"]) or "-"
+                        words = ", ".join(match["text"] for match in completions["words"]) or "-"
+                        print(f"{prefix!r} ({elapsed:.0f} µs): titles: {titles} | words: {words}")
+            except (FileNotFoundError, ValueError, ConnectionError) as e:
+                print(e)
+
+        case "similar":
+            try:
+                with open_query_service(args.server) as service:
+                    results = service.similar(args.doc_id, args.limit, args.threshold)
+                if not results:
+                    print(f"No documents similar to {args.doc_id}.")
+                for match in results:
+                    print(f"ID: {match['id']}, Title: {match['title']}, Similarity: {match['similarity']:.2f}")
+            except (FileNotFoundError, ValueError, ConnectionError) as e:
+                print(e)
+
+        case "dedupe":
+            try:
+                with open_query_service(args.server) as service:
+                    result = service.dedupe(args.threshold, args.limit)
+                print(f"Found {result['total']} groups of near-duplicate documents")
+                for group in result["groups"]:
+                    leader, duplicates = group[0], group[1:]
+                    print(f"ID: {leader['id']}, Title: {leader['title']}")
+                    for match in duplicates:
+                        print(f"  ID: {match['id']}, Title: {match['title']}, Similarity: {match['similarity']:.2f}")
+            except (FileNotFoundError, ValueError, ConnectionError) as e:
+                print(e)
+
+        case "cache-stats":
+            try:
+                # The only command that reads the persisted result cache without searching
+                with open_query_service(args.server, DEFAULT_RESULT_CACHE_SIZE) as service:
+                    stats = service.cache_stats()
+                print(f"Result cache: {stats['size']} entries, {stats['hits']} hits, {stats['misses']} misses "
+                      f"({stats['hit_rate']:.1%} hit rate)")
+            except (FileNotFoundError, ValueError, ConnectionError) as e:
+                print(e)
+
+        case "vector-build":
+            print("Building vector index...")
+            try:
+                with profiling.stage("build"):
+                    vector_index = build_vector_index(args.data_file, args.encoder, args.dimensions, args.partitions)
+            except FileNotFoundError as e:
+                print(f"Data file not found: {e.filename}")
+                return
             except ValueError as e:
                 print(e)
                 return
+            search_mode = f"{vector_index.partitions} partitions" if vector_index.partitions else "exact search"
+            print(f"Vector index built and saved to cache: {len(vector_index.vectors)} documents, "
+                  f"{vector_index.dimensions} dimensions, {search_mode}.")
+
+        case "vector-search":
+            print(f"Searching for: {args.query}")
+            try:
+                vector_index = open_vector_index()
+                inverted_index = InvertedIndex()
+                inverted_index.load()
+                results = vector_index.search([args.query], args.limit, None if args.exact else args.nprobe)[0]
+            except (FileNotFoundError, ValueError) as e:
+                print(e)
+                return
+            for doc_id, score in results:
+                title = document_field(inverted_index.docmap, doc_id, "title", "")
+                print(f"ID: {doc_id}, Title: {title}, Score: {score:.2f}")
+
+        case "hybrid-search":
+            print(f"Searching for: {args.query}")
+            try:
+                searcher, inverted_index = open_hybrid_searcher(None if args.exact else args.nprobe,
+                                                                args.lexical_timeout, args.vector_timeout)
+                with searcher:
+                    results, rankings, failures = searcher.search(
+                        args.query, args.limit, args.depth, args.method,
+                        {"lexical": args.lexical_weight, "vector": args.vector_weight})
+            except (FileNotFoundError, ValueError) as e:
+                print(e)
+                return
+            for leg, reason in failures.items():
+                print(f"Without {leg} results: {reason}")
+            ranks = {leg: {doc_id: rank for rank, (doc_id, _) in enumerate(ranking, start=1)}
+                     for leg, ranking in rankings.items()}
+            for doc_id, score in results:
+                title = document_field(inverted_index.docmap, doc_id, "title", "")
+                found = ", ".join(f"{leg} #{leg_ranks[doc_id]}" for leg, leg_ranks in ranks.items() if doc_id in leg_ranks)
+                print(f"ID: {doc_id}, Title: {title}, Score: {score:.4f} ({found})")
+
+        case "search-batch":
+            try:
+                inverted_index = InvertedIndex()
+                inverted_index.load()
+            except FileNotFoundError as e:
+                print(e)
+                return
+            if args.queries_file == "-":
+                queries = [line.strip() for line in sys.stdin if line.strip()]
+            else:
+                with open(args.queries_file, "r", encoding="utf-8") as fh:
+                    queries = [line.strip() for line in fh if line.strip()]
+
+            all_results = inverted_index.search_batch(queries, args.limit)
+            output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+            try:
+                for query, results in zip(queries, all_results):
+                    hits = []
+                    for doc_id, score in results:
+                        title = document_field(inverted_index.docmap, doc_id, "title", "")
+                        hits.append({"id": doc_id, "title": title, "score": score})
+                    output.write(json.dumps({"query": query, "results": hits}) + "\n")
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+
+        case "serve":
+            try:
+                inverted_index = InvertedIndex()
+                inverted_index.load()
+            except FileNotFoundError as e:
+                print(e)
+                return
+            cache = ResultCache(args.cache_size, args.cache_ttl or None) if args.cache_size > 0 else None
+            server = QueryServer(QueryService(inverted_index, cache), args.host, args.port, args.threads)
+            print(f"Serving {len(inverted_index.docmap)} documents on http://{args.host}:{server.server_port}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                print("Shutting down query server.")
+            finally:
+                server.server_close()
 
 
         case _:
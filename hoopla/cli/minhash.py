@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+import hashlib
+import operator
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from typing import Dict, List, Sequence, Tuple
+
+# Signature length; the similarity estimate has a standard error of about sqrt(J(1 - J) / 64)
+MINHASH_BINS = 64
+# LSH bands of MINHASH_BINS / LSH_BANDS bins; documents sharing any band are candidates.
+# With 16 bands of 4, pairs at Jaccard 0.5 become candidates with p = 0.64 and at 0.8 with p > 0.999
+LSH_BANDS = 16
+DEFAULT_SIMILAR_LIMIT = 10
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+# Bins per band of the buckets dedupe compares documents in; 8 bands of 8 catch pairs at
+# Jaccard 0.8 with p = 0.77 and at 0.9 with p > 0.99, while rarely bucketing dissimilar ones
+DUPLICATE_BAND_ROWS = 8
+# Most recent group leaders of a bucket a document is compared with in dedupe; keeps big
+# buckets linear. Near-duplicates share several bands, so a leader beyond the window of one
+# bucket is usually within that of another
+DUPLICATE_WINDOW = 32
+
+EMPTY_BIN = 0xFFFFFFFF
+# Added per step when an empty bin borrows a neighbour's value (rotation densification)
+_ROTATION = 0x9E3779B1
+
+
+def term_hash(term: str) -> int:
+    """Stable 64-bit hash of an index term."""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def densify(row: List[int]) -> None:
+    """
+    Fill the empty bins of a one-permutation signature in place: each takes
+    the value of the nearest non-empty bin to its right (wrapping around),
+    offset by the distance, so equal term sets still get equal signatures.
+    """
+    filled = [value != EMPTY_BIN for value in row]
+    if all(filled) or not any(filled):
+        return
+    bins = len(row)
+    value, distance = EMPTY_BIN, 0
+    # Two passes right to left, so bins left of the first filled bin wrap around
+    for j in chain(range(bins - 1, -1, -1), range(bins - 1, -1, -1)):
+        if filled[j]:
+            value, distance = row[j], 0
+        else:
+            distance += 1
+            if value != EMPTY_BIN and row[j] == EMPTY_BIN:
+                row[j] = (value + distance * _ROTATION) & 0xFFFFFFFF
+
+
+def estimate_similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of two term sets: the fraction of equal signature bins."""
+    return sum(map(operator.eq, a, b)) / len(a) if len(a) else 0.0
+
+
+def band_key(signature: Sequence[int], band: int, rows: int) -> int:
+    """Key of one LSH band of a signature: the band number and a hash of its bins."""
+    values = array("I", signature[band * rows:(band + 1) * rows])
+    return band << 32 | zlib.crc32(values.tobytes())
+
+
+class MinHashIndex:
+    """
+    MinHash signatures of every document's set of index terms, with an LSH
+    banding index over them.
+
+    Signatures use one-permutation hashing: each term is hashed once and
+    keeps the minimum of the bin it falls into, so building costs one step
+    per posting instead of one per posting and bin. Two documents agree on
+    a bin with probability equal to the Jaccard similarity of their terms.
+
+    The LSH index lists every (band key, doc id) pair sorted by key, so the
+    documents sharing a band with a given one are a binary-searched run, and
+    finding similar documents only scores those candidates. A dedupe sweep
+    compares each document with a bounded number of others, so neither is
+    quadratic in the number of documents.
+
+    Attributes:
+        doc_ids: Sorted doc ids.
+        signatures: MINHASH_BINS values per entry of doc_ids; empty documents keep EMPTY_BIN.
+        band_keys: Sorted band_key() of every band of every non-empty document.
+        band_doc_ids: Doc id of each entry of band_keys.
+    """
+
+    # Attribute name -> array typecode, as stored in a segment; doc_ids is the segment's own
+    ARRAYS = (
+        ("signatures", "I"),
+        ("band_keys", "Q"),
+        ("band_doc_ids", "I"),
+    )
+
+    def __init__(self) -> None:
+        self.doc_ids = array("I")
+        self.signatures = array("I")
+        self.band_keys = array("Q")
+        self.band_doc_ids = array("I")
+
+    @classmethod
+    def from_index(cls, index, doc_ids: Sequence[int]) -> "MinHashIndex":
+        """Compute the signatures of doc_ids from the postings of a CompactIndex."""
+        minhash = cls()
+        minhash.doc_ids = array("I", doc_ids)
+        rows_of = {doc_id: i * MINHASH_BINS for i, doc_id in enumerate(doc_ids)}
+        signatures = array("I", [EMPTY_BIN]) * (len(doc_ids) * MINHASH_BINS)
+        for term_id, term in enumerate(index.terms):
+            hash_value = term_hash(term)
+            bin_offset, value = hash_value % MINHASH_BINS, hash_value >> 32
+            for doc_id, _ in index.postings(term_id).items():
+                slot = rows_of.get(doc_id)
+                if slot is not None and value < signatures[slot + bin_offset]:
+                    signatures[slot + bin_offset] = value
+
+        rows = MINHASH_BINS // LSH_BANDS
+        entries: List[Tuple[int, int]] = []
+        for i in range(len(doc_ids)):
+            start = i * MINHASH_BINS
+            row = signatures[start:start + MINHASH_BINS].tolist()
+            if row[0] == EMPTY_BIN and all(value == EMPTY_BIN for value in row):
+                continue
+            densify(row)
+            signatures[start:start + MINHASH_BINS] = array("I", row)
+            # Positions follow doc ids, so each run of equal keys lists its documents in id order
+            entries.extend((band_key(row, band, rows), i) for band in range(LSH_BANDS))
+        entries.sort()
+        minhash.signatures = signatures
+        minhash.band_keys = array("Q", (key for key, _ in entries))
+        minhash.band_doc_ids = array("I", (doc_ids[i] for _, i in entries))
+        return minhash
+
+    def signature(self, doc_id: int) -> Sequence[int]:
+        """Return the signature of a document; raises KeyError for unknown ids."""
+        i = bisect_left(self.doc_ids, doc_id)
+        if i == len(self.doc_ids) or self.doc_ids[i] != doc_id:
+            raise KeyError(doc_id)
+        return self.signatures[i * MINHASH_BINS:(i + 1) * MINHASH_BINS]
+
+    def similar(self, doc_id: int, limit: int = DEFAULT_SIMILAR_LIMIT,
+                threshold: float = 0.0) -> List[Tuple[int, float]]:
+        """
+        Return up to `limit` (doc_id, estimated Jaccard similarity) pairs of
+        the documents sharing an LSH band with doc_id and at least threshold
+        similar, most similar first. Raises KeyError for unknown ids.
+        """
+        signature = self.signature(doc_id)
+        if signature[0] == EMPTY_BIN and all(value == EMPTY_BIN for value in signature):
+            return []
+        rows = MINHASH_BINS // LSH_BANDS
+        candidates = set()
+        for band in range(LSH_BANDS):
+            key = band_key(signature, band, rows)
+            lo = bisect_left(self.band_keys, key)
+            hi = bisect_right(self.band_keys, key, lo)
+            candidates.update(self.band_doc_ids[lo:hi])
+        candidates.discard(doc_id)
+        scored = []
+        for candidate in candidates:
+            similarity = estimate_similarity(signature, self.signature(candidate))
+            if similarity >= threshold:
+                scored.append((candidate, similarity))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:max(limit, 0)]
+
+    def duplicates(self, threshold: float = DEFAULT_DUPLICATE_THRESHOLD) -> List[List[Tuple[int, float]]]:
+        """
+        Return groups of near-duplicate documents, largest first. A group is
+        its lowest doc id (the leader) followed by the documents at least
+        threshold similar to it, each as (doc_id, estimated similarity to the
+        leader); a document joins the lowest such leader. Groups thus never
+        chain through intermediate documents into clusters of dissimilar ones.
+
+        Documents are visited in id order and each is only compared with the
+        last DUPLICATE_WINDOW leaders of its buckets, so the sweep is linear
+        in the number of documents. The buckets band the signatures into
+        DUPLICATE_BAND_ROWS rows rather than using the LSH index, whose wider
+        buckets of merely similar documents would fill the window.
+        """
+        bands = MINHASH_BINS // DUPLICATE_BAND_ROWS
+        # band_key() of a bucket -> the leaders met in it so far, in id order
+        bucket_leaders: Dict[int, List[int]] = {}
+        leader_signatures: Dict[int, Sequence[int]] = {}
+        groups: Dict[int, List[Tuple[int, float]]] = {}
+        for i, doc_id in enumerate(self.doc_ids):
+            signature = self.signatures[i * MINHASH_BINS:(i + 1) * MINHASH_BINS]
+            if signature[0] == EMPTY_BIN and all(value == EMPTY_BIN for value in signature):
+                continue
+            keys = [band_key(signature, band, DUPLICATE_BAND_ROWS) for band in range(bands)]
+            candidates = set()
+            for key in keys:
+                candidates.update(bucket_leaders.get(key, ())[-DUPLICATE_WINDOW:])
+            for leader in sorted(candidates):
+                similarity = estimate_similarity(signature, leader_signatures[leader])
+                if similarity >= threshold:
+                    groups.setdefault(leader, [(leader, 1.0)]).append((doc_id, similarity))
+                    break
+            else:
+                leader_signatures[doc_id] = signature
+                for key in keys:
+                    bucket_leaders.setdefault(key, []).append(doc_id)
+        return sorted(groups.values(), key=lambda group: (-len(group), group[0][0]))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from text_analysis import get_analyzer
+
+# Term -> sorted token positions of one document
+TermPositions = Dict[str, List[int]]
+
+# A partial index is the (index, term_positions, token_starts) triple produced for one shard
+PartialIndex = Tuple[Dict[str, set[int]], Dict[int, TermPositions], Dict[int, array]]
+
+
+def document_text(record: Dict[str, Any]) -> str:
+    """Return the text that gets indexed for a movie record: title + description."""
+    title = record.get("title", "")
+    description = record.get("description", "")
+    return f"{title} {description}"
+
+
+def analyze_shard(documents: List[Tuple[int, str]], stopwords_path: Optional[Path] = None) -> PartialIndex:
+    """
+    Build a partial index for a shard of (doc_id, text) pairs.
+    Runs inside a worker process, which keeps its own shared analyzer over
+    the given stopwords list (default: the bundled one).
+    """
+    analyzer = get_analyzer(stopwords_path)
+    index: Dict[str, set[int]] = {}
+    term_positions: Dict[int, TermPositions] = {}
+    token_starts: Dict[int, array] = {}
+    for doc_id, text in documents:
+        analyzed, token_starts[doc_id] = analyzer.analyze_offsets(text)
+        positions = term_positions_of(analyzed)
+        term_positions[doc_id] = positions
+        for token in positions:
+            if token not in index:
+                index[token] = set()
+            index[token].add(doc_id)
+    return index, term_positions, token_starts
+
+
+def term_positions_of(analyzed: Iterable[Tuple[str, int]]) -> TermPositions:
+    """Group (stem, position) pairs from TextAnalyzer.analyze_positions by stem."""
+    positions: TermPositions = {}
+    for token, position in analyzed:
+        if token not in positions:
+            positions[token] = []
+        positions[token].append(position)
+    return positions
+
+
+def split_shards(documents: List[Tuple[int, str]], shards: int) -> List[List[Tuple[int, str]]]:
+    """Split documents into at most `shards` contiguous, nearly equal chunks."""
+    shards = max(1, min(shards, len(documents)))
+    size, remainder = divmod(len(documents), shards)
+    chunks = []
+    start = 0
+    for i in range(shards):
+        end = start + size + (1 if i < remainder else 0)
+        chunks.append(documents[start:end])
+        start = end
+    return chunks
+
+
+def build_partial_indexes(records: Iterable[Dict[str, Any]], workers: int,
+                          stopwords_path: Optional[Path] = None) -> List[PartialIndex]:
+    """
+    Analyze records in a process pool and return one partial index per shard,
+    in corpus order. Only (doc_id, text) pairs are sent to the workers, which
+    analyze with the stopwords at stopwords_path like the calling index does.
+    """
+    # joblib is only imported when a parallel build actually runs
+    from joblib import Parallel, delayed
+
+    documents = [(int(record.get("id", 0)), document_text(record)) for record in records]
+    if not documents:
+        return []
+    shards = split_shards(documents, workers)
+    return Parallel(n_jobs=workers)(delayed(analyze_shard)(shard, stopwords_path) for shard in shards)
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+
+import heapq
+import sys
+from array import array
+from bisect import bisect_right
+from typing import AbstractSet, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+# Every SKIP_INTERVAL postings the doc id is stored in full instead of as a
+# delta, and a skip pointer (first doc id, byte offset) is recorded for it.
+SKIP_INTERVAL = 64
+
+# Returned by cursors once a posting list is exhausted
+NO_MORE_DOCS = sys.maxsize
+
+# (doc_id, positions) pair of a positional posting; tf is len(positions)
+Posting = Tuple[int, Sequence[int]]
+
+
+def encode_varint(value: int, out: bytearray) -> None:
+    """Append an unsigned integer to `out` using 7-bit variable length encoding."""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, pos: int) -> Tuple[int, int]:
+    """Decode an unsigned varint from `data` at `pos`, returning (value, next_pos)."""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def skip_varints(data, pos: int, count: int) -> int:
+    """Return the position just after `count` varints starting at `pos`."""
+    while count:
+        if data[pos] < 0x80:
+            count -= 1
+        pos += 1
+    return pos
+
+
+def decode_positions(data, pos: int, tf: int) -> Tuple[List[int], int]:
+    """Decode the tf delta encoded positions of one posting, returning (positions, next_pos)."""
+    positions = []
+    position = 0
+    for _ in range(tf):
+        delta, pos = decode_varint(data, pos)
+        position += delta
+        positions.append(position)
+    return positions, pos
+
+
+class PostingList:
+    """
+    Read-only view of one term's postings inside a CompactIndex.
+
+    Iterating yields doc ids in ascending order; items() yields (doc_id, tf)
+    and positional_items() yields (doc_id, positions).
+    """
+
+    __slots__ = ("data", "start", "end", "doc_freq", "skip_doc_ids", "skip_offsets", "skip_lo", "skip_hi",
+                 "positions", "skip_position_offsets")
+
+    def __init__(self, data, start: int, end: int, doc_freq: int,
+                 skip_doc_ids, skip_offsets, skip_lo: int, skip_hi: int,
+                 positions, skip_position_offsets) -> None:
+        self.data = data
+        self.start = start
+        self.end = end
+        self.doc_freq = doc_freq
+        self.skip_doc_ids = skip_doc_ids
+        self.skip_offsets = skip_offsets
+        self.skip_lo = skip_lo
+        self.skip_hi = skip_hi
+        self.positions = positions
+        self.skip_position_offsets = skip_position_offsets
+
+    def __len__(self) -> int:
+        return self.doc_freq
+
+    def __iter__(self) -> Iterator[int]:
+        for doc_id, _ in self.items():
+            yield doc_id
+
+    def __contains__(self, doc_id: int) -> bool:
+        return self.tf(doc_id) > 0
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        """Decode the postings, yielding (doc_id, term frequency) pairs."""
+        data = self.data
+        pos = self.start
+        end = self.end
+        doc_id = 0
+        i = 0
+        while pos < end:
+            if i % SKIP_INTERVAL == 0:
+                doc_id = 0
+            delta, pos = decode_varint(data, pos)
+            tf, pos = decode_varint(data, pos)
+            doc_id += delta
+            i += 1
+            yield doc_id, tf
+
+    def positional_items(self) -> Iterator[Posting]:
+        """Decode the postings, yielding (doc_id, positions) pairs."""
+        if self.skip_lo == self.skip_hi:
+            return
+        positions = self.positions
+        position_pos = self.skip_position_offsets[self.skip_lo]
+        for doc_id, tf in self.items():
+            doc_positions, position_pos = decode_positions(positions, position_pos, tf)
+            yield doc_id, doc_positions
+
+    def doc_ids(self) -> List[int]:
+        """Return all doc ids as a sorted list."""
+        return list(self)
+
+    def tf(self, doc_id: int) -> int:
+        """Return the term frequency for doc_id, or 0 if the doc is not in the list."""
+        block = bisect_right(self.skip_doc_ids, doc_id, self.skip_lo, self.skip_hi) - 1
+        if block < self.skip_lo:
+            return 0
+        data = self.data
+        pos = self.skip_offsets[block]
+        end = self.end
+        current = 0
+        for _ in range(SKIP_INTERVAL):
+            if pos >= end:
+                break
+            delta, pos = decode_varint(data, pos)
+            tf, pos = decode_varint(data, pos)
+            current += delta
+            if current == doc_id:
+                return tf
+            if current > doc_id:
+                break
+        return 0
+
+    def cursor(self) -> "PostingCursor":
+        """Return a cursor positioned before the first posting."""
+        return PostingCursor(self)
+
+
+class PostingCursor:
+    """
+    Forward-only cursor over a PostingList with skip-pointer based advance().
+
+    doc_id is NO_MORE_DOCS once the list is exhausted. Positions are only
+    decoded when positions() is called for the current posting.
+    """
+
+    __slots__ = ("postings", "doc_id", "tf", "pos", "i", "block_positions")
+
+    def __init__(self, postings: PostingList) -> None:
+        self.postings = postings
+        self.doc_id = -1
+        self.tf = 0
+        self.pos = postings.start
+        self.i = 0
+        # Number of positions stored before the current posting in its block
+        self.block_positions = 0
+
+    @property
+    def cost(self) -> int:
+        """Upper bound on the number of doc ids this cursor yields."""
+        return self.postings.doc_freq
+
+    def next(self) -> int:
+        """Move to the next posting and return its doc id."""
+        postings = self.postings
+        if self.pos >= postings.end:
+            self.doc_id = NO_MORE_DOCS
+            self.tf = 0
+            return NO_MORE_DOCS
+        if self.i % SKIP_INTERVAL == 0:
+            self.doc_id = 0
+            self.block_positions = 0
+        else:
+            self.block_positions += self.tf
+        delta, self.pos = decode_varint(postings.data, self.pos)
+        self.tf, self.pos = decode_varint(postings.data, self.pos)
+        self.doc_id += delta
+        self.i += 1
+        return self.doc_id
+
+    def advance(self, target: int) -> int:
+        """Move to the first posting with doc id >= target and return its doc id."""
+        if self.doc_id >= target:
+            return self.doc_id
+        postings = self.postings
+        current_block = postings.skip_lo + max(self.i - 1, 0) // SKIP_INTERVAL
+        block = bisect_right(postings.skip_doc_ids, target, current_block, postings.skip_hi) - 1
+        if block > current_block or (self.i == 0 and block >= postings.skip_lo):
+            # Jump straight to the restart point of the block that may hold target
+            self.pos = postings.skip_offsets[block]
+            self.i = (block - postings.skip_lo) * SKIP_INTERVAL
+        doc_id = self.next()
+        while doc_id < target:
+            doc_id = self.next()
+        return doc_id
+
+    def positions(self) -> List[int]:
+        """Return the sorted token positions of the current posting."""
+        postings = self.postings
+        block = postings.skip_lo + (self.i - 1) // SKIP_INTERVAL
+        pos = skip_varints(postings.positions, postings.skip_position_offsets[block], self.block_positions)
+        return decode_positions(postings.positions, pos, self.tf)[0]
+
+
+def intersect(posting_lists: Iterable[PostingList]) -> List[int]:
+    """
+    Return the sorted doc ids present in every posting list.
+    Starts from the rarest list and uses skip pointers to leapfrog the others.
+    """
+    lists = sorted(posting_lists, key=len)
+    if not lists or len(lists[0]) == 0:
+        return []
+    cursors = [postings.cursor() for postings in lists]
+    lead, others = cursors[0], cursors[1:]
+    result = []
+    doc_id = lead.next()
+    while doc_id != NO_MORE_DOCS:
+        candidate = doc_id
+        for cursor in others:
+            candidate = cursor.advance(doc_id)
+            if candidate != doc_id:
+                break
+        if candidate == doc_id:
+            result.append(doc_id)
+            doc_id = lead.next()
+        elif candidate == NO_MORE_DOCS:
+            break
+        else:
+            doc_id = lead.advance(candidate)
+    return result
+
+
+def merge_indexes(indexes: List["CompactIndex"]) -> "CompactIndex":
+    """
+    K-way merge several CompactIndexes with disjoint doc ids into one,
+    streaming postings term by term in lexicon order.
+    """
+    def unique_terms() -> Iterator[str]:
+        previous = None
+        for term in heapq.merge(*(index.terms for index in indexes)):
+            if term != previous:
+                yield term
+                previous = term
+
+    def merged_postings(term: str) -> Iterator[Posting]:
+        lists = (index.get(term) for index in indexes)
+        return heapq.merge(*(postings.positional_items() for postings in lists if postings is not None),
+                           key=lambda posting: posting[0])
+
+    return CompactIndex.from_postings((term, merged_postings(term)) for term in unique_terms())
+
+
+class CompactIndex:
+    """
+    Array-backed inverted index.
+
+    Attributes:
+        terms: Sorted term lexicon; a term's position is its term id.
+        term_ids: Mapping from term -> term id (rebuilt on load, not persisted).
+        doc_freqs: Number of documents per term id.
+        offsets: Byte offset of each term's postings in data (plus an end sentinel).
+        skip_starts: Index of each term's first skip pointer (plus an end sentinel).
+        skip_doc_ids / skip_offsets: First doc id and byte offset of every posting block.
+        skip_position_offsets: Byte offset in positions of every posting block.
+        data: Varint encoded postings, (doc id delta, tf) per posting.
+        positions: Varint encoded token positions, tf position deltas per posting,
+            in the same order as data.
+    """
+
+    def __init__(self) -> None:
+        self.terms: List[str] = []
+        self.term_ids: Dict[str, int] = {}
+        self.doc_freqs = array('I')
+        self.offsets = array('Q', [0])
+        self.skip_starts = array('I', [0])
+        self.skip_doc_ids = array('I')
+        self.skip_offsets = array('Q')
+        self.skip_position_offsets = array('Q')
+        self.data = b""
+        self.positions = b""
+
+    @classmethod
+    def from_postings(cls, postings: Iterable[Tuple[str, Iterable[Posting]]]) -> "CompactIndex":
+        """
+        Build from (term, [(doc_id, positions), ...]) pairs given in ascending
+        term order, each with doc ids and positions in ascending order. Terms
+        without postings are dropped.
+        """
+        compact = cls()
+        data = bytearray()
+        positions = bytearray()
+        for term, items in postings:
+            count = 0
+            previous = 0
+            for doc_id, doc_positions in items:
+                if count % SKIP_INTERVAL == 0:
+                    previous = 0
+                    compact.skip_doc_ids.append(doc_id)
+                    compact.skip_offsets.append(len(data))
+                    compact.skip_position_offsets.append(len(positions))
+                encode_varint(doc_id - previous, data)
+                encode_varint(len(doc_positions), data)
+                previous_position = 0
+                for position in doc_positions:
+                    encode_varint(position - previous_position, positions)
+                    previous_position = position
+                previous = doc_id
+                count += 1
+            if count == 0:
+                continue
+            compact.terms.append(term)
+            compact.doc_freqs.append(count)
+            compact.offsets.append(len(data))
+            compact.skip_starts.append(len(compact.skip_doc_ids))
+        compact.data = bytes(data)
+        compact.positions = bytes(positions)
+        compact.term_ids = {term: term_id for term_id, term in enumerate(compact.terms)}
+        return compact
+
+    @classmethod
+    def from_dicts(cls, index: Mapping[str, Iterable[int]],
+                   term_positions: Mapping[int, Mapping[str, Sequence[int]]]) -> "CompactIndex":
+        """Build from the term -> doc ids and doc id -> term -> positions build-time dicts."""
+        return cls.from_postings(
+            (term, ((doc_id, term_positions[doc_id][term]) for doc_id in sorted(index[term])))
+            for term in sorted(index)
+        )
+
+    def merged(self, removed: AbstractSet[int], index: Mapping[str, Iterable[int]],
+               term_positions: Mapping[int, Mapping[str, Sequence[int]]]) -> "CompactIndex":
+        """
+        Return a new CompactIndex with the postings of `removed` doc ids dropped
+        and the buffered (index, term_positions) documents merged in.
+        Buffered doc ids must not overlap the surviving postings of this index.
+        """
+        def merged_postings(term: str) -> Iterator[Posting]:
+            existing = self.get(term)
+            if existing is None:
+                kept: Iterable[Posting] = ()
+            elif removed:
+                kept = (posting for posting in existing.positional_items() if posting[0] not in removed)
+            else:
+                kept = existing.positional_items()
+            added = ((doc_id, term_positions[doc_id][term]) for doc_id in sorted(index.get(term, ())))
+            return heapq.merge(kept, added, key=lambda posting: posting[0])
+
+        terms = heapq.merge(self.terms, sorted(term for term in index if term not in self))
+        return CompactIndex.from_postings((term, merged_postings(term)) for term in terms)
+
+    def __getstate__(self) -> Dict[str, object]:
+        state = self.__dict__.copy()
+        del state["term_ids"]
+        return state
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        self.__dict__.update(state)
+        self.term_ids = {term: term_id for term_id, term in enumerate(self.terms)}
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __contains__(self, term: str) -> bool:
+        return self.term_id(term) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.terms)
+
+    def __getitem__(self, term: str) -> PostingList:
+        postings = self.get(term)
+        if postings is None:
+            raise KeyError(term)
+        return postings
+
+    def term_id(self, term: str) -> Optional[int]:
+        """Return the term id of term, or None if the term is unknown."""
+        return self.term_ids.get(term)
+
+    def get(self, term: str, default=None):
+        """Return the PostingList for term, or default if the term is unknown."""
+        term_id = self.term_id(term)
+        if term_id is None:
+            return default
+        return self.postings(term_id)
+
+    def postings(self, term_id: int) -> PostingList:
+        """Return the PostingList for a term id."""
+        return PostingList(
+            self.data, self.offsets[term_id], self.offsets[term_id + 1], self.doc_freqs[term_id],
+            self.skip_doc_ids, self.skip_offsets, self.skip_starts[term_id], self.skip_starts[term_id + 1],
+            self.positions, self.skip_position_offsets,
+        )
+
+    def doc_freq(self, term: str) -> int:
+        """Return the number of documents containing term."""
+        term_id = self.term_id(term)
+        return 0 if term_id is None else self.doc_freqs[term_id]
+
+    def tf(self, term: str, doc_id: int) -> int:
+        """Return the frequency of term in doc_id, or 0."""
+        postings = self.get(term)
+        return 0 if postings is None else postings.tf(doc_id)
+
+    def nbytes(self) -> int:
+        """Approximate size of the encoded arrays in bytes."""
+        arrays = (self.doc_freqs, self.offsets, self.skip_starts, self.skip_doc_ids, self.skip_offsets,
+                  self.skip_position_offsets)
+        return len(self.data) + len(self.positions) + sum(arr.itemsize * len(arr) for arr in arrays)
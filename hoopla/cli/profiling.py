@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+StatsHook = Callable[[Dict[str, Any]], None]
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far, or None if unknown."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class _NullStage:
+    """Context manager used while profiling is off; costs one method call."""
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "Profiler", name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.profiler.depth.value = getattr(self.profiler.depth, "value", 0) + 1
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = time.perf_counter() - self.start
+        self.profiler.depth.value -= 1
+        self.profiler.record(self.name, elapsed, outermost=self.profiler.depth.value == 0)
+
+
+class Profiler:
+    """
+    Accumulates wall time and call counts per named stage.
+
+    Stages may nest (analyze runs inside search, for instance), so stage
+    times are inclusive and do not add up to the wall time. The memory
+    high-water mark is sampled when an outermost stage ends, which keeps
+    stages that run per document cheap.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        # name -> [calls, seconds, peak RSS bytes seen at the end of the stage]
+        self.stages: Dict[str, List[Any]] = {}
+        self.depth = threading.local()
+        self.__lock = threading.Lock()
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def record(self, name: str, seconds: float, outermost: bool = False) -> None:
+        """Add one call of `seconds` to a stage."""
+        with self.__lock:
+            entry = self.stages.get(name)
+            if entry is None:
+                entry = self.stages[name] = [0, 0.0, None]
+            entry[0] += 1
+            entry[1] += seconds
+            if outermost:
+                entry[2] = peak_rss_bytes()
+
+    def report(self, command: Optional[str] = None) -> Dict[str, Any]:
+        """Return the collected timings as a JSON-serializable dict."""
+        with self.__lock:
+            stages = {name: {"calls": calls, "seconds": seconds, "peak_rss_bytes": peak}
+                      for name, (calls, seconds, peak) in self.stages.items()}
+        return {
+            "command": command,
+            "wall_seconds": time.perf_counter() - self.started,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": stages,
+        }
+
+
+_active: Optional[Profiler] = None
+_hooks: List[StatsHook] = []
+
+
+def enable() -> Profiler:
+    """Start collecting stage timings for this process and return the profiler."""
+    global _active
+    _active = Profiler()
+    return _active
+
+
+def active() -> Optional[Profiler]:
+    """Return the running profiler, or None if profiling is off."""
+    return _active
+
+
+def stage(name: str):
+    """
+    Context manager timing a stage, e.g. `with profiling.stage("load"): ...`.
+    Does nothing unless profiling has been enabled.
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(name)
+
+
+def add_hook(hook: StatsHook) -> None:
+    """Register a callback that receives every report produced by finish()."""
+    _hooks.append(hook)
+
+
+def finish(command: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Stop profiling, pass the report to the registered hooks and return it.
+    Returns None if profiling was not enabled.
+    """
+    global _active
+    if _active is None:
+        return None
+    report = _active.report(command)
+    _active = None
+    for hook in _hooks:
+        hook(report)
+    return report
+
+
+def format_table(report: Dict[str, Any]) -> str:
+    """Render a report as a fixed-width table, slowest stage first."""
+    lines = [f"{'Stage':<12} {'Calls':>8} {'Total ms':>11} {'Mean ms':>10} {'Peak RSS MB':>12}"]
+    stages = sorted(report["stages"].items(), key=lambda item: item[1]["seconds"], reverse=True)
+    for name, entry in stages:
+        peak = entry["peak_rss_bytes"]
+        lines.append(f"{name:<12} {entry['calls']:>8} {1000 * entry['seconds']:>11.2f} "
+                     f"{1000 * entry['seconds'] / entry['calls']:>10.3f} "
+                     f"{'-' if peak is None else f'{peak / 2 ** 20:.1f}':>12}")
+    peak = report["peak_rss_bytes"]
+    lines.append(f"Wall time {1000 * report['wall_seconds']:.2f} ms, peak RSS "
+                 f"{'unknown' if peak is None else f'{peak / 2 ** 20:.1f} MB'} (stage times are inclusive)")
+    return "\n".join(lines)
+
+
+def print_report(report: Dict[str, Any], output_format: str = "table") -> None:
+    """Print a report to stderr, so command output on stdout is unaffected."""
+    if output_format == "json":
+        print(json.dumps(report), file=sys.stderr)
+    else:
+        print(format_table(report), file=sys.stderr)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+import http.client
+import json
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+from docstore import document_field
+import profiling
+from result_cache import ResultCache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_THREADS = 8
+CLIENT_TIMEOUT = 30.0
+
+
+class QueryService:
+    """
+    Answers the query server's requests (see the endpoint table in the
+    README) against a loaded InvertedIndex.
+
+    The same service backs local CLI commands and the query server, so both
+    return identical results. With a ResultCache, search results are reused
+    until the index generation changes.
+    """
+
+    def __init__(self, inverted_index, cache: Optional[ResultCache] = None) -> None:
+        self.inverted_index = inverted_index
+        self.cache = cache
+
+    def search(self, query: str, limit: int = 5, fuzzy: bool = False,
+               snippets: bool = False) -> List[Dict[str, Any]]:
+        """
+        Return the top `limit` BM25 results as id/title/score dicts, with a
+        highlighted description snippet per result if snippets is set.
+        """
+        if self.cache is not None:
+            # Queries with the same set of stems rank identically
+            stems = sorted(set(self.inverted_index.analyzer.analyze(query)))
+            key = f"search:{limit}:{int(fuzzy)}:{int(snippets)}:{' '.join(stems)}"
+            generation = self.inverted_index.generation
+            cached = self.cache.get(key, generation)
+            if cached is not None:
+                return cached
+
+        ranked = self.inverted_index.search(query, limit, fuzzy)
+        with profiling.stage("render"):
+            results = []
+            docmap = self.inverted_index.docmap
+            for doc_id, score in ranked:
+                results.append({"id": doc_id, "title": document_field(docmap, doc_id, "title", ""), "score": score})
+        if snippets and ranked:
+            snippet_texts = self.inverted_index.snippets(query, [doc_id for doc_id, _ in ranked])
+            for result, snippet in zip(results, snippet_texts):
+                result["snippet"] = snippet
+        if self.cache is not None:
+            self.cache.put(key, generation, results)
+        return results
+
+    def fuzzy(self, term: str, max_distance: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the indexed terms close to term as term/distance/doc_freq dicts."""
+        index = self.inverted_index.index
+        return [{"term": match, "distance": distance, "doc_freq": index.doc_freq(match)}
+                for match, distance in self.inverted_index.fuzzy_terms(term, max_distance)]
+
+    def partial(self, query: str, limit: int = 10) -> Dict[str, Any]:
+        """Return the number of partial title matches and the first `limit` as id/title dicts."""
+        return self.__matches(self.inverted_index.partial_search(query), limit)
+
+    def boolean(self, query: str, limit: int = 10) -> Dict[str, Any]:
+        """Return the number of matches of a boolean query and the first `limit` as id/title dicts."""
+        return self.__matches(self.inverted_index.boolean_search(query), limit)
+
+    def __matches(self, doc_ids: List[int], limit: int) -> Dict[str, Any]:
+        with profiling.stage("render"):
+            results = []
+            docmap = self.inverted_index.docmap
+            for doc_id in doc_ids[:max(limit, 0)]:
+                results.append({"id": doc_id, "title": document_field(docmap, doc_id, "title", "")})
+            return {"total": len(doc_ids), "results": results}
+
+    def suggest(self, prefix: str, limit: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+        """Return title and word completions of a typed prefix as text/count dicts."""
+        completions = self.inverted_index.suggest(prefix, limit)
+        return {kind: [{"text": text, "count": count} for text, count in matches]
+                for kind, matches in completions.items()}
+
+    def similar(self, doc_id: int, limit: int = 10, threshold: float = 0.0) -> List[Dict[str, Any]]:
+        """Return the documents most like doc_id as id/title/similarity dicts."""
+        similar = self.inverted_index.similar_documents(doc_id, limit, threshold)
+        docmap = self.inverted_index.docmap
+        return [{"id": other, "title": document_field(docmap, other, "title", ""), "similarity": similarity}
+                for other, similarity in similar]
+
+    def dedupe(self, threshold: float = 0.8, limit: int = 10) -> Dict[str, Any]:
+        """
+        Return the number of near-duplicate groups and the first `limit`,
+        each a list of id/title/similarity dicts led by its lowest id.
+        """
+        groups = self.inverted_index.near_duplicates(threshold)
+        with profiling.stage("render"):
+            docmap = self.inverted_index.docmap
+            return {"total": len(groups),
+                    "groups": [[{"id": doc_id, "title": document_field(docmap, doc_id, "title", ""),
+                                 "similarity": similarity} for doc_id, similarity in group]
+                               for group in groups[:max(limit, 0)]]}
+
+    def tf(self, doc_id: int, term: str) -> int:
+        """Return the frequency of term in doc_id."""
+        if doc_id not in self.inverted_index.docmap:
+            raise ValueError(f"Document ID {doc_id} not found in docmap.")
+        return self.inverted_index.get_tf(doc_id, term)
+
+    def idf(self, term: str) -> Dict[str, Any]:
+        """Return the document frequency and IDF of a single term."""
+        stemmed_term = self.inverted_index.analyzer.analyze_term(term)
+        doc_freq = self.inverted_index.index.doc_freq(stemmed_term)
+        idf = self.inverted_index.get_idf(term) if doc_freq else 0.0
+        return {"doc_freq": doc_freq, "idf": idf}
+
+    def tfidf(self, doc_id: int, terms: str) -> float:
+        """Return the summed TF-IDF of space-separated terms in doc_id."""
+        tfidf = 0.0
+        for term in terms.split():
+            tfidf += self.inverted_index.get_tf(doc_id, term) * self.inverted_index.get_idf(term)
+        return tfidf
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Return hits, misses, size and hit rate of the result cache."""
+        if self.cache is None:
+            return ResultCache(0).stats()
+        return self.cache.stats()
+
+    def close(self) -> None:
+        """Persist the result cache, if it has a file, and close the index."""
+        if self.cache is not None:
+            self.cache.save()
+        # Unmaps an InvertedIndex's segment, or stops a sharded index's worker processes
+        close_index = getattr(self.inverted_index, "close", None)
+        if close_index is not None:
+            close_index()
+
+    def __enter__(self) -> "QueryService":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class QueryClient:
+    """
+    Thin HTTP client with the same interface as QueryService.
+    Requests the server rejects are raised as ValueError, like local calls;
+    a server that fails or cannot be reached raises ConnectionError.
+    """
+
+    def __init__(self, url: str, timeout: float = CLIENT_TIMEOUT) -> None:
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def __get(self, endpoint: str, **params: Any) -> Any:
+        query = urllib.parse.urlencode(params)
+        try:
+            with profiling.stage("request"), \
+                    urllib.request.urlopen(f"{self.url}/{endpoint}?{query}", timeout=self.timeout) as response:
+                return json.loads(response.read())["result"]
+        except urllib.error.HTTPError as e:
+            with e:
+                message = _error_message(e)
+            if e.code < 500:
+                raise ValueError(message) from None
+            raise ConnectionError(f"Query server at {self.url} failed: {message}") from None
+        except urllib.error.URLError as e:
+            raise ConnectionError(f"Could not reach query server at {self.url}: {e.reason}") from None
+        except (OSError, http.client.HTTPException) as e:
+            # Timeouts and connections dropped mid-response
+            raise ConnectionError(f"Could not reach query server at {self.url}: {str(e) or type(e).__name__}") from None
+
+    def search(self, query: str, limit: int = 5, fuzzy: bool = False,
+               snippets: bool = False) -> List[Dict[str, Any]]:
+        return self.__get("search", q=query, limit=limit, fuzzy=int(fuzzy), snippets=int(snippets))
+
+    def fuzzy(self, term: str, max_distance: Optional[int] = None) -> List[Dict[str, Any]]:
+        if max_distance is None:
+            return self.__get("fuzzy", term=term)
+        return self.__get("fuzzy", term=term, max_distance=max_distance)
+
+    def partial(self, query: str, limit: int = 10) -> Dict[str, Any]:
+        return self.__get("partial", q=query, limit=limit)
+
+    def boolean(self, query: str, limit: int = 10) -> Dict[str, Any]:
+        return self.__get("boolean", q=query, limit=limit)
+
+    def suggest(self, prefix: str, limit: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+        return self.__get("suggest", q=prefix, limit=limit)
+
+    def similar(self, doc_id: int, limit: int = 10, threshold: float = 0.0) -> List[Dict[str, Any]]:
+        return self.__get("similar", doc_id=doc_id, limit=limit, threshold=threshold)
+
+    def dedupe(self, threshold: float = 0.8, limit: int = 10) -> Dict[str, Any]:
+        return self.__get("dedupe", threshold=threshold, limit=limit)
+
+    def tf(self, doc_id: int, term: str) -> int:
+        return self.__get("tf", doc_id=doc_id, term=term)
+
+    def idf(self, term: str) -> Dict[str, Any]:
+        return self.__get("idf", term=term)
+
+    def tfidf(self, doc_id: int, terms: str) -> float:
+        return self.__get("tfidf", doc_id=doc_id, terms=terms)
+
+    def cache_stats(self) -> Dict[str, float]:
+        return self.__get("cache")
+
+    def close(self) -> None:
+        """The server owns the result cache, so there is nothing to persist."""
+
+    def __enter__(self) -> "QueryClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _error_message(error: urllib.error.HTTPError) -> str:
+    """The error the server sent as JSON, or the HTTP status if the body has none."""
+    try:
+        return json.loads(error.read())["error"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return f"HTTP {error.code} {error.reason}"
+
+
+def _routes(service: QueryService) -> Dict[str, Callable[[Dict[str, str]], Any]]:
+    """Map endpoint paths to handlers taking the decoded query parameters."""
+    return {
+        "/search": lambda params: service.search(params["q"], int(params.get("limit", 5)),
+                                                 params.get("fuzzy", "0") == "1",
+                                                 params.get("snippets", "0") == "1"),
+        "/fuzzy": lambda params: service.fuzzy(params["term"], _optional_int(params.get("max_distance"))),
+        "/partial": lambda params: service.partial(params["q"], int(params.get("limit", 10))),
+        "/boolean": lambda params: service.boolean(params["q"], int(params.get("limit", 10))),
+        # An empty prefix is dropped from the query string
+        "/suggest": lambda params: service.suggest(params.get("q", ""), int(params.get("limit", 5))),
+        "/similar": lambda params: service.similar(int(params["doc_id"]), int(params.get("limit", 10)),
+                                                   float(params.get("threshold", 0.0))),
+        "/dedupe": lambda params: service.dedupe(float(params.get("threshold", 0.8)), int(params.get("limit", 10))),
+        "/tf": lambda params: service.tf(int(params["doc_id"]), params["term"]),
+        "/idf": lambda params: service.idf(params["term"]),
+        "/tfidf": lambda params: service.tfidf(int(params["doc_id"]), params["terms"]),
+        "/cache": lambda params: service.cache_stats(),
+        "/health": lambda params: "ok",
+    }
+
+
+def _optional_int(value: Optional[str]) -> Optional[int]:
+    return None if value is None else int(value)
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """Serves the GET endpoints of the README's endpoint table as JSON."""
+
+    server: "QueryServer"
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        handler = self.server.routes.get(url.path)
+        if handler is None:
+            self.__send_json(404, {"error": f"Unknown endpoint {url.path}"})
+            return
+        params = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        try:
+            result = handler(params)
+        except KeyError as e:
+            self.__send_json(400, {"error": f"Missing parameter {e.args[0]}"})
+        except ValueError as e:
+            self.__send_json(400, {"error": str(e)})
+        except Exception as e:
+            self.log_error("Error handling %s: %r", self.path, e)
+            self.__send_json(500, {"error": f"Internal server error: {type(e).__name__}"})
+        else:
+            self.__send_json(200, {"result": result})
+
+    def __send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class QueryServer(HTTPServer):
+    """
+    HTTP server that keeps one QueryService resident and handles requests
+    on a bounded thread pool.
+    """
+
+    def __init__(self, service: QueryService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 threads: int = DEFAULT_THREADS) -> None:
+        super().__init__((host, port), QueryRequestHandler)
+        self.routes = _routes(service)
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address) -> None:
+        self.executor.submit(self.__process_request, request, client_address)
+
+    def __process_request(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+# A small head of queries repeats constantly, so a thousand entries go a long way
+DEFAULT_RESULT_CACHE_SIZE = 1024
+# Entries also expire after this many seconds, even if the index is unchanged
+DEFAULT_RESULT_CACHE_TTL = 3600.0
+RESULT_CACHE_FILENAME = "results.json"
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of query results, tagged with the generation of the
+    index they were computed from.
+
+    An entry is only returned for the same index generation and within ttl
+    seconds of being stored (ttl=None never expires); anything else counts
+    as a miss and the entry is dropped. Lookups are thread-safe, so one cache
+    can be shared by the query server's worker threads. With a path, save()
+    persists the entries and hit/miss counters so separate CLI runs share them.
+    The entries are only rewritten when some were added or dropped, so a
+    cache hit only writes the small counters file next to them.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_RESULT_CACHE_SIZE,
+                 ttl: Optional[float] = DEFAULT_RESULT_CACHE_TTL, path: Optional[Path] = None) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        # key -> (generation, stored_at, value), least recently used first
+        self.entries: "OrderedDict[str, Tuple[int, float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        # True once entries were added or dropped since the last load or save
+        self.__changed = False
+        # Counters as last loaded or saved
+        self.__saved_counters = (0, 0)
+
+    @classmethod
+    def load(cls, path: Path, max_size: int = DEFAULT_RESULT_CACHE_SIZE,
+             ttl: Optional[float] = DEFAULT_RESULT_CACHE_TTL) -> "ResultCache":
+        """
+        Open a persisted cache. A missing or unreadable file gives an empty
+        cache that is written to path on save().
+        """
+        cache = cls(max_size, ttl, path)
+        try:
+            with path.open("r", encoding="utf-8") as fh:
+                state = json.load(fh)
+            for key, generation, stored_at, value in state.get("entries", []):
+                cache.entries[key] = (generation, stored_at, value)
+        except (OSError, ValueError, TypeError):
+            cache.entries.clear()
+        try:
+            with cache.counters_path.open("r", encoding="utf-8") as fh:
+                counters = json.load(fh)
+            cache.hits = int(counters.get("hits", 0))
+            cache.misses = int(counters.get("misses", 0))
+        except (OSError, ValueError, TypeError, AttributeError):
+            cache.hits = cache.misses = 0
+        cache.__saved_counters = (cache.hits, cache.misses)
+        cache.__evict()
+        return cache
+
+    @property
+    def counters_path(self) -> Optional[Path]:
+        """File the hit/miss counters are persisted to, next to path."""
+        if self.path is None:
+            return None
+        return self.path.with_name(self.path.stem + ".counters" + self.path.suffix)
+
+    def get(self, key: str, generation: int) -> Optional[Any]:
+        """Return the cached value for key, or None if it is missing or stale."""
+        with self.__lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == generation and not self.__expired(entry[1]):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                del self.entries[key]
+                self.__changed = True
+            self.misses += 1
+            return None
+
+    def put(self, key: str, generation: int, value: Any) -> None:
+        """Store value for key, evicting the least recently used entries beyond max_size."""
+        with self.__lock:
+            self.entries[key] = (generation, time.time(), value)
+            self.entries.move_to_end(key)
+            self.__changed = True
+            self.__evict()
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        with self.__lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.__changed = True
+
+    def stats(self) -> Dict[str, float]:
+        """Return hits, misses, current size and hit rate of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def save(self) -> None:
+        """
+        Write the entries to path, if the cache has one and they changed,
+        and the counters to counters_path, if they changed.
+        """
+        if self.path is None:
+            return
+        with self.__lock:
+            state = None
+            if self.__changed:
+                state = {"entries": [[key, generation, stored_at, value]
+                                     for key, (generation, stored_at, value) in self.entries.items()
+                                     if not self.__expired(stored_at)]}
+                self.__changed = False
+            counters = (self.hits, self.misses)
+            counters_changed = counters != self.__saved_counters
+            self.__saved_counters = counters
+        if state is not None:
+            _write_json(self.path, state)
+        if counters_changed:
+            _write_json(self.counters_path, {"hits": counters[0], "misses": counters[1]})
+
+    def __expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def __evict(self) -> None:
+        while len(self.entries) > max(self.max_size, 0):
+            self.entries.popitem(last=False)
+            self.__changed = True
+
+
+def _write_json(path: Path, state: Dict[str, Any]) -> None:
+    """
+    Replace path with state as JSON atomically, so a concurrent reader never
+    sees half a file. Each writer uses its own temporary file, so concurrent
+    CLI runs cannot interleave their writes either; the last replace wins.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fh = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent, prefix=path.name + ".",
+                                     suffix=".tmp", delete=False)
+    try:
+        with fh:
+            json.dump(state, fh)
+        os.replace(fh.name, path)
+    except BaseException:
+        # Do not leave the temporary file behind
+        os.unlink(fh.name)
+        raise
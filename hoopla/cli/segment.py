@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, MutableMapping
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from corpus_stats import CorpusStats
+from docstore import DocumentStore, docstore_chunks, document_field
+from fuzzy import DeletionIndex
+from minhash import MinHashIndex
+from postings import CompactIndex
+from substring_index import SubstringIndex
+from suggest import CompletionTrie, build_suggesters
+
+# Segment file layout (all integers little-endian):
+#   header:   magic, version, flags, term count, skip count, doc count (N),
+#             total doc length, index generation
+#   sections: (offset, length) for every entry of SECTIONS, in order
+#   data:     each section, aligned to 8 bytes
+SEGMENT_MAGIC = b"HOOPSEG\0"
+SEGMENT_VERSION = 14
+HEADER = struct.Struct("<8sIIQQQQQ")
+SECTION = struct.Struct("<QQ")
+ALIGNMENT = 8
+
+# Header flags
+SEGMENT_PARTIAL = 1  # spilled by a bounded-memory build; derived sections are empty
+
+# Section name -> array typecode ('B' for raw bytes)
+SECTIONS = (
+    ("term_offsets", "I"),     # byte offset of each term in term_blob, plus an end sentinel
+    ("term_blob", "B"),        # utf-8 encoded terms in sorted order
+    ("doc_freqs", "I"),
+    ("fuzzy_hashes", "I"),     # deletion dictionary for fuzzy lookups, see DeletionIndex
+    ("fuzzy_term_ids", "I"),
+    ("idfs", "d"),             # smoothed TF-IDF IDF per term id, see corpus_stats
+    ("bm25_idfs", "d"),        # BM25 IDF per term id
+    ("term_max_scores", "d"),  # BM25 score bounds per term and per skip block, see CorpusStats
+    ("postings_offsets", "Q"),
+    ("skip_starts", "I"),
+    ("skip_doc_ids", "I"),
+    ("skip_offsets", "Q"),
+    ("skip_position_offsets", "Q"),
+    ("block_max_scores", "d"),
+    ("postings", "B"),         # varint postings region
+    ("positions", "B"),        # varint token positions region
+    ("doc_ids", "I"),          # sorted document ids
+    ("doc_lengths", "I"),      # token count per entry of doc_ids
+    ("dense_doc_lengths", "I"),  # token count indexed by doc id; empty if ids are too sparse
+    ("doc_hashes", "Q"),       # content hash per entry of doc_ids, see record_hash()
+    ("token_starts", "I"),     # character offset of every token of each document, in doc_ids order
+    ("token_start_offsets", "Q"),  # index of each document's first entry in token_starts, plus an end sentinel
+    ("title_term_offsets", "I"),  # substring index over title terms, see SubstringIndex
+    ("title_term_blob", "B"),
+    ("title_doc_offsets", "Q"),
+    ("title_doc_ids", "I"),
+    ("title_suffix_positions", "I"),
+    ("title_suffix_terms", "I"),
+    ("doc_blocks", "B"),       # zlib-compressed JSON of all but the display fields, see DocumentStore
+    ("doc_block_offsets", "Q"),  # byte offset of each block in doc_blocks, plus an end sentinel
+    ("doc_title_offsets", "Q"),  # byte offset of each title in doc_titles, plus an end sentinel
+    ("doc_titles", "B"),       # utf-8 encoded titles per entry of doc_ids
+) + tuple(  # title and title word autocomplete tries, see CompletionTrie
+    (f"{kind}_suggest_{name}", typecode) for kind in ("title", "word") for name, typecode in CompletionTrie.ARRAYS
+) + tuple(  # MinHash signatures per entry of doc_ids and their LSH band index, see MinHashIndex
+    (f"minhash_{name}", typecode) for name, typecode in MinHashIndex.ARRAYS
+)
+
+
+def _to_bytes(values, typecode: str) -> bytes:
+    """Serialize an array, memoryview or bytes object in little-endian order."""
+    if typecode == "B":
+        return memoryview(values).tobytes()
+    values = array(typecode, values)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_buffer(buffer: memoryview, typecode: str):
+    """View a section as a typed sequence without copying where possible."""
+    if typecode == "B":
+        return buffer
+    if sys.byteorder == "little":
+        return buffer.cast(typecode)
+    values = array(typecode, buffer.tobytes())
+    values.byteswap()
+    return values
+
+
+def record_hash(record: Mapping[str, Any]) -> int:
+    """Return a stable 64-bit content hash of a document record."""
+    payload = json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return int.from_bytes(hashlib.blake2b(payload.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def write_segment(path: Path, index: CompactIndex, titles: SubstringIndex, docmap: Mapping,
+                  doc_lengths: Mapping, doc_hashes: Mapping, token_starts: Mapping,
+                  generation: int = 0, partial: bool = False, replacing: Optional["Segment"] = None) -> None:
+    """
+    Write index, the title substring index, docmap, doc_lengths, doc_hashes
+    and token_starts (doc id -> character offset of every token, see
+    TextAnalyzer.analyze_offsets) to a segment file, together with the
+    corpus statistics, fuzzy deletion dictionary, autocomplete tries and
+    MinHash signatures derived from them.
+    With partial=True the derived sections are left empty: a partial
+    segment spilled during a bounded-memory build is only read back to be
+    merged, and the merged segment derives them once for all documents.
+    generation identifies this version of the index, so results cached
+    against an older one can be told apart. The file is written next to
+    path and atomically moved into place. A Segment given as replacing,
+    which maps path, is closed just before the move, as a mapped file
+    cannot be replaced on every platform.
+    """
+    term_offsets = array("I", [0])
+    term_blob = bytearray()
+    for term in index.terms:
+        term_blob += term.encode("utf-8")
+        term_offsets.append(len(term_blob))
+
+    doc_ids = array("I", sorted(docmap))
+    lengths = array("I", (doc_lengths.get(doc_id, 0) for doc_id in doc_ids))
+    hashes = array("Q", (doc_hashes[doc_id] for doc_id in doc_ids))
+    title_offsets = array("Q", [0])
+    title_blob = bytearray()
+    block_offsets = array("Q", [0])
+    token_start_offsets = array("Q", [0])
+    if partial:
+        stats = CorpusStats(len(doc_ids), sum(lengths), index.doc_freqs, array("d"), array("d"), array("d"),
+                            array("d"), DocValueTable(doc_ids, lengths))
+        fuzzy = DeletionIndex()
+        suggesters = (CompletionTrie(), CompletionTrie())
+        minhash = MinHashIndex()
+    else:
+        stats = CorpusStats.compute(index, DocValueTable(doc_ids, lengths), sum(lengths))
+        fuzzy = DeletionIndex.from_terms(index.terms)
+        suggesters = build_suggesters(document_field(docmap, doc_id, "title", "") for doc_id in doc_ids)
+        minhash = MinHashIndex.from_index(index, doc_ids)
+
+    values = {
+        "term_offsets": term_offsets,
+        "term_blob": term_blob,
+        "doc_freqs": index.doc_freqs,
+        "fuzzy_hashes": fuzzy.hashes,
+        "fuzzy_term_ids": fuzzy.term_ids,
+        "idfs": stats.idfs,
+        "bm25_idfs": stats.bm25_idfs,
+        "term_max_scores": stats.term_max_scores,
+        "postings_offsets": index.offsets,
+        "skip_starts": index.skip_starts,
+        "skip_doc_ids": index.skip_doc_ids,
+        "skip_offsets": index.skip_offsets,
+        "skip_position_offsets": index.skip_position_offsets,
+        "block_max_scores": stats.block_max_scores,
+        "postings": index.data,
+        "positions": index.positions,
+        "doc_ids": doc_ids,
+        "doc_lengths": lengths,
+        "dense_doc_lengths": stats.dense_lengths,
+        "doc_hashes": hashes,
+        "token_starts": _run_chunks(token_starts, doc_ids, token_start_offsets, "I"),
+        "token_start_offsets": token_start_offsets,
+        "title_term_offsets": titles.term_offsets,
+        "title_term_blob": titles.term_blob,
+        "title_doc_offsets": titles.doc_offsets,
+        "title_doc_ids": titles.doc_ids,
+        "title_suffix_positions": titles.suffix_positions,
+        "title_suffix_terms": titles.suffix_terms,
+        # Written first, as streaming the blocks fills in the other columns
+        "doc_blocks": docstore_chunks(docmap, doc_ids, title_offsets, title_blob, block_offsets),
+        "doc_block_offsets": block_offsets,
+        "doc_title_offsets": title_offsets,
+        "doc_titles": title_blob,
+    }
+    for kind, trie in zip(("title", "word"), suggesters):
+        for name, _ in CompletionTrie.ARRAYS:
+            values[f"{kind}_suggest_{name}"] = getattr(trie, name)
+    for name, _ in MinHashIndex.ARRAYS:
+        values[f"minhash_{name}"] = getattr(minhash, name)
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as fh:
+        position = HEADER.size + SECTION.size * len(SECTIONS)
+        fh.write(b"\0" * position)
+        table = []
+        for name, typecode in SECTIONS:
+            padding = -position % ALIGNMENT
+            fh.write(b"\0" * padding)
+            position += padding
+            value = values[name]
+            if isinstance(value, Iterator):
+                length = 0
+                for chunk in value:
+                    fh.write(chunk)
+                    length += len(chunk)
+            else:
+                payload = _to_bytes(value, typecode)
+                fh.write(payload)
+                length = len(payload)
+            table.append((position, length))
+            position += length
+
+        fh.seek(0)
+        fh.write(HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, SEGMENT_PARTIAL if partial else 0,
+                             len(index.terms), len(index.skip_doc_ids), stats.doc_count,
+                             stats.total_doc_length, generation))
+        for offset, length in table:
+            fh.write(SECTION.pack(offset, length))
+    if replacing is not None:
+        replacing.close()
+    os.replace(tmp_path, path)
+
+
+def _run_chunks(runs: Mapping, doc_ids: Iterable[int], offsets: array, typecode: str) -> Iterator[bytes]:
+    """
+    Yield the per-document runs of values in doc id order, so they are never
+    copied into one array; fills offsets as a side effect.
+    """
+    size = 0
+    for doc_id in doc_ids:
+        values = runs.get(doc_id, ())
+        size += len(values)
+        offsets.append(size)
+        yield _to_bytes(values, typecode)
+
+
+class Lexicon:
+    """Sorted term list decoded lazily from the term_blob section."""
+
+    def __init__(self, offsets, blob) -> None:
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, term_id: int) -> str:
+        return self.raw(term_id).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for term_id in range(len(self)):
+            yield self[term_id]
+
+    def raw(self, term_id: int) -> bytes:
+        """Return the utf-8 bytes of a term."""
+        return self.blob[self.offsets[term_id]:self.offsets[term_id + 1]].tobytes()
+
+    def find(self, term: str) -> Optional[int]:
+        """Binary search the lexicon; utf-8 byte order matches str ordering."""
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.raw(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self.raw(lo) == key:
+            return lo
+        return None
+
+
+class MappedCompactIndex(CompactIndex):
+    """CompactIndex whose arrays are views into a memory-mapped segment."""
+
+    def __init__(self, lexicon: Lexicon, sections: Dict[str, Any]) -> None:
+        super().__init__()
+        self.terms = lexicon
+        self.doc_freqs = sections["doc_freqs"]
+        self.offsets = sections["postings_offsets"]
+        self.skip_starts = sections["skip_starts"]
+        self.skip_doc_ids = sections["skip_doc_ids"]
+        self.skip_offsets = sections["skip_offsets"]
+        self.skip_position_offsets = sections["skip_position_offsets"]
+        self.data = sections["postings"]
+        self.positions = sections["positions"]
+
+    def term_id(self, term: str) -> Optional[int]:
+        return self.terms.find(term)
+
+
+class DocValueTable(Mapping):
+    """Read-only doc id -> per-document integer (length, hash) mapping."""
+
+    def __init__(self, doc_ids, values) -> None:
+        self.doc_ids = doc_ids
+        self.values_array = values
+
+    def __getitem__(self, doc_id: int) -> int:
+        return self.values_array[_position(self.doc_ids, doc_id)]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.doc_ids)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+
+class DocRunTable(Mapping):
+    """Read-only doc id -> run of per-document values (such as token offsets) mapping."""
+
+    def __init__(self, doc_ids, offsets, values) -> None:
+        self.doc_ids = doc_ids
+        self.offsets = offsets
+        self.values_array = values
+
+    def __getitem__(self, doc_id: int):
+        i = _position(self.doc_ids, doc_id)
+        return self.values_array[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.doc_ids)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+
+class OverlayMapping(MutableMapping):
+    """
+    Writable view over a read-only mapping such as a segment table.
+    Assignments and deletions are kept in memory; the base is never modified.
+    """
+
+    def __init__(self, base: Mapping) -> None:
+        self.base = base
+        self.changes: Dict[Any, Any] = {}
+        self.removed: set = set()
+        self.size = len(base)
+
+    def __getitem__(self, key):
+        if key in self.changes:
+            return self.changes[key]
+        if key in self.removed:
+            raise KeyError(key)
+        return self.base[key]
+
+    def __setitem__(self, key, value) -> None:
+        if key not in self:
+            self.size += 1
+        self.changes[key] = value
+
+    def __delitem__(self, key) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.changes.pop(key, None)
+        self.removed.add(key)
+        self.size -= 1
+
+    def __contains__(self, key: object) -> bool:
+        if key in self.changes:
+            return True
+        return key not in self.removed and key in self.base
+
+    def __iter__(self) -> Iterator:
+        for key in self.base:
+            if key not in self.removed and key not in self.changes:
+                yield key
+        yield from self.changes
+
+    def __len__(self) -> int:
+        return self.size
+
+    def field(self, key, name: str, default: Any = None) -> Any:
+        """Return one field of a record, read from the base without decoding it whole where possible."""
+        if key in self.changes:
+            return self.changes[key].get(name, default)
+        if key in self.removed:
+            return default
+        return document_field(self.base, key, name, default)
+
+
+def _position(doc_ids, doc_id: int) -> int:
+    """Return the position of doc_id in the sorted doc_ids, or raise KeyError."""
+    i = bisect_left(doc_ids, doc_id)
+    if i == len(doc_ids) or doc_ids[i] != doc_id:
+        raise KeyError(doc_id)
+    return i
+
+
+class Segment:
+    """
+    A memory-mapped segment file.
+
+    Opening a segment only reads the header; every section is a zero-copy view
+    and pages are faulted in when a lookup touches them. close() (or leaving a
+    with block) unmaps the file; nothing read from the segment, such as its
+    index or docmap, may be used after that.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with path.open("rb") as fh:
+            self.mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        # Every view of the mapping, released by close() so the mapping can be closed
+        self.__views = [memoryview(self.mmap)]
+        try:
+            self.__open(self.__views[0])
+        except ValueError:
+            self.close()
+            raise
+
+    def __open(self, buffer: memoryview) -> None:
+        """Read the header and section table and set up the views of every section."""
+        path = self.path
+        if len(buffer) < HEADER.size:
+            raise ValueError(f"Segment file {path} is truncated.")
+        magic, version, flags, self.term_count, self.skip_count, self.doc_count, self.total_doc_length, \
+            self.generation = HEADER.unpack_from(buffer, 0)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a segment file.")
+        if version != SEGMENT_VERSION:
+            raise ValueError(f"Segment version {version} is not supported; run the build command again.")
+        self.partial = bool(flags & SEGMENT_PARTIAL)
+
+        self.sections: Dict[str, Any] = {}
+        for i, (name, typecode) in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(buffer, HEADER.size + i * SECTION.size)
+            if offset + length > len(buffer):
+                raise ValueError(f"Segment file {path} is truncated.")
+            view = buffer[offset:offset + length]
+            section = _from_buffer(view, typecode)
+            self.__views.append(view)
+            if isinstance(section, memoryview) and section is not view:
+                self.__views.append(section)
+            self.sections[name] = section
+
+        self.index = MappedCompactIndex(
+            Lexicon(self.sections["term_offsets"], self.sections["term_blob"]), self.sections)
+        self.docmap = DocumentStore(
+            self.sections["doc_ids"], self.sections["doc_title_offsets"], self.sections["doc_titles"],
+            self.sections["doc_block_offsets"], self.sections["doc_blocks"])
+        self.doc_lengths = DocValueTable(self.sections["doc_ids"], self.sections["doc_lengths"])
+        self.doc_hashes = DocValueTable(self.sections["doc_ids"], self.sections["doc_hashes"])
+        self.token_starts = DocRunTable(self.sections["doc_ids"], self.sections["token_start_offsets"],
+                                        self.sections["token_starts"])
+        self.fuzzy = DeletionIndex()
+        self.fuzzy.hashes = self.sections["fuzzy_hashes"]
+        self.fuzzy.term_ids = self.sections["fuzzy_term_ids"]
+        self.titles = SubstringIndex()
+        for name in ("term_offsets", "term_blob", "doc_offsets", "doc_ids", "suffix_positions", "suffix_terms"):
+            setattr(self.titles, name, self.sections["title_" + name])
+        self.suggesters = (CompletionTrie(), CompletionTrie())
+        for kind, trie in zip(("title", "word"), self.suggesters):
+            for name, _ in CompletionTrie.ARRAYS:
+                setattr(trie, name, self.sections[f"{kind}_suggest_{name}"])
+        self.minhash = MinHashIndex()
+        self.minhash.doc_ids = self.sections["doc_ids"]
+        for name, _ in MinHashIndex.ARRAYS:
+            setattr(self.minhash, name, self.sections[f"minhash_{name}"])
+        self.stats = CorpusStats(self.doc_count, self.total_doc_length, self.sections["doc_freqs"],
+                                 self.sections["idfs"], self.sections["bm25_idfs"],
+                                 self.sections["term_max_scores"], self.sections["block_max_scores"],
+                                 self.doc_lengths,
+                                 self.sections["dense_doc_lengths"])
+
+    @property
+    def avg_doc_length(self) -> float:
+        """Average document length, read from the header."""
+        return self.stats.avg_doc_length
+
+    def close(self) -> None:
+        """Release the section views and unmap the file."""
+        for view in reversed(self.__views):
+            view.release()
+        self.__views = []
+        self.mmap.close()
+
+    def __enter__(self) -> "Segment":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
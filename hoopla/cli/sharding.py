@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+import zlib
+from collections.abc import Mapping
+from itertools import chain
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from corpus_stats import bm25_idf
+from docstore import document_field
+import profiling
+from segment import Segment
+from snippets import DEFAULT_SNIPPET_TOKENS, HIGHLIGHT_MARKERS
+
+SHARDS_DIRNAME = "shards"
+MANIFEST_FILENAME = "manifest.json"
+
+# Opens the index of one shard directory inside its worker process
+ShardOpener = Callable[[Path], Any]
+
+
+def shard_of(doc_id: int, shard_count: int) -> int:
+    """Return the shard a document id belongs to; stable across runs and platforms."""
+    return zlib.crc32(doc_id.to_bytes(8, "little", signed=True)) % shard_count
+
+
+def shard_directory(root: Path, shard: int) -> Path:
+    """Directory holding the index segment of one shard."""
+    return root / f"shard-{shard:03d}"
+
+
+def write_manifest(root: Path, shard_count: int, generation: int) -> None:
+    """
+    Record the shard count and generation of a finished sharded build.
+    Written last, so a sharded index is only opened once all shards exist.
+    """
+    tmp_path = root / (MANIFEST_FILENAME + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as fh:
+        json.dump({"shard_count": shard_count, "generation": generation}, fh)
+    os.replace(tmp_path, root / MANIFEST_FILENAME)
+
+
+def read_manifest(root: Path) -> Dict[str, int]:
+    """Return the manifest of the sharded index in root."""
+    path = root / MANIFEST_FILENAME
+    if not path.exists():
+        raise FileNotFoundError("Sharded index not found in cache directory; run build --shards first.")
+    with path.open("r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _serve_shard(connection, directory: Path, open_shard: ShardOpener) -> None:
+    """
+    Worker process loop: open one shard, then answer (method, args) requests
+    sent by the coordinator with the result of index.method(*args), until it
+    sends None.
+    """
+    try:
+        index = open_shard(directory)
+    except (OSError, ValueError) as e:
+        index, error = None, f"Could not open shard {directory.name}: {e}"
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        if index is None:
+            connection.send(("error", error))
+            continue
+        method, args = request
+        try:
+            connection.send(("ok", getattr(index, method)(*args)))
+        except ValueError as e:
+            connection.send(("error", str(e)))
+    connection.close()
+
+
+class ShardedDocuments(Mapping):
+    """Read-only doc id -> record mapping over the docmaps of all shards."""
+
+    def __init__(self, docmaps: List[Mapping]) -> None:
+        self.docmaps = docmaps
+
+    def __getitem__(self, doc_id: int) -> Dict[str, Any]:
+        return self.docmaps[shard_of(doc_id, len(self.docmaps))][doc_id]
+
+    def __contains__(self, doc_id: object) -> bool:
+        return isinstance(doc_id, int) and doc_id in self.docmaps[shard_of(doc_id, len(self.docmaps))]
+
+    def __iter__(self) -> Iterator[int]:
+        return chain.from_iterable(self.docmaps)
+
+    def __len__(self) -> int:
+        return sum(len(docmap) for docmap in self.docmaps)
+
+    def field(self, doc_id: int, name: str, default: Any = None) -> Any:
+        """Return one field of a document from the docmap of its shard."""
+        return document_field(self.docmaps[shard_of(doc_id, len(self.docmaps))], doc_id, name, default)
+
+
+class ShardedIndex:
+    """
+    Coordinator of an index partitioned by doc id hash into shards on disk.
+
+    Each shard is a complete index segment served by its own worker process,
+    so no process holds more than one shard's postings. The coordinator only
+    maps the shard segments for their lexicons and records: it computes the
+    BM25 IDFs and average document length of the whole corpus, fans a query
+    out to every shard in parallel and merges the per-shard top k. Since
+    shards score with the global statistics, the ranking and scores equal
+    those of a single index over the same documents.
+
+    Offers the search interface of InvertedIndex used by QueryService.
+    """
+
+    def __init__(self, root: Path, analyzer, open_shard: ShardOpener, segment_filename: str) -> None:
+        manifest = read_manifest(root)
+        self.analyzer = analyzer
+        self.generation = manifest["generation"]
+        directories = [shard_directory(root, shard) for shard in range(manifest["shard_count"])]
+        with profiling.stage("load"):
+            self.segments = [Segment(directory / segment_filename) for directory in directories]
+        self.docmap = ShardedDocuments([segment.docmap for segment in self.segments])
+        self.doc_count = sum(segment.doc_count for segment in self.segments)
+        total_doc_length = sum(segment.total_doc_length for segment in self.segments)
+        self.avg_doc_length = (total_doc_length / self.doc_count if self.doc_count else 0.0) or 1.0
+
+        self.__lock = threading.Lock()
+        self.__connections = []
+        self.__workers = []
+        for directory in directories:
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_serve_shard, args=(worker_connection, directory, open_shard),
+                                             daemon=True)
+            worker.start()
+            worker_connection.close()
+            self.__connections.append(connection)
+            self.__workers.append(worker)
+
+    def global_idfs(self, stems) -> Dict[str, float]:
+        """BM25 IDF of each stem over all shards; stems found in no shard are left out."""
+        idfs = {}
+        for stem in stems:
+            doc_freq = sum(segment.index.doc_freq(stem) for segment in self.segments)
+            if doc_freq:
+                idfs[stem] = bm25_idf(self.doc_count, doc_freq)
+        return idfs
+
+    def search(self, query: str, limit: int = 5, fuzzy: bool = False) -> List[Tuple[int, float]]:
+        """
+        Rank documents for the query with BM25 across all shards and return
+        the top `limit` (doc_id, score) pairs, highest score first.
+        Raises ValueError for fuzzy search, which is not supported on shards.
+        """
+        if fuzzy:
+            raise ValueError("Fuzzy search is not supported on a sharded index.")
+        if not query or limit <= 0:
+            return []
+
+        stems = set(self.analyzer.analyze(query))
+        with profiling.stage("lookup"):
+            idfs = self.global_idfs(stems)
+        if not idfs:
+            return []
+
+        with profiling.stage("score"):
+            ranked = self.__scatter({shard: ("score_terms", (idfs, limit, self.avg_doc_length))
+                                     for shard in range(len(self.__connections))})
+        # Shards hold disjoint documents, so the global top k is among the shards' top k
+        return heapq.nlargest(limit, chain.from_iterable(ranked.values()), key=lambda item: (item[1], -item[0]))
+
+    def snippets(self, query: str, doc_ids: List[int], size: int = DEFAULT_SNIPPET_TOKENS,
+                 markers: Tuple[str, str] = HIGHLIGHT_MARKERS) -> List[str]:
+        """Return a highlighted snippet per document, each cut by the shard holding it."""
+        by_shard: Dict[int, List[int]] = {}
+        for doc_id in doc_ids:
+            by_shard.setdefault(shard_of(doc_id, len(self.__connections)), []).append(doc_id)
+        replies = self.__scatter({shard: ("snippets", (query, shard_doc_ids, size, markers))
+                                  for shard, shard_doc_ids in by_shard.items()})
+        snippets = {}
+        for shard, shard_doc_ids in by_shard.items():
+            snippets.update(zip(shard_doc_ids, replies[shard]))
+        return [snippets[doc_id] for doc_id in doc_ids]
+
+    def __scatter(self, requests: Dict[int, Tuple[str, tuple]]) -> Dict[int, Any]:
+        """
+        Send a (method, args) request to each given shard, then collect the
+        results; all shards work in parallel. Raises ValueError if any failed.
+        """
+        with self.__lock:
+            for shard, request in requests.items():
+                self.__connections[shard].send(request)
+            replies = {shard: self.__connections[shard].recv() for shard in requests}
+        for status, result in replies.values():
+            if status == "error":
+                raise ValueError(result)
+        return {shard: result for shard, (_, result) in replies.items()}
+
+    def close(self) -> None:
+        """Stop the shard worker processes and unmap the shard segments."""
+        for connection in self.__connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            connection.close()
+        for worker in self.__workers:
+            worker.join()
+        self.__connections = []
+        self.__workers = []
+        for segment in self.segments:
+            segment.close()
+
+    def __enter__(self) -> "ShardedIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import string
+from typing import List, Mapping, Sequence, Tuple
+
+from text_analysis import _WORD
+
+# Tokens shown per snippet
+DEFAULT_SNIPPET_TOKENS = 30
+# Put around every query term occurrence in a snippet
+HIGHLIGHT_MARKERS = ("**", "**")
+ELLIPSIS = "..."
+
+# (token position, stemmed query term) of one occurrence in a document
+Match = Tuple[int, str]
+
+
+def best_window(matches: List[Match], weights: Mapping[str, float], size: int) -> Tuple[int, int]:
+    """
+    Return the first and last position of the matches inside the best window
+    of `size` tokens. matches must be sorted by position. A window scores
+    the summed weight (IDF) of the distinct query terms it holds, so rare
+    terms count most; ties go to more occurrences, then to the earliest.
+    """
+    counts: dict = {}
+    score = 0.0
+    lo = 0
+    best = (-1.0, 0)
+    best_span = (matches[0][0], matches[0][0])
+    for hi, (position, term) in enumerate(matches):
+        if not counts.get(term):
+            score += weights[term]
+        counts[term] = counts.get(term, 0) + 1
+        while position - matches[lo][0] >= size:
+            dropped = matches[lo][1]
+            counts[dropped] -= 1
+            if not counts[dropped]:
+                score -= weights[dropped]
+            lo += 1
+        if (score, hi - lo + 1) > best:
+            best = (score, hi - lo + 1)
+            best_span = (matches[lo][0], position)
+    return best_span
+
+
+def make_snippet(text: str, text_offset: int, starts: Sequence[int], first: int, matches: List[Match],
+                 weights: Mapping[str, float], size: int = DEFAULT_SNIPPET_TOKENS,
+                 markers: Tuple[str, str] = HIGHLIGHT_MARKERS) -> str:
+    """
+    Cut a snippet of about `size` tokens out of text, with the query term
+    occurrences in it wrapped in markers.
+
+    starts holds the character offset of every token of the indexed document
+    text, which contains text from text_offset on; only tokens from position
+    `first` on fall in text. matches are the query term occurrences among
+    them, sorted by position. The window around the best cluster of matches
+    (the opening of the text if there are none) is read from the stored
+    offsets, so only the snippet itself is scanned.
+    """
+    token_count = len(starts)
+    if first >= token_count or size <= 0:
+        return ""
+    match_first, match_last = best_window(matches, weights, size) if matches else (first, first)
+    # Center the matches in the window, within the tokens of text
+    lead = max(size - (match_last - match_first + 1), 0) // 2
+    start = max(first, min(match_first - lead, token_count - size))
+    end = min(token_count, start + size)
+
+    pieces = []
+    cursor = starts[start] - text_offset
+    for position, _ in matches:
+        if start <= position < end:
+            begin = starts[position] - text_offset
+            word = _WORD.match(text, begin).group()
+            # Highlight the word itself, not the punctuation around it
+            core = word.strip(string.punctuation)
+            if not core:
+                continue
+            core_begin = begin + word.index(core)
+            pieces.append(text[cursor:core_begin])
+            pieces.append(markers[0] + core + markers[1])
+            cursor = core_begin + len(core)
+    last_end = _WORD.match(text, starts[end - 1] - text_offset).end()
+    pieces.append(text[cursor:last_end])
+
+    snippet = " ".join("".join(pieces).split())
+    if start > first:
+        snippet = ELLIPSIS + snippet
+    if end < token_count:
+        snippet += ELLIPSIS
+    return snippet
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import heapq
+from array import array
+from typing import AbstractSet, Iterable, Iterator, List, Mapping, Sequence, Tuple
+
+
+class SubstringIndex:
+    """
+    Substring lookup over the stemmed title terms of every document.
+
+    Terms are stored in sorted order in one utf-8 blob, each with a sorted
+    list of the documents whose title contains it. A suffix array lists every
+    suffix of every term in byte order, so the terms containing a fragment
+    form one contiguous range that is found by binary search.
+
+    Attributes:
+        term_offsets: Byte offset of each term in term_blob, plus an end sentinel.
+        term_blob: utf-8 encoded terms in sorted order.
+        doc_offsets: Start of each term's documents in doc_ids, plus an end sentinel.
+        doc_ids: Sorted doc ids per term.
+        suffix_positions: Byte position in term_blob of every suffix, sorted by suffix.
+        suffix_terms: Term id of every entry of suffix_positions.
+    """
+
+    def __init__(self) -> None:
+        self.term_offsets = array("I", [0])
+        self.term_blob = b""
+        self.doc_offsets = array("Q", [0])
+        self.doc_ids = array("I")
+        self.suffix_positions = array("I")
+        self.suffix_terms = array("I")
+
+    @classmethod
+    def from_postings(cls, postings: Iterable[Tuple[str, Iterable[int]]]) -> "SubstringIndex":
+        """
+        Build from (term, doc ids) pairs given in ascending term order, each
+        with ascending doc ids. Terms without documents are dropped.
+        """
+        substrings = cls()
+        blob = bytearray()
+        suffixes: List[Tuple[bytes, int, int]] = []
+        for term, doc_ids in postings:
+            start = len(substrings.doc_ids)
+            substrings.doc_ids.extend(doc_ids)
+            if len(substrings.doc_ids) == start:
+                continue
+            term_id = len(substrings.term_offsets) - 1
+            encoded = term.encode("utf-8")
+            for i, byte in enumerate(encoded):
+                # Suffixes start on character boundaries only
+                if byte & 0xC0 != 0x80:
+                    suffixes.append((encoded[i:], len(blob) + i, term_id))
+            blob += encoded
+            substrings.term_offsets.append(len(blob))
+            substrings.doc_offsets.append(len(substrings.doc_ids))
+        suffixes.sort()
+        substrings.term_blob = bytes(blob)
+        substrings.suffix_positions = array("I", (position for _, position, _ in suffixes))
+        substrings.suffix_terms = array("I", (term_id for _, _, term_id in suffixes))
+        return substrings
+
+    @classmethod
+    def from_terms(cls, doc_terms: Mapping[int, Iterable[str]]) -> "SubstringIndex":
+        """Build from the doc id -> title terms build-time dict."""
+        return cls.from_postings(_invert(doc_terms))
+
+    def merged(self, removed: AbstractSet[int], doc_terms: Mapping[int, Iterable[str]]) -> "SubstringIndex":
+        """
+        Return a new SubstringIndex with `removed` doc ids dropped and the
+        buffered doc id -> title terms merged in.
+        """
+        kept = ((term, [doc_id for doc_id in doc_ids if doc_id not in removed]) for term, doc_ids in self.items())
+        return _merge_postings([kept, _invert(doc_terms)])
+
+    def __len__(self) -> int:
+        return len(self.term_offsets) - 1
+
+    def term(self, term_id: int) -> str:
+        """Return the term with the given id."""
+        return bytes(self.term_blob[self.term_offsets[term_id]:self.term_offsets[term_id + 1]]).decode("utf-8")
+
+    def documents(self, term_id: int) -> Sequence[int]:
+        """Return the sorted doc ids whose title contains the term."""
+        return self.doc_ids[self.doc_offsets[term_id]:self.doc_offsets[term_id + 1]]
+
+    def items(self) -> Iterator[Tuple[str, Sequence[int]]]:
+        """Yield (term, doc ids) pairs in term order."""
+        for term_id in range(len(self)):
+            yield self.term(term_id), self.documents(term_id)
+
+    def __suffix_prefix(self, i: int, size: int) -> bytes:
+        """Return up to `size` bytes of suffix i, stopping at the end of its term."""
+        position = self.suffix_positions[i]
+        end = min(position + size, self.term_offsets[self.suffix_terms[i] + 1])
+        return bytes(self.term_blob[position:end])
+
+    def find_terms(self, fragment: str) -> List[int]:
+        """Return the sorted ids of the terms that contain fragment."""
+        key = fragment.encode("utf-8")
+        if not key:
+            return []
+        size = len(key)
+        # Suffixes are sorted, so their first `size` bytes are sorted too
+        lo, hi = 0, len(self.suffix_positions)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.__suffix_prefix(mid, size) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = lo
+        hi = len(self.suffix_positions)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.__suffix_prefix(mid, size) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return sorted(set(self.suffix_terms[start:lo]))
+
+    def find_documents(self, fragments: Iterable[str]) -> List[int]:
+        """Return the sorted doc ids with a title term containing any of fragments."""
+        term_ids = {term_id for fragment in fragments for term_id in self.find_terms(fragment)}
+        lists = [self.documents(term_id) for term_id in sorted(term_ids)]
+        doc_ids: List[int] = []
+        for doc_id in heapq.merge(*lists):
+            if not doc_ids or doc_ids[-1] != doc_id:
+                doc_ids.append(doc_id)
+        return doc_ids
+
+
+def _invert(doc_terms: Mapping[int, Iterable[str]]) -> Iterator[Tuple[str, List[int]]]:
+    """Turn doc id -> terms into (term, sorted doc ids) pairs in term order."""
+    term_docs: dict = {}
+    for doc_id, terms in doc_terms.items():
+        for term in set(terms):
+            if term not in term_docs:
+                term_docs[term] = []
+            term_docs[term].append(doc_id)
+    for term in sorted(term_docs):
+        yield term, sorted(term_docs[term])
+
+
+def _merge_postings(sources: List[Iterable[Tuple[str, Sequence[int]]]]) -> SubstringIndex:
+    """
+    Merge several term-ordered (term, doc ids) streams with disjoint doc ids
+    into one SubstringIndex.
+    """
+    def merged() -> Iterator[Tuple[str, Iterator[int]]]:
+        streams = heapq.merge(*sources, key=lambda item: item[0])
+        current = None
+        lists: List[Sequence[int]] = []
+        for term, doc_ids in streams:
+            if term != current and current is not None:
+                yield current, heapq.merge(*lists)
+                lists = []
+            current = term
+            lists.append(doc_ids)
+        if current is not None:
+            yield current, heapq.merge(*lists)
+
+    return SubstringIndex.from_postings(merged())
+
+
+def merge_substring_indexes(indexes: List[SubstringIndex]) -> SubstringIndex:
+    """Merge SubstringIndexes with disjoint doc ids, such as partial segments."""
+    return _merge_postings([index.items() for index in indexes])
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import string
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# Completions precomputed per trie node; also the most a lookup can return
+SUGGESTIONS_PER_NODE = 10
+DEFAULT_SUGGESTIONS = 5
+
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+# (display text, weight, trie keys) of one completion
+Entry = Tuple[str, int, Sequence[str]]
+
+
+def normalize_words(text: str) -> List[str]:
+    """Lowercase text, split it and strip punctuation, like TextAnalyzer.tokenize without stemming."""
+    words = (word.translate(_PUNCTUATION) for word in text.lower().split())
+    return [word for word in words if word]
+
+
+def normalize_prefix(prefix: str) -> str:
+    """
+    Normalize a typed prefix like the keys; a trailing space is kept, so
+    "star " only completes titles with a word after "star".
+    """
+    normalized = " ".join(normalize_words(prefix))
+    if normalized and prefix[-1:].isspace():
+        normalized += " "
+    return normalized
+
+
+class CompletionTrie:
+    """
+    Array-backed radix trie with the best completions of every prefix
+    precomputed.
+
+    Keys are utf-8 encoded and chains of single-child nodes are merged, so
+    every node ends at a branch or a key and the edge into node n carries
+    the label label_blob[label_offsets[n]:label_offsets[n + 1]]. Nodes are
+    numbered in depth-first order; the edges out of node n are
+    child_offsets[n]:child_offsets[n + 1], sorted by the first byte of
+    their label. A lookup does one binary search per edge on the typed
+    prefix and then reads a completion list, without visiting the subtree.
+
+    Completion lists hold entry ids, and entries are numbered by rank
+    (weight, then shorter, then alphabetical), so a node's list is the
+    smallest ids below it. A node whose list equals its parent's shares it.
+
+    Attributes:
+        child_offsets: Start of each node's edges, plus an end sentinel.
+        child_bytes: First label byte of each edge.
+        child_nodes: Target node of each edge.
+        label_offsets: Start of each node's edge label in label_blob, plus an end sentinel.
+        label_blob: utf-8 encoded edge labels.
+        completion_starts: Start of each node's list in completions.
+        completion_counts: Length of each node's list.
+        completions: Entry ids, best first.
+        entry_offsets: Byte offset of each entry in entry_blob, plus an end sentinel.
+        entry_blob: utf-8 encoded display text of the entries, in rank order.
+        entry_weights: Weight of each entry.
+    """
+
+    # Attribute name -> array typecode, as stored in a segment
+    ARRAYS = (
+        ("child_offsets", "I"),
+        ("child_bytes", "B"),
+        ("child_nodes", "I"),
+        ("label_offsets", "I"),
+        ("label_blob", "B"),
+        ("completion_starts", "I"),
+        ("completion_counts", "B"),
+        ("completions", "I"),
+        ("entry_offsets", "I"),
+        ("entry_blob", "B"),
+        ("entry_weights", "I"),
+    )
+
+    def __init__(self) -> None:
+        self.child_offsets = array("I", [0, 0])
+        self.child_bytes = b""
+        self.child_nodes = array("I")
+        self.label_offsets = array("I", [0, 0])
+        self.label_blob = b""
+        self.completion_starts = array("I", [0])
+        self.completion_counts = array("B", [0])
+        self.completions = array("I")
+        self.entry_offsets = array("I", [0])
+        self.entry_blob = b""
+        self.entry_weights = array("I")
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Entry], size: int = SUGGESTIONS_PER_NODE) -> "CompletionTrie":
+        """Build from (display, weight, keys) entries; an entry completes every prefix of each of its keys."""
+        trie = cls()
+        ranked = sorted(entries, key=lambda entry: (-entry[1], len(entry[0]), entry[0]))
+        blob = bytearray()
+        for display, weight, _ in ranked:
+            blob += display.encode("utf-8")
+            trie.entry_offsets.append(len(blob))
+            trie.entry_weights.append(weight)
+        trie.entry_blob = bytes(blob)
+        pairs = sorted({(key.encode("utf-8"), entry_id)
+                        for entry_id, (_, _, entry_keys) in enumerate(ranked) for key in entry_keys})
+        keys = [key for key, _ in pairs]
+        entry_ids = [entry_id for _, entry_id in pairs]
+
+        children: List[List[Tuple[int, int]]] = []
+        labels: List[bytes] = []
+        parents: List[int] = []
+        best: List[List[int]] = []
+
+        def add_node(lo: int, hi: int, depth: int, label: bytes, parent: int) -> int:
+            """Add the node of the sorted keys[lo:hi], which share their first depth bytes."""
+            node = len(children)
+            children.append([])
+            labels.append(label)
+            parents.append(parent)
+            best.append([])
+            candidates = set()
+            i = lo
+            # Keys ending here sort first
+            while i < hi and len(keys[i]) == depth:
+                candidates.add(entry_ids[i])
+                i += 1
+            while i < hi:
+                byte = keys[i][depth]
+                j = i + 1
+                while j < hi and keys[j][depth] == byte:
+                    j += 1
+                # Sorted keys share the prefix of the first and last of the group
+                first, last = keys[i], keys[j - 1]
+                end = depth + 1
+                while end < len(first) and end < len(last) and first[end] == last[end]:
+                    end += 1
+                child = add_node(i, j, end, first[depth:end], node)
+                children[node].append((byte, child))
+                candidates.update(best[child])
+                i = j
+            best[node] = sorted(candidates)[:size]
+            return node
+
+        add_node(0, len(keys), 0, b"", 0)
+
+        trie.child_offsets = array("I", [0])
+        child_bytes = bytearray()
+        trie.child_nodes = array("I")
+        trie.label_offsets = array("I", [0])
+        label_blob = bytearray()
+        trie.completion_starts = array("I")
+        trie.completion_counts = array("B")
+        trie.completions = array("I")
+        for node, edges in enumerate(children):
+            child_bytes.extend(byte for byte, _ in edges)
+            trie.child_nodes.extend(child for _, child in edges)
+            trie.child_offsets.append(len(trie.child_nodes))
+            label_blob += labels[node]
+            trie.label_offsets.append(len(label_blob))
+            parent = parents[node]
+            if node and best[node] == best[parent]:
+                trie.completion_starts.append(trie.completion_starts[parent])
+            else:
+                trie.completion_starts.append(len(trie.completions))
+                trie.completions.extend(best[node])
+            trie.completion_counts.append(len(best[node]))
+        trie.child_bytes = bytes(child_bytes)
+        trie.label_blob = bytes(label_blob)
+        return trie
+
+    def complete(self, prefix: str, limit: int = DEFAULT_SUGGESTIONS) -> List[Tuple[str, int]]:
+        """
+        Return up to `limit` (display, weight) completions of an already
+        normalized prefix, best first; at most SUGGESTIONS_PER_NODE are stored.
+        """
+        key = prefix.encode("utf-8")
+        child_offsets, child_bytes, label_offsets = self.child_offsets, self.child_bytes, self.label_offsets
+        node = 0
+        position = 0
+        while position < len(key):
+            lo, hi = child_offsets[node], child_offsets[node + 1]
+            byte = key[position]
+            i = bisect_left(child_bytes, byte, lo, hi)
+            if i == hi or child_bytes[i] != byte:
+                return []
+            node = self.child_nodes[i]
+            # The prefix may end inside the label, which then only has to start with the rest
+            start = label_offsets[node]
+            length = min(label_offsets[node + 1] - start, len(key) - position)
+            if self.label_blob[start:start + length] != key[position:position + length]:
+                return []
+            position += length
+        start = self.completion_starts[node]
+        entry_ids = self.completions[start:start + min(self.completion_counts[node], max(limit, 0))]
+        return [(self.__display(entry_id), self.entry_weights[entry_id]) for entry_id in entry_ids]
+
+    def __display(self, entry_id: int) -> str:
+        start, end = self.entry_offsets[entry_id], self.entry_offsets[entry_id + 1]
+        return bytes(self.entry_blob[start:end]).decode("utf-8")
+
+
+def build_suggesters(titles: Iterable[str], size: int = SUGGESTIONS_PER_NODE) -> Tuple[CompletionTrie, CompletionTrie]:
+    """
+    Build the title and word completion tries from the title of every document.
+
+    A title completes the prefixes of each of its word suffixes, so "wars"
+    finds "Star Wars", and weighs the number of documents with that
+    normalized title. A word weighs the number of titles containing it.
+    Titles are shown as written in the first document that has them.
+    """
+    title_counts: Dict[str, List] = {}
+    word_counts: Dict[str, int] = {}
+    for title in titles:
+        if not isinstance(title, str):
+            continue
+        words = normalize_words(title)
+        if not words:
+            continue
+        key = " ".join(words)
+        entry = title_counts.get(key)
+        if entry is None:
+            title_counts[key] = [title.strip(), 1, words]
+        else:
+            entry[1] += 1
+        for word in set(words):
+            word_counts[word] = word_counts.get(word, 0) + 1
+
+    title_entries = ((display, count, [" ".join(words[i:]) for i in range(len(words))])
+                     for display, count, words in title_counts.values())
+    word_entries = ((word, count, [word]) for word, count in word_counts.items())
+    return CompletionTrie.from_entries(title_entries, size), CompletionTrie.from_entries(word_entries, size)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import re
+import string
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import profiling
+
+# Stems repeat constantly and the vocabulary is small, so a bounded cache
+# of this size holds practically every word seen in the movie catalog.
+DEFAULT_STEM_CACHE_SIZE = 65536
+# A token before cleaning: a maximal run of non-whitespace, as str.split() yields
+_WORD = re.compile(r"\S+")
+
+
+def default_stopwords_path() -> Path:
+    """Return the path of the bundled stopwords list (hoopla/data/stopwords.txt)."""
+    base = Path(__file__).resolve().parents[1]  # .../hoopla
+    return base / "data" / "stopwords.txt"
+
+
+class TextAnalyzer:
+    """
+    Reusable text analysis pipeline shared by indexing and querying.
+
+    The pipeline is: lowercase -> split on whitespace -> strip punctuation ->
+    drop empty tokens -> drop stopwords -> Porter stem.
+
+    Stopwords are read once, the punctuation translation table is built once
+    and stems are memoized in a bounded LRU cache.
+    """
+
+    def __init__(self, stopwords_path: Optional[Path] = None,
+                 stem_cache_size: int = DEFAULT_STEM_CACHE_SIZE) -> None:
+        self.stopwords_path = stopwords_path or default_stopwords_path()
+        with profiling.stage("stopwords"):
+            self.stopwords: Set[str] = self.__load_stopwords(self.stopwords_path)
+        self.table = str.maketrans('', '', string.punctuation)
+        # NLTK is imported on first use so commands that never analyze text
+        # (such as the query server client) start quickly
+        with profiling.stage("stemmer_init"):
+            from nltk.stem import PorterStemmer
+            self.stemmer = PorterStemmer()
+        self._stem = lru_cache(maxsize=stem_cache_size)(self.__stem_uncached)
+
+    @staticmethod
+    def __load_stopwords(path: Path) -> Set[str]:
+        """Read the stopwords file, one word per line."""
+        with path.open("r", encoding="utf-8") as fh:
+            return set(line.strip() for line in fh)
+
+    def __stem_uncached(self, token: str) -> str:
+        """Run the Porter stemmer; only reached on stem cache misses."""
+        with profiling.stage("stem"):
+            return self.stemmer.stem(token)
+
+    def clean(self, token: str) -> str:
+        """Strip punctuation from an already lowercased token."""
+        return token.translate(self.table).replace('`', "'")
+
+    def tokenize(self, text: str) -> List[str]:
+        """Lowercase, split and clean text, dropping empty tokens."""
+        tokens = (self.clean(token) for token in text.lower().split())
+        return [token for token in tokens if token]
+
+    def stem(self, token: str) -> str:
+        """Stem a single cleaned token, using the memoized stemmer."""
+        return self._stem(token)
+
+    def analyze(self, text: str) -> List[str]:
+        """Run the full pipeline and return the stemmed, stopword-free tokens."""
+        with profiling.stage("analyze"):
+            return [self._stem(token) for token in self.tokenize(text) if token not in self.stopwords]
+
+    def analyze_positions(self, text: str) -> List[Tuple[str, int]]:
+        """
+        Like analyze(), but pair every stem with its position in the token
+        stream. Stopwords still take up a position, so phrase matching sees
+        the gaps they leave.
+        """
+        with profiling.stage("analyze"):
+            return [(self._stem(token), position) for position, token in enumerate(self.tokenize(text))
+                    if token not in self.stopwords]
+
+    def analyze_offsets(self, text: str) -> Tuple[List[Tuple[str, int]], array]:
+        """
+        Like analyze_positions(), and also return the character offset in text
+        at which every token starts, indexed by position (stopwords included).
+        Stored at index time, the offsets let snippets be cut from the
+        original text without tokenizing it again.
+        """
+        with profiling.stage("analyze"):
+            analyzed = []
+            starts = array("I")
+            for match in _WORD.finditer(text):
+                token = self.clean(match.group().lower())
+                if not token:
+                    continue
+                if token not in self.stopwords:
+                    analyzed.append((self._stem(token), len(starts)))
+                starts.append(match.start())
+            return analyzed, starts
+
+    def analyze_term(self, term: str) -> str:
+        """
+        Normalize a single term for tf/idf lookups.
+        Stopwords are kept so that explicit lookups are never silently dropped.
+        Returns an empty string if nothing is left after cleaning.
+        """
+        with profiling.stage("analyze"):
+            cleaned_term = self.clean(term.lower())
+            if not cleaned_term:
+                return ""
+            return self._stem(cleaned_term)
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Return hits, misses, current size and hit rate of the stem cache."""
+        info = self._stem.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "hit_rate": info.hits / lookups if lookups else 0.0,
+        }
+
+
+_default_analyzer: Optional[TextAnalyzer] = None
+
+
+def get_analyzer(stopwords_path: Optional[Path] = None) -> TextAnalyzer:
+    """
+    Return the process-wide shared analyzer, creating it on first use.
+    Asking for another stopwords list than the shared analyzer's replaces
+    it, so a build worker analyzes exactly like the index it works for.
+    """
+    global _default_analyzer
+    if _default_analyzer is None or (stopwords_path is not None
+                                     and Path(stopwords_path) != _default_analyzer.stopwords_path):
+        _default_analyzer = TextAnalyzer(stopwords_path)
+    return _default_analyzer
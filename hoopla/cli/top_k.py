@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import heapq
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from corpus_stats import BM25_B, BM25_K1
+from postings import NO_MORE_DOCS, PostingList
+
+# Bounds are compared with a little slack, so that rounding differences between
+# summing bounds and summing scores can never prune a top-k document.
+BOUND_SLACK = 1e-9
+
+
+class TermScorer:
+    """
+    Posting cursor of one query term with its BM25 IDF and score bounds.
+
+    max_score bounds the score of any posting of the term; block_bound()
+    bounds the postings of the skip block that may hold a given doc id.
+    Both are the stored bounds times idf and bound_scale, which widens bounds
+    computed for a shorter average document length than the one scored with.
+    """
+
+    __slots__ = ("term", "postings", "cursor", "idf", "bound_scale", "max_score", "block_max_scores",
+                 "skip_doc_ids", "skip_lo", "skip_hi", "block_start", "block_end", "block_score")
+
+    def __init__(self, term: str, postings: PostingList, idf: float, term_max_score: float,
+                 block_max_scores: Sequence[float], bound_scale: float = 1.0) -> None:
+        self.term = term
+        self.postings = postings
+        self.cursor = postings.cursor()
+        self.idf = idf
+        self.bound_scale = bound_scale
+        self.max_score = idf * bound_scale * term_max_score
+        self.block_max_scores = block_max_scores
+        self.skip_doc_ids = postings.skip_doc_ids
+        self.skip_lo = postings.skip_lo
+        self.skip_hi = postings.skip_hi
+        # Doc id range and bound of the last block looked up
+        self.block_start = 0
+        self.block_end = -1
+        self.block_score = 0.0
+
+    def block_bound(self, doc_id: int) -> float:
+        """
+        Return the score bound of the skip block that may hold doc_id.
+        Only the skip entries are searched; no postings are decoded.
+        """
+        if self.block_start <= doc_id <= self.block_end:
+            return self.block_score
+        skip_doc_ids = self.skip_doc_ids
+        block = max(bisect_right(skip_doc_ids, doc_id, self.skip_lo, self.skip_hi) - 1, self.skip_lo)
+        self.block_start = skip_doc_ids[block] if block > self.skip_lo else 0
+        self.block_end = skip_doc_ids[block + 1] - 1 if block + 1 < self.skip_hi else NO_MORE_DOCS - 1
+        self.block_score = self.idf * self.bound_scale * self.block_max_scores[block]
+        return self.block_score
+
+
+def top_k_scores(scorers: List[TermScorer], limit: int, doc_lengths,
+                 avg_doc_length: float) -> List[Tuple[int, float]]:
+    """
+    Return the top `limit` (doc_id, score) pairs by BM25 over the union of
+    the scorers' postings, highest score first and ties to the lower id,
+    exactly as scoring every posting would.
+
+    Terms are scored one at a time, rarest (highest IDF) first. Once the bounds
+    of the terms left cannot lift an unseen document past the current k-th
+    best score, those terms only look up the remaining candidates through
+    their skip lists, and a candidate is dropped as soon as its score plus
+    the bounds left (using the bound of the block it falls in) cannot reach
+    the top k. Long lists of common terms are then mostly never decoded.
+    This is term-at-a-time MaxScore rather than document-at-a-time WAND;
+    the README's Top-k Pruning section lists the trade-offs.
+    Each document's score is summed in the same term order, so pruning
+    never changes a score; as the order only depends on IDFs and terms,
+    shards scoring with the same IDFs also sum exactly as a single index.
+    """
+    scorers = sorted(scorers, key=lambda scorer: (-scorer.idf, scorer.term))
+    # remaining[i] bounds what the terms from i onwards can add to a score
+    remaining = [0.0] * (len(scorers) + 1)
+    for i in range(len(scorers) - 1, -1, -1):
+        remaining[i] = remaining[i + 1] + scorers[i].max_score
+
+    k1_plus = BM25_K1 + 1
+    scores: Dict[int, float] = {}
+    # Ids of scores in ascending order, kept once no new documents are added
+    candidates: Optional[List[int]] = None
+    threshold = -1.0
+    for i, scorer in enumerate(scorers):
+        idf = scorer.idf
+        rest = remaining[i + 1]
+        if remaining[i] > threshold:
+            candidates = None
+            for doc_id, tf in scorer.postings.items():
+                length_norm = 1 - BM25_B + BM25_B * doc_lengths[doc_id] / avg_doc_length
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * ((tf * k1_plus) / (tf + BM25_K1 * length_norm))
+        else:
+            # Unseen documents can no longer reach the top k: only score candidates
+            if candidates is None:
+                candidates = sorted(scores)
+            kept = []
+            cursor = scorer.cursor
+            for doc_id in candidates:
+                score = scores.get(doc_id)
+                if score is None:
+                    continue
+                if score + scorer.block_bound(doc_id) + rest <= threshold:
+                    del scores[doc_id]
+                    continue
+                if cursor.advance(doc_id) == doc_id:
+                    tf = cursor.tf
+                    length_norm = 1 - BM25_B + BM25_B * doc_lengths[doc_id] / avg_doc_length
+                    scores[doc_id] = score + idf * ((tf * k1_plus) / (tf + BM25_K1 * length_norm))
+                elif score + rest <= threshold:
+                    del scores[doc_id]
+                    continue
+                kept.append(doc_id)
+            candidates = kept
+
+        if len(scores) >= limit:
+            # The k-th best partial score is a lower bound on the final k-th best score
+            threshold = heapq.nlargest(limit, scores.values())[-1] * (1 - BOUND_SLACK)
+            if remaining[i + 1] <= threshold:
+                scores = {doc_id: score for doc_id, score in scores.items() if score + rest > threshold}
+
+    # Keep only the top `limit` documents in a heap; ties go to the lower id
+    return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+
+import hashlib
+import importlib
+import json
+import math
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+import profiling
+from text_analysis import get_analyzer
+
+DEFAULT_ENCODER = "hashing"
+DEFAULT_DIMENSIONS = 256
+# Texts encoded per call, which bounds the memory of an encoder's intermediate arrays
+ENCODE_BATCH_SIZE = 1024
+# Below this many vectors an exact scan is as fast as probing partitions
+IVF_MIN_VECTORS = 4096
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 12
+# k-means is trained on at most this many vectors per partition
+KMEANS_SAMPLES_PER_LIST = 64
+# Scores computed per matrix product, which keeps score matrices around 64 MB
+MAX_SCORES_PER_MATMUL = 1 << 24
+
+# Vector file layout (all integers little-endian):
+#   header:   magic, version, vector count, dimensions, partition count, metadata length
+#   metadata: JSON with the encoder spec
+#   data:     doc ids (int64), content hashes (uint64), partition offsets (int64, partitions + 1),
+#             centroids and vectors (float32, row-major), each aligned to 8 bytes
+VECTOR_MAGIC = b"HOOPVEC\0"
+VECTOR_VERSION = 2
+VECTOR_HEADER = struct.Struct("<8sIQIIQ")
+ALIGNMENT = 8
+
+
+class Encoder(Protocol):
+    """
+    Turns texts into embeddings. Any local model can be plugged in by
+    registering a factory with register_encoder(), or by naming a
+    "module:attribute" factory taking the dimension count.
+    """
+
+    name: str
+    dimensions: int
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Return a (len(texts), dimensions) float32 array."""
+        ...
+
+
+class HashingEncoder:
+    """
+    Deterministic feature-hashing encoder. Stemmed tokens and adjacent token
+    pairs are hashed into `dimensions` signed buckets, weighted by 1 + log(tf).
+    It has no model to download, so it suits tests and a lexical baseline.
+
+    Only the 64-bit hash of each distinct stem is computed in Python; pair
+    hashes, feature counts and bucket sums are done for a whole batch at
+    once with array operations.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int = DEFAULT_DIMENSIONS) -> None:
+        if dimensions < 1:
+            raise ValueError("An encoder needs at least one dimension.")
+        self.dimensions = dimensions
+        self.analyzer = get_analyzer()
+        # stem -> 64-bit hash; bounded by the vocabulary
+        self.__hashes: Dict[str, int] = {}
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        hashes: List[int] = []
+        lengths: List[int] = []
+        for text in texts:
+            tokens = self.analyzer.analyze(text)
+            hashes.extend(self.__hash(token) for token in tokens)
+            lengths.append(len(tokens))
+        if not hashes:
+            return np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        token_hashes = np.array(hashes, dtype=np.uint64)
+        token_rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+
+        # Pairs of adjacent tokens within the same text
+        adjacent = token_rows[1:] == token_rows[:-1]
+        pair_hashes = _mix(token_hashes[:-1][adjacent] * _PAIR_MULTIPLIER + token_hashes[1:][adjacent])
+        features = np.concatenate((token_hashes, pair_hashes))
+        rows = np.concatenate((token_rows, token_rows[1:][adjacent]))
+
+        # Count each (text, feature) as a run of the sorted features
+        order = np.lexsort((features, rows))
+        features, rows = features[order], rows[order]
+        firsts = np.flatnonzero(np.concatenate(([True], (features[1:] != features[:-1]) | (rows[1:] != rows[:-1]))))
+        counts = np.diff(np.append(firsts, len(features)))
+        features, rows = features[firsts], rows[firsts]
+
+        signs = np.where(features >> np.uint64(63), 1.0, -1.0)
+        buckets = (features % np.uint64(self.dimensions)).astype(np.int64)
+        sums = np.bincount(rows * self.dimensions + buckets, weights=signs * (1.0 + np.log(counts)),
+                           minlength=len(texts) * self.dimensions)
+        return sums.reshape(len(texts), self.dimensions).astype(np.float32)
+
+    def __hash(self, token: str) -> int:
+        cached = self.__hashes.get(token)
+        if cached is None:
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            cached = self.__hashes[token] = int.from_bytes(digest, "little")
+        return cached
+
+
+# Combines the hashes of a token pair; order matters, so "a b" and "b a" differ
+_PAIR_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(hashes: np.ndarray) -> np.ndarray:
+    """Scramble uint64 hashes (the MurmurHash3 finalizer), so pair hashes spread over all bits."""
+    hashes = hashes ^ (hashes >> np.uint64(33))
+    hashes = hashes * np.uint64(0xFF51AFD7ED558CCD)
+    hashes = hashes ^ (hashes >> np.uint64(33))
+    hashes = hashes * np.uint64(0xC4CEB9FE1A85EC53)
+    return hashes ^ (hashes >> np.uint64(33))
+
+
+_encoders: Dict[str, Callable[[int], Encoder]] = {"hashing": HashingEncoder}
+
+
+def register_encoder(name: str, factory: Callable[[int], Encoder]) -> None:
+    """Make an encoder available by name; factory receives the dimension count."""
+    _encoders[name] = factory
+
+
+def get_encoder(name: str = DEFAULT_ENCODER, dimensions: int = DEFAULT_DIMENSIONS) -> Encoder:
+    """
+    Create an encoder from a registered name or a "module:attribute" factory.
+    Raises ValueError for unknown encoders.
+    """
+    factory = _encoders.get(name)
+    if factory is None and ":" in name:
+        module_name, _, attribute = name.partition(":")
+        try:
+            factory = getattr(importlib.import_module(module_name), attribute)
+        except (ImportError, AttributeError) as e:
+            raise ValueError(f"Could not load encoder {name}: {e}") from None
+    if factory is None:
+        raise ValueError(f"Unknown encoder {name}; choose one of {', '.join(sorted(_encoders))} "
+                         "or give module:factory.")
+    return factory(dimensions)
+
+
+def encode_batches(encoder: Encoder, texts: Iterable[str]) -> np.ndarray:
+    """Encode texts in batches of ENCODE_BATCH_SIZE and return one float32 matrix."""
+    batches = []
+    batch: List[str] = []
+    with profiling.stage("encode"):
+        for text in texts:
+            batch.append(text)
+            if len(batch) == ENCODE_BATCH_SIZE:
+                batches.append(np.asarray(encoder.encode(batch), dtype=np.float32))
+                batch = []
+        if batch:
+            batches.append(np.asarray(encoder.encode(batch), dtype=np.float32))
+    if not batches:
+        return np.empty((0, encoder.dimensions), dtype=np.float32)
+    return np.vstack(batches)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length in place, so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the index of and similarity to the most similar centroid of every vector."""
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    similarity = np.empty(len(vectors), dtype=np.float32)
+    rows = max(MAX_SCORES_PER_MATMUL // max(len(centroids), 1), 1)
+    for start in range(0, len(vectors), rows):
+        scores = vectors[start:start + rows] @ centroids.T
+        assignment[start:start + rows] = scores.argmax(axis=1)
+        similarity[start:start + rows] = scores[np.arange(len(scores)), assignment[start:start + rows]]
+    return assignment, similarity
+
+
+def spherical_kmeans(vectors: np.ndarray, lists: int, iterations: int = KMEANS_ITERATIONS,
+                     seed: int = 0) -> np.ndarray:
+    """
+    Cluster unit vectors by cosine similarity and return the (lists, dims)
+    unit centroids. Trained on a seeded sample of KMEANS_SAMPLES_PER_LIST
+    vectors per list; empty clusters are reseeded with the worst-fit vectors.
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > lists * KMEANS_SAMPLES_PER_LIST:
+        vectors = vectors[np.sort(rng.choice(len(vectors), lists * KMEANS_SAMPLES_PER_LIST, replace=False))]
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment, similarity = nearest_centroids(vectors, centroids)
+        # Sum the members of each cluster as contiguous runs of the sorted assignment
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=lists)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.zeros_like(centroids)
+        filled = counts > 0
+        sums[filled] = np.add.reduceat(vectors[order], starts[filled], axis=0)
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            sums[empty] = vectors[np.argsort(similarity)[:len(empty)]]
+        centroids = normalize(sums)
+    return centroids
+
+
+def top_k(scores: np.ndarray, doc_ids: np.ndarray, limit: int) -> List[Tuple[int, float]]:
+    """Top `limit` (doc_id, score) pairs, highest score first and ties to the lower id."""
+    if limit < len(scores):
+        candidates = np.argpartition(-scores, limit - 1)[:limit]
+        # Keep every row tied with the k-th score, so ties resolve by doc id
+        kth = scores[candidates].min()
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((doc_ids[candidates], -scores[candidates]))[:limit]
+    return [(int(doc_ids[candidates[i]]), float(scores[candidates[i]])) for i in order]
+
+
+class VectorIndex:
+    """
+    Document embeddings as one contiguous float32 matrix of unit rows.
+
+    Exact search scores every row with a matrix product, chunked so the
+    score matrix stays small. With partitions (IVF), rows are grouped by
+    their nearest k-means centroid and stored contiguously per partition; a
+    query only scores the rows of the `nprobe` partitions whose centroids
+    are closest, so its cost grows with nprobe * N / partitions instead of N.
+
+    Attributes:
+        doc_ids: int64 doc id of every row.
+        vectors: (N, dimensions) float32 matrix of unit-length embeddings.
+        centroids: (partitions, dimensions) float32 unit centroids; empty for exact search only.
+        list_offsets: Row range of each partition, plus an end sentinel.
+        encoder_spec: {"name", "dimensions"} of the encoder the vectors came from.
+        doc_hashes: uint64 content hash (segment.record_hash) of the record every
+            row was encoded from, so changed documents can be found and re-encoded.
+    """
+
+    def __init__(self, doc_ids: np.ndarray, vectors: np.ndarray, centroids: Optional[np.ndarray] = None,
+                 list_offsets: Optional[np.ndarray] = None, encoder_spec: Optional[Dict] = None,
+                 doc_hashes: Optional[np.ndarray] = None) -> None:
+        self.doc_ids = doc_ids
+        self.doc_hashes = doc_hashes if doc_hashes is not None else np.zeros(len(doc_ids), dtype=np.uint64)
+        self.vectors = vectors
+        dimensions = vectors.shape[1]
+        self.centroids = centroids if centroids is not None else np.empty((0, dimensions), dtype=np.float32)
+        self.list_offsets = list_offsets if list_offsets is not None else np.zeros(1, dtype=np.int64)
+        self.encoder_spec = encoder_spec or {"name": DEFAULT_ENCODER, "dimensions": dimensions}
+        self.__encoder: Optional[Encoder] = None
+
+    @property
+    def dimensions(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def partitions(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def encoder(self) -> Encoder:
+        """The encoder the index was built with, created on first use."""
+        if self.__encoder is None:
+            self.__encoder = get_encoder(self.encoder_spec["name"], self.encoder_spec["dimensions"])
+        return self.__encoder
+
+    @classmethod
+    def build(cls, doc_ids: Sequence[int], vectors: np.ndarray, partitions: Optional[int] = None,
+              encoder_spec: Optional[Dict] = None, seed: int = 0,
+              doc_hashes: Optional[Sequence[int]] = None) -> "VectorIndex":
+        """
+        Build an index over the rows of vectors, which are normalized in place.
+        partitions=None picks about sqrt(N) partitions once there are
+        IVF_MIN_VECTORS vectors and exact search below that; 0 forces exact search.
+        """
+        vectors = normalize(np.ascontiguousarray(vectors, dtype=np.float32))
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        doc_hashes = np.zeros(len(doc_ids), dtype=np.uint64) if doc_hashes is None else \
+            np.asarray(doc_hashes, dtype=np.uint64)
+        if len(doc_ids) != len(vectors) or len(doc_hashes) != len(vectors):
+            raise ValueError("Every vector needs exactly one doc id.")
+        if partitions is None:
+            partitions = int(math.sqrt(len(vectors))) if len(vectors) >= IVF_MIN_VECTORS else 0
+        partitions = min(partitions, len(vectors))
+        if partitions <= 1:
+            return cls(doc_ids, vectors, encoder_spec=encoder_spec, doc_hashes=doc_hashes)
+
+        with profiling.stage("kmeans"):
+            centroids = spherical_kmeans(vectors, partitions, seed=seed)
+            assignment, _ = nearest_centroids(vectors, centroids)
+        return cls.__partitioned(doc_ids, vectors, doc_hashes, centroids, assignment, encoder_spec)
+
+    @classmethod
+    def __partitioned(cls, doc_ids: np.ndarray, vectors: np.ndarray, doc_hashes: np.ndarray, centroids: np.ndarray,
+                      assignment: np.ndarray, encoder_spec: Optional[Dict]) -> "VectorIndex":
+        """Store each partition's rows contiguously, in doc id order within it."""
+        order = np.lexsort((doc_ids, assignment))
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=list_offsets[1:])
+        return cls(doc_ids[order], vectors[order], centroids, list_offsets, encoder_spec, doc_hashes[order])
+
+    def updated(self, removed: Iterable[int], doc_ids: Sequence[int], vectors: np.ndarray,
+                doc_hashes: Sequence[int]) -> "VectorIndex":
+        """
+        Return a copy without the rows of the removed doc ids and with the
+        given rows added; vectors are normalized in place. New rows join the
+        partition of their nearest centroid. The centroids themselves stay as
+        trained, so after many changes vector-build balances them again.
+        """
+        vectors = normalize(np.asarray(vectors, dtype=np.float32).reshape(len(doc_ids), self.dimensions))
+        keep = ~np.isin(self.doc_ids, np.fromiter(removed, dtype=np.int64))
+        all_ids = np.concatenate((self.doc_ids[keep], np.asarray(doc_ids, dtype=np.int64)))
+        all_vectors = np.concatenate((self.vectors[keep], vectors))
+        all_hashes = np.concatenate((self.doc_hashes[keep], np.asarray(doc_hashes, dtype=np.uint64)))
+        if len(np.unique(all_ids)) != len(all_ids):
+            raise ValueError("Every doc id may only have one vector.")
+        if not self.partitions:
+            return VectorIndex(all_ids, all_vectors, encoder_spec=self.encoder_spec, doc_hashes=all_hashes)
+        kept_lists = np.repeat(np.arange(self.partitions), np.diff(self.list_offsets))[keep]
+        with profiling.stage("assign"):
+            new_lists, _ = nearest_centroids(vectors, self.centroids)
+        return self.__partitioned(all_ids, all_vectors, all_hashes, self.centroids,
+                                  np.concatenate((kept_lists, new_lists)), self.encoder_spec)
+
+    def search(self, queries: Sequence[str], limit: int = 10,
+               nprobe: Optional[int] = DEFAULT_NPROBE) -> List[List[Tuple[int, float]]]:
+        """Encode the query texts and return the top `limit` (doc_id, cosine) pairs for each."""
+        with profiling.stage("encode"):
+            query_vectors = np.asarray(self.encoder.encode(list(queries)), dtype=np.float32)
+        return self.search_vectors(query_vectors, limit, nprobe)
+
+    def search_vectors(self, query_vectors: np.ndarray, limit: int = 10,
+                       nprobe: Optional[int] = DEFAULT_NPROBE) -> List[List[Tuple[int, float]]]:
+        """
+        Return the top `limit` (doc_id, cosine) pairs for each query vector.
+        nprobe partitions are searched per query; None, or an index without
+        partitions, scans every vector exactly.
+        """
+        if limit <= 0 or not len(self.vectors):
+            return [[] for _ in range(len(query_vectors))]
+        query_vectors = normalize(np.array(query_vectors, dtype=np.float32, ndmin=2))
+        with profiling.stage("score"):
+            if nprobe is None or not self.partitions or nprobe >= self.partitions:
+                return self.__scan(query_vectors, limit)
+            return self.__probe(query_vectors, limit, max(nprobe, 1))
+
+    def __scan(self, query_vectors: np.ndarray, limit: int) -> List[List[Tuple[int, float]]]:
+        """Exact search: score all rows against as many queries per matrix product as the budget allows."""
+        results = []
+        queries = max(MAX_SCORES_PER_MATMUL // len(self.vectors), 1)
+        for start in range(0, len(query_vectors), queries):
+            scores = query_vectors[start:start + queries] @ self.vectors.T
+            results.extend(top_k(row, self.doc_ids, limit) for row in scores)
+        return results
+
+    def __probe(self, query_vectors: np.ndarray, limit: int, nprobe: int) -> List[List[Tuple[int, float]]]:
+        """
+        IVF search: score only the rows of each query's nprobe nearest
+        partitions. Queries are grouped by partition, so each probed
+        partition is scored against all of its queries in one matrix product.
+        """
+        coarse = query_vectors @ self.centroids.T
+        nearest = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        queries_by_list = np.argsort(nearest.ravel(), kind="stable") // nprobe
+        list_starts = np.searchsorted(np.sort(nearest.ravel()), np.arange(self.partitions + 1))
+        candidates: List[List[Tuple[np.ndarray, np.ndarray]]] = [[] for _ in range(len(query_vectors))]
+        for i in np.flatnonzero(np.diff(list_starts)):
+            queries = queries_by_list[list_starts[i]:list_starts[i + 1]]
+            start, end = self.list_offsets[i], self.list_offsets[i + 1]
+            scores = query_vectors[queries] @ self.vectors[start:end].T
+            for query, row_scores in zip(queries, scores):
+                candidates[query].append((row_scores, self.doc_ids[start:end]))
+        results = []
+        for query_candidates in candidates:
+            scores = np.concatenate([row_scores for row_scores, _ in query_candidates])
+            doc_ids = np.concatenate([doc_ids for _, doc_ids in query_candidates])
+            results.append(top_k(scores, doc_ids, limit))
+        return results
+
+    def save(self, path: Path) -> None:
+        """Write the index to path atomically, in the layout described at the top of this module."""
+        metadata = json.dumps({"encoder": self.encoder_spec}).encode("utf-8")
+        sections = [self.doc_ids.astype("<i8"), self.doc_hashes.astype("<u8"), self.list_offsets.astype("<i8"),
+                    self.centroids.astype("<f4"), self.vectors.astype("<f4")]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with profiling.stage("save"), tmp_path.open("wb") as fh:
+            fh.write(VECTOR_HEADER.pack(VECTOR_MAGIC, VECTOR_VERSION, len(self.vectors), self.dimensions,
+                                        self.partitions, len(metadata)))
+            fh.write(metadata)
+            position = VECTOR_HEADER.size + len(metadata)
+            for section in sections:
+                padding = -position % ALIGNMENT
+                fh.write(b"\0" * padding)
+                payload = np.ascontiguousarray(section).tobytes()
+                fh.write(payload)
+                position += padding + len(payload)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "VectorIndex":
+        """
+        Memory-map a saved index; rows are paged in as queries touch them.
+        Raises FileNotFoundError if there is none and ValueError for foreign
+        or outdated files.
+        """
+        if not path.exists():
+            raise FileNotFoundError("Vector index not found in cache directory; run vector-build first.")
+        with profiling.stage("load"):
+            with path.open("rb") as fh:
+                buffer = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(buffer) < VECTOR_HEADER.size:
+                raise ValueError(f"Vector file {path} is truncated.")
+            magic, version, count, dimensions, partitions, metadata_length = VECTOR_HEADER.unpack_from(buffer, 0)
+            if magic != VECTOR_MAGIC:
+                raise ValueError(f"{path} is not a vector index file.")
+            if version != VECTOR_VERSION:
+                raise ValueError(f"Vector index version {version} is not supported; run vector-build again.")
+            position = VECTOR_HEADER.size
+            metadata = json.loads(buffer[position:position + metadata_length])
+            position += metadata_length
+
+            arrays = []
+            for dtype, length in (("<i8", count), ("<u8", count), ("<i8", partitions + 1),
+                                  ("<f4", partitions * dimensions), ("<f4", count * dimensions)):
+                position += -position % ALIGNMENT
+                size = np.dtype(dtype).itemsize * length
+                if position + size > len(buffer):
+                    raise ValueError(f"Vector file {path} is truncated.")
+                arrays.append(np.frombuffer(buffer, dtype=dtype, count=length, offset=position))
+                position += size
+        doc_ids, doc_hashes, list_offsets, centroids, vectors = arrays
+        return cls(doc_ids, vectors.reshape(count, dimensions), centroids.reshape(partitions, dimensions),
+                   list_offsets, metadata["encoder"], doc_hashes)
@@ -0,0 +1,79 @@
+import json
+import random
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+# The CLI modules import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "cli"))
+
+import text_analysis  # noqa: E402
+from parallel_build import document_text  # noqa: E402
+
+STOPWORDS = ("the", "a", "of", "and", "in", "to", "with", "his", "her")
+WORDS = (
+    "space", "robot", "dragon", "wizard", "pirate", "ocean", "castle", "knight", "ghost", "detective",
+    "island", "treasure", "jedi", "empire", "star", "war", "wars", "love", "dark", "haunted",
+    "running", "runner", "runs", "city", "house", "dinner", "school", "family", "brave", "quick",
+    "alien", "shark", "magic", "night", "king", "queen", "travel", "time", "future", "hero",
+)
+# Large enough that common terms span several posting blocks (SKIP_INTERVAL = 64)
+DOC_COUNT = 400
+
+
+def make_records(count: int = DOC_COUNT, seed: int = 7) -> List[Dict[str, Any]]:
+    """Movie records in the movies.json shape, with Zipf-like word frequencies and sparse ids."""
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(WORDS) + 1)]
+    doc_ids = rng.sample(range(1, count * 5), count)
+    records = []
+    for doc_id in doc_ids:
+        title = " ".join(rng.choices(WORDS, weights, k=rng.randint(1, 4))).title()
+        words = rng.choices(WORDS + STOPWORDS, weights + [0.5] * len(STOPWORDS), k=rng.randint(3, 40))
+        records.append({"id": doc_id, "title": title, "description": " ".join(words) + "."})
+    return records
+
+
+@pytest.fixture(scope="session", autouse=True)
+def analyzer(tmp_path_factory):
+    """
+    Install a shared analyzer with a small stopwords list, so tests do not
+    need hoopla/data; parallel build workers are handed its stopwords path.
+    """
+    path = tmp_path_factory.mktemp("analysis") / "stopwords.txt"
+    path.write_text("\n".join(STOPWORDS) + "\n", encoding="utf-8")
+    text_analysis._default_analyzer = text_analysis.TextAnalyzer(path)
+    return text_analysis._default_analyzer
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch) -> Path:
+    """A fresh cache directory per test, also exposed as $HOOPLA_CACHE_DIR."""
+    path = tmp_path / "cache"
+    monkeypatch.setenv("HOOPLA_CACHE_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def records() -> List[Dict[str, Any]]:
+    return make_records()
+
+
+@pytest.fixture
+def corpus_file(tmp_path, records) -> Path:
+    """The records written as a data file; build() accepts its absolute path as the filename."""
+    path = tmp_path / "movies.json"
+    path.write_text(json.dumps({"movies": records}), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def reference(analyzer, records) -> Dict[str, Dict[int, List[int]]]:
+    """Plain term -> doc id -> positions index of the records, built without CompactIndex."""
+    index: Dict[str, Dict[int, List[int]]] = {}
+    for record in records:
+        for stem, position in analyzer.analyze_positions(document_text(record)):
+            index.setdefault(stem, {}).setdefault(record["id"], []).append(position)
+    return index
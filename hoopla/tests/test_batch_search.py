@@ -0,0 +1,37 @@
+import pytest
+
+import batch_search
+from keyword_search_cli import InvertedIndex
+
+QUERIES = [
+    "space", "space robot", "haunted castle", "brave knight treasure", "dragon wizard pirate ocean",
+    "space robot dragon wizard pirate ocean castle knight", "hero future time", "robot space",
+    "the space", "missing", "missing hero", "", "the", "space space robot", "Running runs",
+]
+
+
+@pytest.fixture(params=["built", "loaded"])
+def index(request, cache_dir, corpus_file) -> InvertedIndex:
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.build(filename=str(corpus_file))
+    if request.param == "loaded":
+        index.save()
+        index = InvertedIndex(cache_dir=cache_dir)
+        index.load()
+    return index
+
+
+@pytest.mark.parametrize("limit", [1, 5, 50, 1000])
+def test_search_batch_equals_search(index, limit):
+    assert index.search_batch(QUERIES, limit) == [index.search(query, limit) for query in QUERIES]
+
+
+def test_search_batch_in_blocks_of_queries(index, monkeypatch):
+    # Two score rows per block, so the queries are multiplied in several blocks
+    monkeypatch.setattr(batch_search, "SCORE_BLOCK_CELLS", 2 * len(index.docmap))
+    assert index.search_batch(QUERIES, 10) == [index.search(query, 10) for query in QUERIES]
+
+
+def test_search_batch_without_queries_or_limit(index):
+    assert index.search_batch([], 5) == []
+    assert index.search_batch(["space", "missing"], 0) == [[], []]
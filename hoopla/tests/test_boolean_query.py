@@ -0,0 +1,114 @@
+import re
+from typing import Dict, List, Set
+
+import pytest
+
+from boolean_query import And, Not, Or, Phrase, QueryParser, Term, match_documents
+from keyword_search_cli import InvertedIndex
+
+
+def shape(node):
+    """A parsed query as nested tuples, for comparisons."""
+    if node is None or isinstance(node, Term):
+        return None if node is None else node.term
+    if isinstance(node, Phrase):
+        return ("PHRASE", *node.terms)
+    if isinstance(node, Not):
+        return ("NOT", shape(node.child))
+    assert isinstance(node, (And, Or))
+    return ("AND" if isinstance(node, And) else "OR", *(shape(child) for child in node.children))
+
+
+def brute_force(node, reference: Dict[str, Dict[int, List[int]]], all_doc_ids: Set[int]) -> Set[int]:
+    """Evaluate a parsed query by scanning the plain reference index."""
+    if node is None:
+        return set()
+    if isinstance(node, Term):
+        return set(reference.get(node.term, ()))
+    if isinstance(node, Phrase):
+        matches = set()
+        for doc_id in all_doc_ids:
+            positions = [set(reference.get(term, {}).get(doc_id, ())) for term, _ in node.terms]
+            first_term = positions[0]
+            if any(all(start + offset in term_positions
+                       for term_positions, (_, offset) in zip(positions, node.terms))
+                   for start in first_term):
+                matches.add(doc_id)
+        return matches
+    if isinstance(node, Not):
+        return all_doc_ids - brute_force(node.child, reference, all_doc_ids)
+    results = [brute_force(child, reference, all_doc_ids) for child in node.children]
+    return set.intersection(*results) if isinstance(node, And) else set.union(*results)
+
+
+@pytest.fixture
+def parser(analyzer) -> QueryParser:
+    return QueryParser(analyzer)
+
+
+@pytest.fixture
+def index(cache_dir, corpus_file) -> InvertedIndex:
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.build(filename=str(corpus_file))
+    return index
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("space", "space"),
+    ("Running", "run"),
+    ("space robot", ("AND", "space", "robot")),
+    ("space AND robot", ("AND", "space", "robot")),
+    ("space OR robot ghost", ("OR", "space", ("AND", "robot", "ghost"))),
+    ("(space OR robot) ghost", ("AND", ("OR", "space", "robot"), "ghost")),
+    ("space NOT robot", ("AND", "space", ("NOT", "robot"))),
+    ("NOT NOT space", ("NOT", ("NOT", "space"))),
+    ('"brave knight" OR dragon', ("OR", ("PHRASE", ("brave", 0), ("knight", 1)), "dragon")),
+    ('"knight of the castle"', ("PHRASE", ("knight", 0), ("castl", 3))),
+    ('"dragon"', "dragon"),
+    ("the space", "space"),
+    ("the", None),
+    ('"the of"', None),
+    ("NOT the", None),
+])
+def test_parse(parser, query, expected):
+    assert shape(parser.parse(query)) == expected
+
+
+@pytest.mark.parametrize("query, message", [
+    ("(space", "Missing closing parenthesis"),
+    ("((space OR robot) ghost", "Missing closing parenthesis"),
+    ("", "Expected a term but found end of query"),
+    ("space AND", "Expected a term but found end of query"),
+    ("space OR", "Expected a term but found end of query"),
+    ("NOT", "Expected a term but found end of query"),
+    ("OR space", "Expected a term but found 'OR'"),
+    ("space AND OR robot", "Expected a term but found 'OR'"),
+    ("()", "Expected a term but found ')'"),
+    (")", "Expected a term but found ')'"),
+    ("space )", "Unexpected ')'"),
+    ('"brave knight', "Unterminated phrase"),
+    ('space "', "Unterminated phrase"),
+])
+def test_parse_errors(parser, query, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        parser.parse(query)
+
+
+def test_boolean_search_reports_parse_errors(index):
+    with pytest.raises(ValueError):
+        index.boolean_search("space AND (robot")
+
+
+@pytest.mark.parametrize("query", [
+    "space", "space robot", "space OR robot", "dragon OR ghost OR shark", "castle NOT haunted",
+    "NOT space", "NOT (space OR robot OR dragon)", "(space OR robot) AND (ghost OR castle)",
+    "space AND NOT robot AND NOT dragon", '"brave knight"', '"space robot" OR "haunted castle"',
+    '"running runner runs"', '"robot dragon"', '"space robot dragon"',
+    '"wizard pirate" NOT space', '"space robot" NOT dragon', '"space space"', "missing", "space missing",
+    "missing OR dragon", '"space missing"', "NOT missing", "the",
+])
+def test_matches_brute_force(parser, index, reference, records, query):
+    all_doc_ids = {record["id"] for record in records}
+    expected = sorted(brute_force(parser.parse(query), reference, all_doc_ids))
+    assert index.boolean_search(query) == expected
+    assert match_documents(parser.parse(query), index.index, lambda: sorted(all_doc_ids)) == expected
@@ -0,0 +1,110 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import keyword_search_cli
+from conftest import make_records
+from keyword_search_cli import SEGMENT_FILENAME, InvertedIndex
+
+QUERIES = ("space robot", "haunted castle", "dragon", "brave knight treasure", "quick runs", "the")
+
+
+def snapshot(index: InvertedIndex) -> dict:
+    """Postings with positions, docmap, doc lengths and token offsets of an index, as plain values."""
+    compact = index.index
+    return {
+        "postings": {compact.terms[term_id]: list(compact.postings(term_id).positional_items())
+                     for term_id in range(len(compact.terms))},
+        "docmap": {doc_id: dict(index.docmap[doc_id]) for doc_id in index.docmap},
+        "doc_lengths": dict(index.doc_lengths),
+        "token_starts": {doc_id: list(index.token_starts[doc_id]) for doc_id in index.docmap},
+    }
+
+
+def searches(index: InvertedIndex) -> dict:
+    return {query: index.search(query, 10) for query in QUERIES}
+
+
+def reloaded(cache_dir: Path) -> InvertedIndex:
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.load()
+    return index
+
+
+@pytest.fixture
+def serial(tmp_path, corpus_file) -> InvertedIndex:
+    index = InvertedIndex(cache_dir=tmp_path / "serial")
+    index.build(filename=str(corpus_file))
+    index.save()
+    return index
+
+
+def test_parallel_build_matches_serial(tmp_path, corpus_file, serial, monkeypatch):
+    # Several batches, each split across the workers
+    monkeypatch.setattr(keyword_search_cli, "PARALLEL_BATCH_SIZE", 50)
+    index = InvertedIndex(cache_dir=tmp_path / "parallel")
+    index.build(workers=2, filename=str(corpus_file))
+    index.save()
+
+    assert snapshot(index) == snapshot(serial)
+    assert searches(reloaded(tmp_path / "parallel")) == searches(reloaded(tmp_path / "serial"))
+
+
+def changed_records(records: list, added: int, updated: int, deleted: int) -> list:
+    """The records with `deleted` dropped, `updated` rewritten and `added` new ones appended."""
+    changed = [dict(record) for record in records[deleted:]]
+    for record in changed[:updated]:
+        record["description"] = "haunted space castle with a brave robot. " + record["description"]
+    new_ids = set(range(1, len(records) * 6)) - {record["id"] for record in records}
+    for doc_id, record in zip(sorted(new_ids)[:added], make_records(added, seed=99)):
+        changed.append(dict(record, id=doc_id))
+    return changed
+
+
+@pytest.mark.parametrize("added, updated, deleted", [(25, 0, 0), (0, 30, 0), (0, 0, 40), (25, 30, 40)])
+def test_incremental_build_matches_full_build(tmp_path, records, serial, added, updated, deleted):
+    changed_file = tmp_path / "changed.json"
+    changed_file.write_text(json.dumps({"movies": changed_records(records, added, updated, deleted)}),
+                            encoding="utf-8")
+    full = InvertedIndex(cache_dir=tmp_path / "full")
+    full.build(filename=str(changed_file))
+    full.save()
+
+    index = InvertedIndex(cache_dir=tmp_path / "serial")
+    changes = index.build_incremental(filename=str(changed_file))
+    index.save()
+
+    assert changes == {"added": added, "updated": updated, "deleted": deleted}
+    assert snapshot(index) == snapshot(full)
+    assert searches(reloaded(tmp_path / "serial")) == searches(reloaded(tmp_path / "full"))
+
+
+def test_incremental_build_without_changes_keeps_the_segment(tmp_path, corpus_file, serial):
+    segment = tmp_path / "serial" / SEGMENT_FILENAME
+    before = segment.read_bytes()
+    index = InvertedIndex(cache_dir=tmp_path / "serial")
+    assert index.build_incremental(filename=str(corpus_file)) == {"added": 0, "updated": 0, "deleted": 0}
+    index.save()
+    assert segment.read_bytes() == before
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_spilled_build_matches_in_memory_build(tmp_path, corpus_file, serial, monkeypatch, workers):
+    monkeypatch.setattr(keyword_search_cli, "PARALLEL_BATCH_SIZE", 25)
+    spilled = []
+    flush = InvertedIndex._InvertedIndex__flush_partial
+
+    def counting_flush(self, number):
+        spilled.append(number)
+        return flush(self, number)
+
+    monkeypatch.setattr(InvertedIndex, "_InvertedIndex__flush_partial", counting_flush)
+    index = InvertedIndex(cache_dir=tmp_path / "spilled")
+    # Small enough to spill every few dozen documents
+    index.build(workers=workers, filename=str(corpus_file), memory_budget=20_000)
+
+    assert len(spilled) > 3
+    assert not list((tmp_path / "spilled").glob("partial-*.seg"))
+    assert snapshot(index) == snapshot(serial)
+    assert searches(reloaded(tmp_path / "spilled")) == searches(reloaded(tmp_path / "serial"))
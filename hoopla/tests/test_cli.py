@@ -0,0 +1,41 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import keyword_search_cli
+
+
+def run_cli(monkeypatch, capsys, *argv: str) -> str:
+    """Run keyword_search_cli with the given arguments and return what it printed."""
+    monkeypatch.setattr(sys, "argv", ["keyword_search_cli.py", *argv])
+    monkeypatch.delenv("HOOPLA_SERVER", raising=False)
+    keyword_search_cli.main()
+    return capsys.readouterr().out
+
+
+def test_search_ranks_the_built_index(monkeypatch, capsys, corpus_file):
+    run_cli(monkeypatch, capsys, "build", "--data-file", str(corpus_file))
+    output = run_cli(monkeypatch, capsys, "search", "space robot", "--limit", "3", "--cache-size", "0")
+    index = keyword_search_cli.InvertedIndex()
+    index.load()
+    lines = output.splitlines()
+    assert lines[0] == "Searching for: space robot"
+    assert [int(line.split(",")[0].removeprefix("ID: ")) for line in lines[1:]] == \
+        [doc_id for doc_id, _ in index.search("space robot", 3)]
+
+
+def test_search_without_an_index_names_the_missing_segment(monkeypatch, capsys, cache_dir):
+    output = run_cli(monkeypatch, capsys, "search", "space")
+    assert str(cache_dir / keyword_search_cli.SEGMENT_FILENAME) in output
+    assert "run the build command first" in output
+    assert "Data file" not in output
+
+
+def test_startup_skips_the_subsystems_of_other_commands():
+    # Modules that only some commands need are imported when those commands run
+    lazy = ("multiprocessing", "concurrent.futures.process", "sharding", "boolean_query", "batch_search",
+            "vector_index", "numpy")
+    script = f"import sys, keyword_search_cli; print([m for m in {lazy!r} if m in sys.modules])"
+    cli = Path(keyword_search_cli.__file__).parent
+    result = subprocess.run([sys.executable, "-c", script], cwd=cli, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,109 @@
+from typing import Dict, List
+
+import pytest
+
+from corpus_stats import CorpusStats, bm25_idf, bm25_saturation, dense_doc_lengths, smoothed_idf
+from keyword_search_cli import InvertedIndex
+from parallel_build import document_text
+from postings import SKIP_INTERVAL
+
+
+def doc_lengths_of(reference: Dict[str, Dict[int, List[int]]]) -> Dict[int, int]:
+    """Indexed tokens per document, counted from the plain reference index."""
+    lengths: Dict[int, int] = {}
+    for postings in reference.values():
+        for doc_id, positions in postings.items():
+            lengths[doc_id] = lengths.get(doc_id, 0) + len(positions)
+    return lengths
+
+
+def assert_matches_brute_force(index: InvertedIndex, reference: Dict[str, Dict[int, List[int]]],
+                               doc_ids: List[int]) -> None:
+    stats = index.stats
+    lengths = doc_lengths_of(reference)
+    doc_count = len(doc_ids)
+    total = sum(lengths.values())
+    assert stats.doc_count == doc_count
+    assert stats.total_doc_length == total
+    assert stats.avg_doc_length == pytest.approx(total / doc_count)
+    assert index.avg_doc_length == pytest.approx(total / doc_count)
+    for doc_id in doc_ids:
+        assert stats.doc_lengths_by_id[doc_id] == lengths.get(doc_id, 0)
+
+    assert list(index.index) == sorted(reference)
+    # get_idf analyzes its word like a query term
+    for word in ("space", "Haunted", "running", "missing"):
+        postings = reference.get(index.analyzer.analyze_term(word), {})
+        expected_idf = smoothed_idf(doc_count, len(postings)) if postings else 0.0
+        assert index.get_idf(word) == pytest.approx(expected_idf)
+    for term_id, term in enumerate(index.index.terms):
+        postings = reference[term]
+        assert stats.doc_freqs[term_id] == len(postings)
+        assert stats.idfs[term_id] == pytest.approx(smoothed_idf(doc_count, len(postings)))
+        assert stats.bm25_idfs[term_id] == pytest.approx(bm25_idf(doc_count, len(postings)))
+        assert index.get_bm25_idf(term) == stats.bm25_idfs[term_id]
+
+        # Every posting block's bound is the largest saturation of its postings
+        saturations = [bm25_saturation(len(positions), lengths[doc_id], total / doc_count)
+                       for doc_id, positions in sorted(postings.items())]
+        blocks = index.index.postings(term_id)
+        expected_blocks = [max(saturations[start:start + SKIP_INTERVAL])
+                           for start in range(0, len(saturations), SKIP_INTERVAL)]
+        assert list(stats.block_max_scores[blocks.skip_lo:blocks.skip_hi]) == pytest.approx(expected_blocks)
+        assert stats.term_max_scores[term_id] == pytest.approx(max(saturations))
+
+
+@pytest.fixture
+def built(cache_dir, corpus_file) -> InvertedIndex:
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.build(filename=str(corpus_file))
+    return index
+
+
+def test_built_stats_match_brute_force(built, reference, records):
+    assert_matches_brute_force(built, reference, [record["id"] for record in records])
+
+
+def test_loaded_stats_match_brute_force(built, cache_dir, reference, records):
+    built.save()
+    loaded = InvertedIndex(cache_dir=cache_dir)
+    loaded.load()
+    assert_matches_brute_force(loaded, reference, [record["id"] for record in records])
+
+
+def test_stats_follow_document_changes(built, analyzer, records):
+    changed = dict(records[0], description="A haunted robot in space, space and space again.")
+    deleted = records[1]["id"]
+    built.update_document(changed)
+    built.delete_document(deleted)
+    built.stats  # computed before the next change, so a stale cache would show
+    added = {"id": 10_000_000, "title": "Brave Knight", "description": "The knight of the dragon castle."}
+    built.add_document(added)
+
+    remaining = [changed, added] + records[2:]
+    reference: Dict[str, Dict[int, List[int]]] = {}
+    for record in remaining:
+        for stem, position in analyzer.analyze_positions(document_text(record)):
+            reference.setdefault(stem, {}).setdefault(record["id"], []).append(position)
+    assert_matches_brute_force(built, reference, [record["id"] for record in remaining])
+
+
+def test_sparse_ids_keep_the_lengths_mapping(built):
+    # The added id is far beyond 4 x N, so no dense table is kept
+    built.add_document({"id": 10_000_000, "title": "Space", "description": "Robot."})
+    stats = built.stats
+    assert len(stats.dense_lengths) == 0
+    assert stats.doc_lengths_by_id[10_000_000] == 2
+
+
+def test_dense_doc_lengths():
+    assert list(dense_doc_lengths({3: 5, 0: 2})) == [2, 0, 0, 5]
+    assert len(dense_doc_lengths({})) == 0
+    assert len(dense_doc_lengths({-1: 3})) == 0
+    assert len(dense_doc_lengths({1: 1, 100_000: 1})) == 0
+
+
+def test_empty_corpus():
+    stats = CorpusStats(0, 0, [], [], [], [], [], {})
+    assert stats.avg_doc_length == 0.0
+    assert stats.doc_lengths_by_id == {}
@@ -0,0 +1,114 @@
+import random
+import zlib
+from array import array
+from typing import Any, Dict
+
+import pytest
+
+import docstore
+from docstore import ABSENT_FIELDS, DOCSTORE_BLOCK_SIZE, DocumentStore, docstore_chunks, document_field, split_record
+
+
+def make_store(docmap: Dict[int, Dict[str, Any]]) -> DocumentStore:
+    """Write the docmap's columns as a segment would and read them back through memoryviews."""
+    doc_ids = array("q", sorted(docmap))
+    title_offsets = array("Q", [0])
+    title_blob = bytearray()
+    block_offsets = array("Q", [0])
+    blocks = b"".join(docstore_chunks(docmap, doc_ids, title_offsets, title_blob, block_offsets))
+    return DocumentStore(memoryview(doc_ids), memoryview(title_offsets), memoryview(bytes(title_blob)),
+                         memoryview(block_offsets), memoryview(blocks))
+
+
+ODD_RECORDS = {
+    1: {"id": 1, "title": "Space Robot", "description": "A robot in space.", "year": 1999},
+    2: {"id": 2, "title": "", "description": "Untitled."},
+    3: {"title": "No Id", "description": "The id is implied."},
+    4: {"id": 4, "description": "No title."},
+    5: {"description": "Neither id nor title."},
+    6: {"id": "6", "title": "String Id"},
+    7: {"id": 7, "title": 1984, "tags": ["dystopia", None]},
+    8: {"id": 8, "title": "Café Noir ☕", "description": "Ünïcode.", "nested": {"a": [1, 2]}},
+}
+
+
+def test_records_read_back_unchanged():
+    store = make_store(ODD_RECORDS)
+    assert len(store) == len(ODD_RECORDS)
+    assert list(store) == sorted(ODD_RECORDS)
+    for doc_id, record in ODD_RECORDS.items():
+        assert store[doc_id] == record
+        for name in ("id", "title", "description", "year", "tags", "missing"):
+            assert store.field(doc_id, name, "default") == record.get(name, "default"), (doc_id, name)
+            assert document_field(store, doc_id, name) == document_field(ODD_RECORDS, doc_id, name)
+
+
+def test_implied_fields_are_not_stored_again():
+    title, rest = split_record({"id": 1, "title": "Space", "description": "Robot."}, 1)
+    assert (title, rest) == ("Space", {"description": "Robot."})
+    # A record without id or title lists them as absent, so they are not implied on read
+    title, rest = split_record({"description": "Robot."}, 5)
+    assert (title, rest) == ("", {"description": "Robot.", ABSENT_FIELDS: ["id", "title"]})
+    # Values that differ from the implied ones are kept with the other fields
+    title, rest = split_record({"id": "6", "title": 1984}, 6)
+    assert (title, rest) == ("", {"id": "6", "title": 1984})
+
+
+def test_absent_fields_return_the_default():
+    store = make_store(ODD_RECORDS)
+    assert "id" not in store[3] and store[3]["title"] == "No Id"
+    assert "title" not in store[4] and store[4]["id"] == 4
+    assert store[5] == {"description": "Neither id nor title."}
+    assert store.field(5, "id") is None
+    assert store.field(5, "title", "untitled") == "untitled"
+    assert store.field(4, "title", "untitled") == "untitled"
+    assert store.field(2, "title", "untitled") == ""
+    assert store.field(5, ABSENT_FIELDS) is None
+
+
+def test_reads_across_block_boundaries():
+    rng = random.Random(11)
+    count = DOCSTORE_BLOCK_SIZE * 3 + 5
+    doc_ids = rng.sample(range(1, 10_000), count)
+    docmap = {doc_id: {"id": doc_id, "title": f"Title {doc_id}", "description": "word " * rng.randint(0, 30)}
+              for doc_id in doc_ids}
+    store = make_store(docmap)
+    assert len(store.block_offsets) == 5
+    order = sorted(doc_ids)
+    # Both sides of every boundary, in id order, reversed and shuffled
+    edges = [order[i] for block in range(1, 4) for i in (block * DOCSTORE_BLOCK_SIZE - 1, block * DOCSTORE_BLOCK_SIZE)
+             if i < count]
+    shuffled = order[:]
+    rng.shuffle(shuffled)
+    for doc_id in order + order[::-1] + shuffled + edges:
+        assert store[doc_id] == docmap[doc_id]
+        assert store.field(doc_id, "description") == docmap[doc_id]["description"]
+        assert store.field(doc_id, "title") == docmap[doc_id]["title"]
+    assert store[order[-1]] == docmap[order[-1]]
+
+
+def test_reading_in_id_order_decompresses_each_block_once(monkeypatch):
+    docmap = {doc_id: {"id": doc_id, "title": "T", "description": str(doc_id)} for doc_id in range(50)}
+    store = make_store(docmap)
+    calls = []
+    decompress = zlib.decompress
+    monkeypatch.setattr(docstore.zlib, "decompress", lambda data: calls.append(1) or decompress(data))
+    assert [store[doc_id]["description"] for doc_id in store] == [str(doc_id) for doc_id in range(50)]
+    assert len(calls) == -(-50 // DOCSTORE_BLOCK_SIZE)
+    # Titles come from their own column
+    assert [store.field(doc_id, "title") for doc_id in range(50)] == ["T"] * 50
+    assert len(calls) == -(-50 // DOCSTORE_BLOCK_SIZE)
+
+
+def test_missing_documents():
+    store = make_store({2: {"id": 2, "title": "Two"}, 4: {"id": 4, "title": "Four"}})
+    for doc_id in (0, 3, 5):
+        assert doc_id not in store
+        assert store.field(doc_id, "title", "none") == "none"
+        with pytest.raises(KeyError):
+            store[doc_id]
+    assert 2 in store and 4 in store
+    assert store.get(3) is None
+    assert document_field(store, 3, "title", "none") == "none"
+    empty = make_store({})
+    assert len(empty) == 0 and list(empty) == [] and 1 not in empty
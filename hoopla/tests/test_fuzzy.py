@@ -0,0 +1,144 @@
+import random
+
+import pytest
+
+from fuzzy import MAX_DISTANCE, PREFIX_LENGTH, DeletionIndex, auto_distance, osa_distance
+
+LEXICON = sorted({
+    "space", "spice", "spade", "spa", "robot", "robin", "castl", "haunt", "dragon", "wizard", "knight",
+    "ab", "an", "abc", "jedi", "empir", "adventur", "adventurer", "adventuress", "adventurous",
+    "spaceship", "spaceships", "spacesuit", "star", "stare", "tsar", "war", "ward",
+})
+
+
+def brute_force_osa(a: str, b: str) -> int:
+    """Full optimal string alignment table, without banding or early exit."""
+    table = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        table[i][0] = i
+    for j in range(len(b) + 1):
+        table[0][j] = j
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            table[i][j] = min(table[i - 1][j] + 1, table[i][j - 1] + 1,
+                              table[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                table[i][j] = min(table[i][j], table[i - 2][j - 2] + 1)
+    return table[len(a)][len(b)]
+
+
+@pytest.fixture
+def fuzzy_index() -> DeletionIndex:
+    return DeletionIndex.from_terms(LEXICON)
+
+
+def closest_terms(fuzzy_index: DeletionIndex, term: str, max_distance=None):
+    return [LEXICON[term_id] for term_id in fuzzy_index.closest(term, LEXICON, max_distance)]
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    ("space", "space", 0), ("spcae", "space", 1), ("sapce", "space", 1), ("psace", "space", 1),
+    ("spaec", "space", 1), ("spice", "space", 1), ("spac", "space", 1), ("sppace", "space", 1),
+    ("scape", "space", 2), ("ca", "ac", 1), ("", "ab", 2), ("abc", "ca", 3), ("kitten", "sitting", 3),
+])
+def test_osa_distance(a, b, expected):
+    assert brute_force_osa(a, b) == expected
+    for max_distance in range(4):
+        assert osa_distance(a, b, max_distance) == min(expected, max_distance + 1)
+        assert osa_distance(b, a, max_distance) == min(expected, max_distance + 1)
+
+
+def test_osa_distance_matches_the_full_table():
+    rng = random.Random(3)
+    for _ in range(2000):
+        a = "".join(rng.choices("abc", k=rng.randint(0, 7)))
+        b = "".join(rng.choices("abc", k=rng.randint(0, 7)))
+        expected = brute_force_osa(a, b)
+        for max_distance in range(4):
+            assert osa_distance(a, b, max_distance) == min(expected, max_distance + 1), (a, b, max_distance)
+
+
+@pytest.mark.parametrize("term, expected", [
+    ("a", 0), ("ab", 0), ("abc", 1), ("abcde", 1), ("abcdef", 2), ("abcdefghijkl", 2),
+])
+def test_auto_distance(term, expected):
+    assert auto_distance(term) == expected
+
+
+def test_closest_substitution(fuzzy_index):
+    assert closest_terms(fuzzy_index, "robit") == ["robin", "robot"]
+    assert closest_terms(fuzzy_index, "dragan") == ["dragon"]
+    # An exact match is the only closest term
+    assert closest_terms(fuzzy_index, "space") == ["space"]
+
+
+def test_closest_transposition(fuzzy_index):
+    assert closest_terms(fuzzy_index, "spcae") == ["space"]
+    assert closest_terms(fuzzy_index, "dargon") == ["dragon"]
+    assert closest_terms(fuzzy_index, "ejdi") == ["jedi"]
+    assert closest_terms(fuzzy_index, "wra", 1) == ["war"]
+    assert closest_terms(fuzzy_index, "tsra") == ["tsar"]
+
+
+def test_closest_follows_auto_distance(fuzzy_index):
+    # Two characters: only exact matches
+    assert closest_terms(fuzzy_index, "ab") == ["ab"]
+    assert closest_terms(fuzzy_index, "ba") == []
+    assert closest_terms(fuzzy_index, "ba", 1) == ["ab"]
+    # Three to five characters: one edit
+    assert closest_terms(fuzzy_index, "spxyz") == []
+    assert closest_terms(fuzzy_index, "spacx") == ["space"]
+    assert closest_terms(fuzzy_index, "jeid") == ["jedi"]
+    # Six characters and more: two edits
+    assert closest_terms(fuzzy_index, "dzagan") == ["dragon"]
+    assert closest_terms(fuzzy_index, "kngiht") == ["knight"]
+    assert closest_terms(fuzzy_index, "wzzzzd") == []
+    assert closest_terms(fuzzy_index, "knight", 0) == ["knight"]
+
+
+def test_closest_beyond_the_prefix(fuzzy_index):
+    assert PREFIX_LENGTH == 7
+    # Edits past the 7 character prefix are verified on the full term
+    assert closest_terms(fuzzy_index, "adventurx") == ["adventur"]
+    assert closest_terms(fuzzy_index, "adventurxx") == ["adventur", "adventurer"]
+    assert closest_terms(fuzzy_index, "adventursse") == ["adventuress"]
+    assert closest_terms(fuzzy_index, "spacesihps") == ["spaceships"]
+    assert closest_terms(fuzzy_index, "spacesiut") == ["spacesuit"]
+    # Swaps and insertions across the prefix boundary
+    assert closest_terms(fuzzy_index, "adventruer") == ["adventurer"]
+    assert closest_terms(fuzzy_index, "advenXturous") == ["adventurous"]
+    assert closest_terms(fuzzy_index, "xyzadventur") == []
+
+
+def test_search_finds_every_term_within_reach(fuzzy_index):
+    rng = random.Random(5)
+    alphabet = "abcdeinorstuv"
+    for _ in range(300):
+        term = rng.choice(LEXICON)
+        query = list(term)
+        for _ in range(rng.randint(0, MAX_DISTANCE)):
+            edit = rng.choice("sidt")
+            i = rng.randrange(len(query) + (edit == "i"))
+            if edit == "s" and i < len(query):
+                query[i] = rng.choice(alphabet)
+            elif edit == "i":
+                query.insert(i, rng.choice(alphabet))
+            elif edit == "d" and len(query) > 1 and i < len(query):
+                del query[i]
+            elif edit == "t" and i + 1 < len(query):
+                query[i], query[i + 1] = query[i + 1], query[i]
+        query = "".join(query)
+        for max_distance in range(MAX_DISTANCE + 1):
+            expected = sorted((term_id, brute_force_osa(query, other)) for term_id, other in enumerate(LEXICON)
+                              if brute_force_osa(query, other) <= max_distance)
+            assert sorted(fuzzy_index.search(query, LEXICON, max_distance)) == expected, (query, max_distance)
+
+
+def test_search_orders_by_distance_then_term_id(fuzzy_index):
+    matches = fuzzy_index.search("spade", LEXICON, 2)
+    assert matches == sorted(matches, key=lambda match: (match[1], match[0]))
+    assert matches[0] == (LEXICON.index("spade"), 0)
+
+
+def test_empty_index():
+    assert DeletionIndex().closest("space", []) == []
@@ -0,0 +1,135 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import hybrid
+from hybrid import (MAX_CANDIDATE_DEPTH, RRF_K, HybridSearcher, candidate_depth, fuse, reciprocal_rank_fusion,
+                    weighted_score_fusion)
+
+LEXICAL = [(1, 12.0), (2, 9.0), (3, 3.0)]
+VECTOR = [(3, 0.9), (4, 0.8), (1, 0.5)]
+
+
+def test_reciprocal_rank_fusion_sums_rank_weights():
+    fused = reciprocal_rank_fusion({"lexical": LEXICAL, "vector": VECTOR}, 10)
+    expected = {1: 1 / (RRF_K + 1) + 1 / (RRF_K + 3), 2: 1 / (RRF_K + 2), 3: 1 / (RRF_K + 3) + 1 / (RRF_K + 1),
+                4: 1 / (RRF_K + 2)}
+    # 1 and 3 tie, as do 2 and 4; ties go to the lower doc id
+    assert [doc_id for doc_id, _ in fused] == [1, 3, 2, 4]
+    assert dict(fused) == pytest.approx(expected)
+    # Only ranks count, not the scale of the scores
+    scaled = reciprocal_rank_fusion({"lexical": [(doc_id, score * 1000) for doc_id, score in LEXICAL],
+                                     "vector": VECTOR}, 10)
+    assert scaled == fused
+    weighted = reciprocal_rank_fusion({"lexical": LEXICAL, "vector": VECTOR}, 2, {"vector": 2.0})
+    assert [doc_id for doc_id, _ in weighted] == [3, 1]
+    assert weighted[0][1] == pytest.approx(1 / (RRF_K + 3) + 2 / (RRF_K + 1))
+
+
+def test_weighted_fusion_normalizes_each_leg():
+    fused = weighted_score_fusion({"lexical": LEXICAL, "vector": VECTOR}, 10)
+    # lexical: 1 -> 1, 2 -> 2/3, 3 -> 0; vector: 3 -> 1, 4 -> 0.75, 1 -> 0
+    assert [doc_id for doc_id, _ in fused] == [1, 3, 4, 2]
+    assert dict(fused) == pytest.approx({1: 1.0, 2: 2 / 3, 3: 1.0, 4: 0.75})
+    weighted = weighted_score_fusion({"lexical": LEXICAL, "vector": VECTOR}, 10, {"lexical": 0.5})
+    assert [doc_id for doc_id, _ in weighted] == [3, 4, 1, 2]
+    # A leg whose candidates all score the same counts them all as its best
+    flat = weighted_score_fusion({"lexical": [(5, 2.0), (6, 2.0)], "vector": [(6, 0.3), (7, 0.1)]}, 10)
+    assert flat == [(6, 2.0), (5, 1.0), (7, 0.0)]
+    assert weighted_score_fusion({"lexical": [], "vector": VECTOR}, 1) == [(3, 1.0)]
+
+
+def test_fuse_dispatches_by_method():
+    rankings = {"lexical": LEXICAL, "vector": VECTOR}
+    assert fuse(rankings, 3) == reciprocal_rank_fusion(rankings, 3)
+    assert fuse(rankings, 3, "weighted") == weighted_score_fusion(rankings, 3)
+    assert fuse({}, 3) == []
+    with pytest.raises(ValueError):
+        fuse(rankings, 3, "borda")
+
+
+def test_candidate_depth():
+    assert candidate_depth(5) == 20
+    assert candidate_depth(5, 3) == 5
+    assert candidate_depth(5, 50) == 50
+    assert candidate_depth(500) == MAX_CANDIDATE_DEPTH
+    assert candidate_depth(2000) == 2000
+
+
+def test_searcher_fuses_the_legs():
+    calls = []
+
+    def lexical(query, depth):
+        calls.append(("lexical", query, depth))
+        return LEXICAL[:depth]
+
+    def vector(query, depth):
+        calls.append(("vector", query, depth))
+        return VECTOR[:depth]
+
+    with HybridSearcher({"lexical": lexical, "vector": vector}) as searcher:
+        fused, rankings, failures = searcher.search("space", 2, method="weighted")
+    assert sorted(calls) == [("lexical", "space", 8), ("vector", "space", 8)]
+    assert rankings == {"lexical": LEXICAL, "vector": VECTOR}
+    assert failures == {}
+    assert fused == weighted_score_fusion(rankings, 2)
+    with pytest.raises(ValueError):
+        searcher.search("space", 2)
+    with pytest.raises(ValueError):
+        HybridSearcher({})
+
+
+def test_legs_run_concurrently():
+    def slow(query, depth):
+        time.sleep(0.2)
+        return LEXICAL
+
+    with HybridSearcher({"lexical": slow, "vector": slow}) as searcher:
+        started = time.monotonic()
+        _, rankings, failures = searcher.search("space", 3)
+    assert time.monotonic() - started < 0.35
+    assert set(rankings) == {"lexical", "vector"} and failures == {}
+
+
+def test_a_timed_out_leg_is_dropped():
+    release = threading.Event()
+
+    def stuck(query, depth):
+        release.wait(10)
+        return [(99, 1.0)]
+
+    def failing(query, depth):
+        raise ValueError("Vector index not found")
+
+    searcher = HybridSearcher({"lexical": lambda query, depth: LEXICAL, "vector": stuck, "extra": failing},
+                              timeout=5.0, timeouts={"vector": 0.05})
+    try:
+        started = time.monotonic()
+        fused, rankings, failures = searcher.search("space", 3)
+        assert time.monotonic() - started < 2
+        assert rankings == {"lexical": LEXICAL}
+        assert failures == {"vector": "timed out after 0.05s", "extra": "Vector index not found"}
+        assert fused == reciprocal_rank_fusion({"lexical": LEXICAL}, 3)
+        # The stuck leg does not hold up the next query
+        fused, rankings, failures = searcher.search("robot", 3)
+        assert set(failures) == {"vector", "extra"} and fused[0][0] == 1
+    finally:
+        release.set()
+        searcher.close()
+
+
+def test_a_timed_out_leg_does_not_delay_exit():
+    script = ("import time, hybrid\n"
+              "searcher = hybrid.HybridSearcher({'stuck': lambda query, depth: time.sleep(60)}, timeout=0.05)\n"
+              "with searcher:\n"
+              "    print(searcher.search('space', 3)[2])\n")
+    cli = Path(hybrid.__file__).parent
+    started = time.monotonic()
+    result = subprocess.run([sys.executable, "-c", script], cwd=cli, capture_output=True, text=True, check=True,
+                            timeout=30)
+    assert time.monotonic() - started < 20
+    assert result.stdout == "{'stuck': 'timed out after 0.05s'}\n"
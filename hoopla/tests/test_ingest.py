@@ -0,0 +1,73 @@
+import io
+import json
+
+import pytest
+
+from ingest import JsonStream, estimate_document_bytes, iter_batches, iter_records
+
+
+class CountingDecoder(json.JSONDecoder):
+    """Records how many characters every raw_decode attempt started from."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.attempts = []
+
+    def raw_decode(self, s, idx=0):
+        self.attempts.append(len(s) - idx)
+        return super().raw_decode(s, idx)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 1 << 16])
+def test_array_items_across_chunk_boundaries(chunk_size):
+    items = [12345, -6.25e-3, "snowé \"man\"", {"id": 1, "tags": ["a", "b"]}, [], True, None, 7]
+    stream = JsonStream(io.StringIO(" [ " + " , ".join(json.dumps(item) for item in items) + " ] "), chunk_size)
+    assert list(stream.array_items()) == items
+    assert stream.peek() == ""
+
+
+def test_large_value_is_decoded_in_linear_time():
+    value = {"description": "word " * 200_000, "id": 1}
+    text = json.dumps(value)
+    stream = JsonStream(io.StringIO(text), chunk_size=64)
+    stream.decoder = CountingDecoder()
+    assert stream.value() == value
+    # Each retry starts once the buffer has doubled, so the attempts sum to about 2n
+    assert sum(stream.decoder.attempts) <= 4 * len(text)
+    assert len(stream.decoder.attempts) < 20
+
+
+def test_invalid_json():
+    with pytest.raises(ValueError):
+        list(JsonStream(io.StringIO('[{"id": 1}, {"id": }]'), 4).array_items())
+    with pytest.raises(ValueError, match="expected ']'"):
+        list(JsonStream(io.StringIO('[1 2]'), 4).array_items())
+    with pytest.raises(ValueError):
+        list(JsonStream(io.StringIO('[{"id": 1'), 4).array_items())
+
+
+@pytest.mark.parametrize("name, content", [
+    ("movies.json", json.dumps({"other": {"movies": [0]}, "movies": [{"id": 1}, {"id": 2}], "after": 3})),
+    ("array.json", json.dumps([{"id": 1}, {"id": 2}])),
+    ("movies.jsonl", '{"id": 1}\n\n{"id": 2}\n'),
+    ("movies.ndjson", '{"id": 1}\n{"id": 2}'),
+])
+def test_iter_records(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    assert list(iter_records(path)) == [{"id": 1}, {"id": 2}]
+
+
+def test_iter_records_without_movies(tmp_path):
+    path = tmp_path / "empty.json"
+    path.write_text('{"shows": [{"id": 1}]}', encoding="utf-8")
+    assert list(iter_records(path)) == []
+
+
+def test_iter_batches():
+    assert list(iter_batches(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(iter_batches([], 3)) == []
+
+
+def test_estimate_document_bytes_grows_with_the_document():
+    assert estimate_document_bytes(10, 5) < estimate_document_bytes(20, 5) < estimate_document_bytes(20, 10)
@@ -0,0 +1,133 @@
+import json
+import random
+from typing import Dict, Set
+
+import pytest
+
+from keyword_search_cli import InvertedIndex
+from minhash import DEFAULT_DUPLICATE_THRESHOLD, EMPTY_BIN, MINHASH_BINS, densify, estimate_similarity
+from parallel_build import document_text
+from test_cli import run_cli
+
+# Words the generated corpus never uses, so the planted documents only resemble each other
+PLANTED_WORDS = ("aardvark", "bassoon", "cathedral", "dulcimer", "equinox", "falconer", "glacier", "harpsichord",
+                 "iguana", "juniper", "kaleidoscope", "lighthouse", "marmalade", "nightingale", "orchard",
+                 "porcupine", "quarry", "rhubarb", "saxophone", "tapestry", "umbrella", "volcano")
+UNRELATED_WORDS = ("accordion", "blizzard", "cactus", "dandelion", "emerald", "flamingo", "gondola", "hammock",
+                   "igloo", "jellyfish", "kettle", "lantern", "mosaic", "nutmeg", "oyster", "pelican")
+
+ORIGINAL = {"id": 9_000_001, "title": "Aardvark Bassoon", "description": " ".join(PLANTED_WORDS[2:]) + "."}
+# One word swapped for another: 21 of 23 terms shared
+DUPLICATE = {"id": 9_000_002, "title": "Aardvark Bassoon",
+             "description": " ".join(PLANTED_WORDS[2:-1]) + " walrus."}
+UNRELATED = {"id": 9_000_003, "title": "Accordion Blizzard", "description": " ".join(UNRELATED_WORDS[2:]) + "."}
+
+
+def term_set(analyzer, record) -> Set[str]:
+    return set(analyzer.analyze(document_text(record)))
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b)
+
+
+@pytest.fixture
+def planted(records) -> list:
+    return records + [ORIGINAL, DUPLICATE, UNRELATED]
+
+
+@pytest.fixture(params=["built", "loaded"])
+def index(request, cache_dir, tmp_path, planted) -> InvertedIndex:
+    path = tmp_path / "planted.json"
+    path.write_text(json.dumps({"movies": planted}), encoding="utf-8")
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.build(filename=str(path))
+    if request.param == "loaded":
+        index.save()
+        index = InvertedIndex(cache_dir=cache_dir)
+        index.load()
+    return index
+
+
+def test_similar_finds_the_planted_duplicate(index, analyzer):
+    expected = jaccard(term_set(analyzer, ORIGINAL), term_set(analyzer, DUPLICATE))
+    assert expected == pytest.approx(21 / 23)
+    similar = index.similar_documents(ORIGINAL["id"], 5)
+    assert similar[0][0] == DUPLICATE["id"]
+    assert similar[0][1] == pytest.approx(expected, abs=0.2)
+    # Nothing else shares a term with the planted pair
+    assert [doc_id for doc_id, _ in similar] == [DUPLICATE["id"]]
+    assert index.similar_documents(DUPLICATE["id"], 5)[0][0] == ORIGINAL["id"]
+    assert index.similar_documents(UNRELATED["id"], 5) == []
+    with pytest.raises(ValueError):
+        index.similar_documents(123_456_789)
+
+
+def test_estimates_follow_exact_jaccard(index, analyzer, planted):
+    by_id: Dict[int, Set[str]] = {record["id"]: term_set(analyzer, record) for record in planted}
+    minhash = index.minhash
+    rng = random.Random(1)
+    errors = []
+    for _ in range(2000):
+        a, b = rng.sample(sorted(by_id), 2)
+        errors.append(estimate_similarity(minhash.signature(a), minhash.signature(b)) - jaccard(by_id[a], by_id[b]))
+    # Unbiased, with about the spread of 64 bins
+    assert abs(sum(errors) / len(errors)) < 0.02
+    assert sum(abs(error) for error in errors) / len(errors) < 0.1
+
+    for record in planted[:40]:
+        similar = index.similar_documents(record["id"], 10)
+        assert similar == sorted(similar, key=lambda item: (-item[1], item[0]))
+        assert record["id"] not in (doc_id for doc_id, _ in similar)
+        for doc_id, similarity in index.similar_documents(record["id"], 10, 0.6):
+            assert similarity >= 0.6
+            assert similarity == estimate_similarity(minhash.signature(record["id"]), minhash.signature(doc_id))
+
+
+def test_dedupe_groups_the_planted_duplicate(index, planted):
+    groups = index.near_duplicates(DEFAULT_DUPLICATE_THRESHOLD)
+    planted_group = [group for group in groups if group[0][0] == ORIGINAL["id"]]
+    assert len(planted_group) == 1
+    assert [doc_id for doc_id, _ in planted_group[0]] == [ORIGINAL["id"], DUPLICATE["id"]]
+    assert all(UNRELATED["id"] not in (doc_id for doc_id, _ in group) for group in groups)
+
+    minhash = index.minhash
+    seen = set()
+    for group in groups:
+        leader = group[0][0]
+        assert group[0] == (leader, 1.0)
+        for doc_id, similarity in group[1:]:
+            assert doc_id > leader and doc_id not in seen
+            seen.add(doc_id)
+            assert similarity >= DEFAULT_DUPLICATE_THRESHOLD
+            assert similarity == estimate_similarity(minhash.signature(leader), minhash.signature(doc_id))
+    assert [len(group) for group in groups] == sorted((len(group) for group in groups), reverse=True)
+    # A threshold above the pair's similarity splits it
+    assert all(group[0][0] != ORIGINAL["id"] for group in index.near_duplicates(1.0))
+    with pytest.raises(ValueError):
+        index.near_duplicates(0.0)
+
+
+def test_densify_keeps_equal_sets_equal():
+    row = [EMPTY_BIN] * MINHASH_BINS
+    row[5], row[40] = 7, 9
+    other = list(row)
+    densify(row)
+    densify(other)
+    assert row == other and EMPTY_BIN not in row
+    assert row[5] == 7 and row[40] == 9
+    empty = [EMPTY_BIN] * MINHASH_BINS
+    densify(empty)
+    assert empty == [EMPTY_BIN] * MINHASH_BINS
+
+
+def test_cli_similar_and_dedupe(monkeypatch, capsys, tmp_path, planted):
+    path = tmp_path / "planted.json"
+    path.write_text(json.dumps({"movies": planted}), encoding="utf-8")
+    run_cli(monkeypatch, capsys, "build", "--data-file", str(path))
+    similar = run_cli(monkeypatch, capsys, "similar", str(ORIGINAL["id"]))
+    assert similar.startswith(f"ID: {DUPLICATE['id']}, Title: Aardvark Bassoon, Similarity: ")
+    assert run_cli(monkeypatch, capsys, "similar", str(UNRELATED["id"])) == \
+        f"No documents similar to {UNRELATED['id']}.\n"
+    dedupe = run_cli(monkeypatch, capsys, "dedupe", "--limit", "1000")
+    assert str(DUPLICATE["id"]) in dedupe and str(UNRELATED["id"]) not in dedupe
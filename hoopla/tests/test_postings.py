@@ -0,0 +1,191 @@
+import random
+from bisect import bisect_left
+from typing import Dict, List
+
+import pytest
+
+from postings import (NO_MORE_DOCS, SKIP_INTERVAL, CompactIndex, decode_varint, encode_varint, intersect,
+                      merge_indexes)
+
+# term -> doc id -> positions
+PlainIndex = Dict[str, Dict[int, List[int]]]
+
+
+def make_plain_index(seed: int = 3) -> PlainIndex:
+    """Random positional index whose common terms span several skip blocks and use multi-byte varints."""
+    rng = random.Random(seed)
+    doc_ids = sorted(rng.sample(range(1, 1_000_000), 500))
+    sizes = {"common": 450, "frequent": 3 * SKIP_INTERVAL + 1, "block": SKIP_INTERVAL, "rare": 5, "single": 1}
+    plain: PlainIndex = {}
+    for term, size in sizes.items():
+        plain[term] = {
+            doc_id: sorted(rng.sample(range(20_000), rng.randint(1, 6)))
+            for doc_id in rng.sample(doc_ids, size)
+        }
+    return plain
+
+
+def to_compact(plain: PlainIndex) -> CompactIndex:
+    term_positions: Dict[int, Dict[str, List[int]]] = {}
+    for term, postings in plain.items():
+        for doc_id, positions in postings.items():
+            term_positions.setdefault(doc_id, {})[term] = positions
+    return CompactIndex.from_dicts({term: set(postings) for term, postings in plain.items()}, term_positions)
+
+
+@pytest.fixture
+def plain() -> PlainIndex:
+    return make_plain_index()
+
+
+@pytest.fixture
+def compact(plain) -> CompactIndex:
+    return to_compact(plain)
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 16_383, 16_384, 2 ** 32 - 1, 2 ** 63])
+def test_varint_round_trip(value):
+    out = bytearray(b"\xff")
+    encode_varint(value, out)
+    encode_varint(5, out)
+    decoded, pos = decode_varint(out, 1)
+    assert decoded == value
+    assert decode_varint(out, pos) == (5, len(out))
+
+
+def test_postings_match_plain_index(plain, compact):
+    assert list(compact) == sorted(plain)
+    for term, postings in plain.items():
+        posting_list = compact[term]
+        assert compact.doc_freq(term) == len(posting_list) == len(postings)
+        assert list(posting_list) == posting_list.doc_ids() == sorted(postings)
+        assert list(posting_list.items()) == [(doc_id, len(postings[doc_id])) for doc_id in sorted(postings)]
+        assert [(doc_id, list(positions)) for doc_id, positions in posting_list.positional_items()] == \
+            sorted(postings.items())
+        for doc_id, positions in postings.items():
+            assert doc_id in posting_list
+            assert compact.tf(term, doc_id) == len(positions)
+    assert compact.doc_freq("missing") == 0
+    assert compact.tf("missing", 1) == 0
+    assert compact.get("missing") is None
+    with pytest.raises(KeyError):
+        compact["missing"]
+
+
+def test_tf_of_absent_doc_ids(plain, compact):
+    postings = plain["frequent"]
+    doc_ids = sorted(postings)
+    absent = {0, doc_ids[0] - 1, doc_ids[-1] + 1, NO_MORE_DOCS - 1}
+    absent.update(doc_id + 1 for doc_id in doc_ids if doc_id + 1 not in postings)
+    for doc_id in absent:
+        assert compact.tf("frequent", doc_id) == 0
+        assert doc_id not in compact["frequent"]
+
+
+def test_cursor_next_and_positions(plain, compact):
+    for term, postings in plain.items():
+        cursor = compact[term].cursor()
+        seen = []
+        while cursor.next() != NO_MORE_DOCS:
+            assert cursor.tf == len(postings[cursor.doc_id])
+            assert cursor.positions() == postings[cursor.doc_id]
+            seen.append(cursor.doc_id)
+        assert seen == sorted(postings)
+        assert cursor.next() == NO_MORE_DOCS
+
+
+def test_cursor_advance_matches_bisect(plain, compact):
+    rng = random.Random(11)
+    for term, postings in plain.items():
+        doc_ids = sorted(postings)
+        for _ in range(20):
+            cursor = compact[term].cursor()
+            current = -1
+            for target in sorted(rng.sample(range(doc_ids[-1] + 2), min(30, doc_ids[-1] + 2))):
+                doc_id = cursor.advance(target)
+                if current >= target:
+                    # Targets at or behind the cursor leave it where it is
+                    assert doc_id == current
+                    continue
+                i = bisect_left(doc_ids, target)
+                expected = doc_ids[i] if i < len(doc_ids) else NO_MORE_DOCS
+                assert doc_id == expected
+                if doc_id == NO_MORE_DOCS:
+                    break
+                assert cursor.positions() == postings[doc_id]
+                current = doc_id
+
+
+def test_cursor_advance_past_the_end(plain, compact):
+    cursor = compact["common"].cursor()
+    assert cursor.advance(max(plain["common"]) + 1) == NO_MORE_DOCS
+    assert cursor.next() == NO_MORE_DOCS
+
+
+def test_cursor_advance_to_every_block_start(plain, compact):
+    doc_ids = sorted(plain["common"])
+    for block_start in doc_ids[::SKIP_INTERVAL]:
+        cursor = compact["common"].cursor()
+        assert cursor.advance(block_start) == block_start
+        assert cursor.positions() == plain["common"][block_start]
+        assert cursor.next() == doc_ids[doc_ids.index(block_start) + 1]
+
+
+@pytest.mark.parametrize("terms", [
+    ("common", "frequent"), ("common", "block", "frequent"), ("rare", "common"), ("single", "common"),
+    ("common",), ("common", "frequent", "block", "rare", "single"),
+])
+def test_intersect_matches_set_intersection(plain, compact, terms):
+    expected = sorted(set.intersection(*(set(plain[term]) for term in terms)))
+    assert intersect([compact[term] for term in terms]) == expected
+
+
+def test_intersect_empty():
+    assert intersect([]) == []
+    assert intersect([to_compact({"a": {1: [0]}})["a"], to_compact({"b": {2: [0]}})["b"]]) == []
+
+
+def split_plain(plain: PlainIndex, parts: int) -> List[PlainIndex]:
+    """Split a plain index into `parts` indexes over interleaved, disjoint doc ids."""
+    doc_ids = sorted({doc_id for postings in plain.values() for doc_id in postings})
+    owner = {doc_id: i % parts for i, doc_id in enumerate(doc_ids)}
+    splits: List[PlainIndex] = [{} for _ in range(parts)]
+    for term, postings in plain.items():
+        for doc_id, positions in postings.items():
+            splits[owner[doc_id]].setdefault(term, {})[doc_id] = positions
+    return splits
+
+
+def encoded(compact: CompactIndex) -> tuple:
+    return (compact.terms, compact.doc_freqs, compact.offsets, compact.skip_starts, compact.skip_doc_ids,
+            compact.skip_offsets, compact.skip_position_offsets, compact.data, compact.positions)
+
+
+@pytest.mark.parametrize("parts", [1, 2, 3, 7])
+def test_merge_indexes_matches_whole(plain, compact, parts):
+    merged = merge_indexes([to_compact(split) for split in split_plain(plain, parts)])
+    assert encoded(merged) == encoded(compact)
+
+
+def test_merged_removes_and_adds_documents(plain, compact):
+    rng = random.Random(5)
+    all_doc_ids = sorted({doc_id for postings in plain.values() for doc_id in postings})
+    removed = set(rng.sample(all_doc_ids, 100))
+    added: PlainIndex = {
+        "common": {1_000_001: [4, 9]},
+        "fresh": {1_000_001: [2], 1_000_002: [0, 1]},
+    }
+    expected: PlainIndex = {
+        term: {doc_id: positions for doc_id, positions in postings.items() if doc_id not in removed}
+        for term, postings in plain.items()
+    }
+    for term, postings in added.items():
+        expected.setdefault(term, {}).update(postings)
+    expected = {term: postings for term, postings in expected.items() if postings}
+
+    term_positions: Dict[int, Dict[str, List[int]]] = {}
+    for term, postings in added.items():
+        for doc_id, positions in postings.items():
+            term_positions.setdefault(doc_id, {})[term] = positions
+    merged = compact.merged(removed, {term: set(postings) for term, postings in added.items()}, term_positions)
+    assert encoded(merged) == encoded(to_compact(expected))
@@ -0,0 +1,151 @@
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+import keyword_search_cli
+import profiling
+
+
+@pytest.fixture(autouse=True)
+def reset(monkeypatch):
+    monkeypatch.setattr(profiling, "_hooks", [])
+    yield
+    profiling.finish()
+
+
+def report_of(**stages):
+    """A report with the given (calls, seconds, peak RSS bytes) per stage."""
+    return {"command": "search", "wall_seconds": 0.5, "peak_rss_bytes": 64 * 2 ** 20,
+            "stages": {name: {"calls": calls, "seconds": seconds, "peak_rss_bytes": peak}
+                       for name, (calls, seconds, peak) in stages.items()}}
+
+
+def test_stages_do_nothing_while_disabled():
+    assert profiling.active() is None
+    with profiling.stage("load"):
+        pass
+    assert profiling.finish("search") is None
+
+
+def test_nested_stages_are_inclusive():
+    profiler = profiling.enable()
+    assert profiling.active() is profiler
+    with profiling.stage("search"):
+        for _ in range(3):
+            with profiling.stage("analyze"):
+                time.sleep(0.002)
+        with profiling.stage("score"):
+            pass
+    report = profiling.finish("search")
+    assert profiling.active() is None
+    assert report["command"] == "search"
+    stages = report["stages"]
+    assert {name: entry["calls"] for name, entry in stages.items()} == {"analyze": 3, "score": 1, "search": 1}
+    assert stages["analyze"]["seconds"] >= 0.006
+    assert stages["search"]["seconds"] >= stages["analyze"]["seconds"] + stages["score"]["seconds"]
+    assert report["wall_seconds"] >= stages["search"]["seconds"]
+    # Memory is only sampled when an outermost stage ends
+    assert stages["analyze"]["peak_rss_bytes"] is None
+    assert stages["score"]["peak_rss_bytes"] is None
+    if profiling.resource is not None:
+        assert stages["search"]["peak_rss_bytes"] > 0
+
+
+def test_a_failing_stage_is_still_recorded():
+    profiling.enable()
+    with pytest.raises(ValueError):
+        with profiling.stage("search"):
+            with profiling.stage("parse"):
+                raise ValueError("bad query")
+    with profiling.stage("render"):
+        pass
+    stages = profiling.finish()["stages"]
+    assert stages["parse"]["calls"] == stages["search"]["calls"] == 1
+    # The depth unwound, so the next stage is outermost again
+    assert (stages["render"]["peak_rss_bytes"] is not None) == (profiling.resource is not None)
+
+
+def test_each_thread_nests_on_its_own():
+    profiling.enable()
+    with profiling.stage("search"):
+        def leg() -> None:
+            with profiling.stage("vector"):
+                pass
+
+        thread = threading.Thread(target=leg)
+        thread.start()
+        thread.join()
+    stages = profiling.finish()["stages"]
+    assert stages["vector"]["calls"] == 1
+    assert (stages["vector"]["peak_rss_bytes"] is not None) == (profiling.resource is not None)
+
+
+def test_hooks_receive_every_report():
+    reports = []
+    profiling.add_hook(reports.append)
+    profiling.enable()
+    with profiling.stage("load"):
+        pass
+    report = profiling.finish("tf")
+    assert reports == [report]
+    # Nothing is reported while profiling is off
+    assert profiling.finish("tf") is None
+    assert reports == [report]
+
+
+def test_report_is_json_serializable():
+    profiling.enable()
+    with profiling.stage("load"):
+        pass
+    report = profiling.finish("search")
+    assert json.loads(json.dumps(report)) == report
+
+
+def test_format_table():
+    report = report_of(load=(1, 0.012, 50 * 2 ** 20), analyze=(4, 0.002, None), score=(2, 0.030, 60 * 2 ** 20))
+    lines = profiling.format_table(report).splitlines()
+    assert lines[0].split() == ["Stage", "Calls", "Total", "ms", "Mean", "ms", "Peak", "RSS", "MB"]
+    # Slowest stage first
+    assert [line.split() for line in lines[1:4]] == [
+        ["score", "2", "30.00", "15.000", "60.0"],
+        ["load", "1", "12.00", "12.000", "50.0"],
+        ["analyze", "4", "2.00", "0.500", "-"],
+    ]
+    assert lines[4] == "Wall time 500.00 ms, peak RSS 64.0 MB (stage times are inclusive)"
+    report["peak_rss_bytes"] = None
+    assert profiling.format_table(report).endswith("peak RSS unknown (stage times are inclusive)")
+
+
+def test_print_report_writes_to_stderr(capsys):
+    report = report_of(load=(1, 0.012, None))
+    profiling.print_report(report, "json")
+    profiling.print_report(report)
+    out, err = capsys.readouterr()
+    assert out == ""
+    json_line, table = err.split("\n", 1)
+    assert json.loads(json_line) == report
+    assert table == profiling.format_table(report) + "\n"
+
+
+@pytest.mark.parametrize("output_format", ["json", "table"])
+def test_cli_profile(monkeypatch, capsys, corpus_file, output_format):
+    monkeypatch.delenv("HOOPLA_SERVER", raising=False)
+    monkeypatch.setattr(sys, "argv", ["keyword_search_cli.py", "build", "--data-file", str(corpus_file)])
+    keyword_search_cli.main()
+    capsys.readouterr()
+    monkeypatch.setattr(sys, "argv", ["keyword_search_cli.py", "search", "space robot", "--cache-size", "0",
+                                      "--profile", output_format])
+    keyword_search_cli.main()
+    out, err = capsys.readouterr()
+    assert out.startswith("Searching for: space robot\n")
+    if output_format == "json":
+        report = json.loads(err)
+        assert report["command"] == "search"
+        assert {"load", "lookup", "score", "render"} <= set(report["stages"])
+    else:
+        assert err.startswith("Stage ")
+        assert "\nscore " in err
+    assert profiling.active() is None
@@ -0,0 +1,110 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from keyword_search_cli import InvertedIndex
+from query_server import QueryClient, QueryServer, QueryService
+
+
+@pytest.fixture
+def service(cache_dir, corpus_file) -> QueryService:
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.build(filename=str(corpus_file))
+    return QueryService(index)
+
+
+@pytest.fixture
+def server(service):
+    server = QueryServer(service, port=0, threads=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def url(server) -> str:
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def get(url: str):
+    """Return the status and decoded JSON body of a GET request."""
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        with e:
+            return e.code, json.loads(e.read())
+
+
+def test_client_matches_the_local_service(service, url, records):
+    client = QueryClient(url)
+    doc_id = records[0]["id"]
+    for query in ("space robot", "haunted castle", "dragon", "missing"):
+        assert client.search(query, 5) == service.search(query, 5)
+    assert client.search("space robot", 3, snippets=True) == service.search("space robot", 3, snippets=True)
+    assert client.search("spcae", 3, fuzzy=True) == service.search("spcae", 3, fuzzy=True)
+    assert client.fuzzy("spcae") == service.fuzzy("spcae")
+    assert client.partial("spa", 5) == service.partial("spa", 5)
+    assert client.boolean("space AND NOT robot", 5) == service.boolean("space AND NOT robot", 5)
+    assert client.suggest("dra") == service.suggest("dra")
+    assert client.similar(doc_id) == service.similar(doc_id)
+    assert client.dedupe(0.5, 3) == service.dedupe(0.5, 3)
+    assert client.tf(doc_id, "space") == service.tf(doc_id, "space")
+    assert client.idf("space") == service.idf("space")
+    assert client.tfidf(doc_id, "space robot") == pytest.approx(service.tfidf(doc_id, "space robot"))
+    assert client.cache_stats() == service.cache_stats()
+
+
+def test_search_endpoint(service, url):
+    status, body = get(f"{url}/search?q=space+robot&limit=3")
+    assert status == 200
+    assert body["result"] == service.search("space robot", 3)
+    assert get(f"{url}/health") == (200, {"result": "ok"})
+
+
+@pytest.mark.parametrize("path, message", [
+    ("/search", "Missing parameter q"),
+    ("/search?q=space&limit=many", "invalid literal"),
+    ("/tf?doc_id=0&term=space", "Document ID 0 not found"),
+    ("/boolean?q=space+AND+(robot", "Missing closing parenthesis"),
+])
+def test_bad_requests(url, path, message):
+    status, body = get(url + path)
+    assert status == 400
+    assert message in body["error"]
+
+
+def test_unknown_endpoint(url):
+    assert get(f"{url}/missing?q=space") == (404, {"error": "Unknown endpoint /missing"})
+
+
+def test_client_raises_value_error_for_rejected_requests(url):
+    client = QueryClient(url)
+    with pytest.raises(ValueError, match="Document ID 0 not found"):
+        client.tf(0, "space")
+    with pytest.raises(ValueError, match="Unknown endpoint /missing"):
+        client._QueryClient__get("missing")
+
+
+def test_client_raises_connection_error_for_server_failures(service, url, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("index closed")
+
+    monkeypatch.setattr(service.inverted_index, "search", fail)
+    assert get(f"{url}/search?q=space")[0] == 500
+    with pytest.raises(ConnectionError, match="Internal server error: RuntimeError"):
+        QueryClient(url).search("space")
+
+
+def test_client_raises_connection_error_without_a_server(server):
+    url = f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+    with pytest.raises(ConnectionError, match="Could not reach query server"):
+        QueryClient(url, timeout=5).search("space")
@@ -0,0 +1,157 @@
+import threading
+
+import pytest
+
+import result_cache
+from keyword_search_cli import InvertedIndex
+from query_server import QueryService
+from result_cache import RESULT_CACHE_FILENAME, ResultCache
+from test_cli import run_cli
+
+
+class Clock:
+    """Stands in for time.time() in result_cache."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(result_cache.time, "time", clock)
+    return clock
+
+
+def test_evicts_the_least_recently_used():
+    cache = ResultCache(max_size=2)
+    cache.put("a", 1, "A")
+    cache.put("b", 1, "B")
+    assert cache.get("a", 1) == "A"
+    cache.put("c", 1, "C")
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == "A"
+    assert cache.get("c", 1) == "C"
+    # Storing an existing key again refreshes it instead of adding an entry
+    cache.put("a", 1, "A2")
+    cache.put("d", 1, "D")
+    assert list(cache.entries) == ["a", "d"]
+    assert cache.stats() == {"hits": 3, "misses": 1, "size": 2, "hit_rate": 0.75}
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResultCache(max_size=10, ttl=60)
+    cache.put("a", 1, "A")
+    clock.now += 60
+    assert cache.get("a", 1) == "A"
+    clock.now += 1
+    assert cache.get("a", 1) is None
+    assert "a" not in cache.entries
+    never = ResultCache(max_size=10, ttl=None)
+    never.put("a", 1, "A")
+    clock.now += 10 ** 9
+    assert never.get("a", 1) == "A"
+
+
+def test_entries_of_another_generation_are_dropped():
+    cache = ResultCache(max_size=10)
+    cache.put("a", 1, "A")
+    assert cache.get("a", 2) is None
+    assert "a" not in cache.entries
+    assert cache.get("a", 1) is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_save_and_load(tmp_path, clock):
+    path = tmp_path / "cache" / RESULT_CACHE_FILENAME
+    cache = ResultCache(max_size=10, ttl=60, path=path)
+    cache.put("a", 1, [{"id": 1, "score": 2.5}])
+    cache.put("b", 1, [])
+    cache.get("a", 1)
+    cache.get("missing", 1)
+    clock.now += 30
+    cache.put("c", 1, "C")
+    cache.save()
+
+    loaded = ResultCache.load(path, max_size=10, ttl=60)
+    assert loaded.get("a", 1) == [{"id": 1, "score": 2.5}]
+    assert loaded.stats() == {"hits": 2, "misses": 1, "size": 3, "hit_rate": 2 / 3}
+    # Entries keep the time they were stored, so they expire as before
+    clock.now += 31
+    assert loaded.get("b", 1) is None
+    assert loaded.get("c", 1) == "C"
+    # A smaller cache keeps the most recently used entries
+    assert list(ResultCache.load(path, max_size=2).entries) == ["a", "c"]
+    assert list(tmp_path.glob("cache/*.tmp")) == []
+
+
+def test_load_a_missing_or_broken_file(tmp_path):
+    path = tmp_path / RESULT_CACHE_FILENAME
+    assert ResultCache.load(path).stats()["size"] == 0
+    path.write_text("{not json", encoding="utf-8")
+    cache = ResultCache.load(path)
+    assert cache.stats() == {"hits": 0, "misses": 0, "size": 0, "hit_rate": 0.0}
+    cache.put("a", 1, "A")
+    cache.save()
+    assert ResultCache.load(path).get("a", 1) == "A"
+
+
+def test_concurrent_saves_use_their_own_temporary_files(tmp_path):
+    path = tmp_path / RESULT_CACHE_FILENAME
+    caches = []
+    for i in range(8):
+        cache = ResultCache(max_size=10, path=path)
+        cache.put(f"key{i}", 1, "x" * 10_000)
+        caches.append(cache)
+    threads = [threading.Thread(target=cache.save) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Whichever save finished last, the file is one complete cache
+    assert len(ResultCache.load(path).entries) == 1
+    assert [p.name for p in tmp_path.iterdir()] == [RESULT_CACHE_FILENAME]
+
+
+def test_a_failed_save_leaves_no_temporary_file(tmp_path):
+    path = tmp_path / RESULT_CACHE_FILENAME
+    cache = ResultCache(max_size=10, path=path)
+    cache.put("a", 1, object())
+    with pytest.raises(TypeError):
+        cache.save()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_search_results_follow_the_index_generation(cache_dir, corpus_file, records):
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.build(filename=str(corpus_file))
+    service = QueryService(index, ResultCache(max_size=10))
+    first = service.search("haunted robot", 3)
+    assert service.search("robot haunted", 3) == first
+    assert service.cache.stats()["hits"] == 1
+
+    record = dict(records[0], description="Haunted robot haunted robot haunted robot.")
+    index.update_document(record)
+    updated = service.search("haunted robot", 3)
+    assert updated[0]["id"] == record["id"]
+    assert updated != first
+    assert service.cache.stats()["hits"] == 1
+
+
+def test_only_search_persists_the_cache(monkeypatch, capsys, cache_dir, corpus_file, records):
+    run_cli(monkeypatch, capsys, "build", "--data-file", str(corpus_file))
+    doc_id = str(records[0]["id"])
+    for argv in (["tf", doc_id, "space"], ["idf", "space"], ["tfidf", doc_id, "space robot"], ["fuzzy", "spcae"],
+                 ["partial", "spa"], ["boolean", "space AND robot"], ["suggest", "spa"], ["similar", doc_id],
+                 ["dedupe"]):
+        run_cli(monkeypatch, capsys, *argv)
+    assert not (cache_dir / RESULT_CACHE_FILENAME).exists()
+
+    run_cli(monkeypatch, capsys, "search", "space robot")
+    run_cli(monkeypatch, capsys, "search", "robot space")
+    assert run_cli(monkeypatch, capsys, "cache-stats") == \
+        "Result cache: 1 entries, 1 hits, 1 misses (50.0% hit rate)\n"
@@ -0,0 +1,139 @@
+import pytest
+
+from keyword_search_cli import SEGMENT_FILENAME, InvertedIndex
+from postings import CompactIndex
+from segment import HEADER, SEGMENT_VERSION, Segment, write_segment
+from substring_index import SubstringIndex
+
+QUERIES = ("space robot", "haunted castle", "dragon", "brave knight treasure", "quick runs", "missing")
+BOOLEAN_QUERIES = ("space AND robot", "dragon OR ghost", "castle NOT haunted", '"brave knight"')
+
+
+@pytest.fixture
+def built(cache_dir, corpus_file) -> InvertedIndex:
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.build(filename=str(corpus_file))
+    index.save()
+    return index
+
+
+@pytest.fixture
+def loaded(built, cache_dir) -> InvertedIndex:
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.load()
+    return index
+
+
+def test_load_returns_the_saved_documents(built, loaded, records):
+    assert sorted(loaded.docmap) == sorted(built.docmap) == sorted(record["id"] for record in records)
+    for record in records:
+        doc_id = record["id"]
+        assert loaded.docmap[doc_id] == built.docmap[doc_id] == record
+        assert loaded.doc_lengths[doc_id] == built.doc_lengths[doc_id]
+        assert list(loaded.token_starts[doc_id]) == list(built.token_starts[doc_id])
+    assert loaded.avg_doc_length == pytest.approx(built.avg_doc_length)
+    assert loaded.generation == built.generation
+
+
+def test_load_returns_the_saved_postings(built, loaded, reference):
+    assert list(loaded.index) == list(built.index) == sorted(reference)
+    for term, postings in reference.items():
+        assert loaded.index.doc_freq(term) == len(postings)
+        assert [(doc_id, list(positions)) for doc_id, positions in loaded.index[term].positional_items()] == \
+            sorted(postings.items())
+        for doc_id, positions in postings.items():
+            assert loaded.index.tf(term, doc_id) == len(positions)
+
+
+def test_load_gives_the_same_search_results(built, loaded):
+    for query in QUERIES:
+        for limit in (1, 5, 50):
+            assert loaded.search(query, limit) == built.search(query, limit)
+    for query in BOOLEAN_QUERIES:
+        assert loaded.boolean_search(query) == built.boolean_search(query)
+    for query in ("spa", "Dragon", "ghost kni"):
+        assert loaded.partial_search(query) == built.partial_search(query)
+        assert loaded.suggest(query) == built.suggest(query)
+    doc_id = min(built.docmap)
+    assert loaded.similar_documents(doc_id) == built.similar_documents(doc_id)
+
+
+def test_rejects_a_segment_of_another_version(built, cache_dir):
+    path = cache_dir / SEGMENT_FILENAME
+    data = bytearray(path.read_bytes())
+    # The version follows the 8 byte magic in the header
+    data[8:12] = (SEGMENT_VERSION + 1).to_bytes(4, "little")
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="not supported"):
+        InvertedIndex(cache_dir=cache_dir).load()
+
+
+def test_rejects_a_truncated_segment(built, cache_dir):
+    path = cache_dir / SEGMENT_FILENAME
+    data = path.read_bytes()
+    path.write_bytes(data[:len(data) // 2])
+    with pytest.raises(ValueError, match="truncated"):
+        Segment(path)
+    path.write_bytes(data[:HEADER.size - 1])
+    with pytest.raises(ValueError, match="truncated"):
+        Segment(path)
+
+
+def test_rejects_a_file_that_is_not_a_segment(cache_dir):
+    cache_dir.mkdir()
+    path = cache_dir / SEGMENT_FILENAME
+    path.write_bytes(b"\0" * (HEADER.size + 64))
+    with pytest.raises(ValueError, match="not a segment file"):
+        Segment(path)
+
+
+def test_load_refuses_a_partial_segment(built, cache_dir):
+    write_segment(cache_dir / SEGMENT_FILENAME, built.index, built.titles, built.docmap, built.doc_lengths,
+                  built.doc_hashes, built.token_starts, partial=True)
+    assert Segment(cache_dir / SEGMENT_FILENAME).partial
+    with pytest.raises(ValueError, match="partial segment"):
+        InvertedIndex(cache_dir=cache_dir).load()
+
+
+@pytest.mark.parametrize("partial", [False, True])
+def test_partial_flag_is_stored_in_the_header(cache_dir, partial):
+    # A segment without terms or documents cannot be told apart by its sections
+    cache_dir.mkdir()
+    path = cache_dir / SEGMENT_FILENAME
+    write_segment(path, CompactIndex(), SubstringIndex(), {}, {}, {}, {}, partial=partial)
+    with Segment(path) as segment:
+        assert segment.term_count == 0
+        assert segment.partial is partial
+
+
+def test_close_unmaps_the_segment(built, cache_dir):
+    with Segment(cache_dir / SEGMENT_FILENAME) as segment:
+        assert segment.docmap[min(built.docmap)] == built.docmap[min(built.docmap)]
+    assert segment.mmap.closed
+
+
+def test_close_after_queries(loaded):
+    doc_id = min(loaded.docmap)
+    loaded.search("space robot", 5)
+    loaded.search_batch(["space robot", "dragon"], 5)
+    loaded.boolean_search('"space robot" OR dragon')
+    loaded.partial_search("spa")
+    loaded.suggest("dra")
+    loaded.similar_documents(doc_id)
+    loaded.near_duplicates()
+    loaded.fuzzy_terms("spcae")
+    loaded.snippets("space robot", [doc_id])
+    loaded.close()
+    loaded.close()
+
+
+def test_save_replaces_the_loaded_segment(loaded, cache_dir, records):
+    record = dict(records[0], description="A haunted robot in space.")
+    loaded.update_document(record)
+    loaded.save()
+    # The index reads from the new segment after saving over the one it was loaded from
+    assert loaded.docmap[record["id"]] == record
+    reloaded = InvertedIndex(cache_dir=cache_dir)
+    reloaded.load()
+    assert reloaded.docmap[record["id"]] == record
+    assert loaded.search("haunted robot", 10) == reloaded.search("haunted robot", 10)
@@ -0,0 +1,84 @@
+import pytest
+
+import keyword_search_cli
+from keyword_search_cli import InvertedIndex, build_shards, open_sharded_index
+from sharding import SHARDS_DIRNAME, ShardedDocuments, shard_directory, shard_of
+from test_cli import run_cli
+from test_top_k import LIMITS, QUERIES
+
+SHARD_COUNT = 4
+
+
+@pytest.fixture
+def single(cache_dir, corpus_file) -> InvertedIndex:
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.build(filename=str(corpus_file))
+    return index
+
+
+@pytest.fixture
+def sharded(cache_dir, corpus_file):
+    counts = build_shards(SHARD_COUNT, filename=str(corpus_file))
+    assert len(counts) == SHARD_COUNT and all(counts)
+    with open_sharded_index() as index:
+        yield index
+
+
+def test_sharded_search_matches_a_single_index(single, sharded, cache_dir):
+    assert sharded.doc_count == len(single.docmap)
+    assert sharded.avg_doc_length == single.avg_doc_length
+    # Shards shorter on average than the corpus scale their score bounds up in score_terms
+    shard_lengths = []
+    for shard in range(SHARD_COUNT):
+        shard_index = InvertedIndex(cache_dir=shard_directory(cache_dir / SHARDS_DIRNAME, shard))
+        shard_index.load()
+        shard_lengths.append(shard_index.avg_doc_length)
+    assert min(shard_lengths) < sharded.avg_doc_length < max(shard_lengths)
+
+    for query in QUERIES:
+        for limit in LIMITS:
+            assert sharded.search(query, limit) == single.search(query, limit), (query, limit)
+
+
+def test_sharded_snippets_and_documents(single, sharded, records):
+    doc_ids = [doc_id for doc_id, _ in single.search("haunted castle", 10)]
+    assert sharded.snippets("haunted castle", doc_ids) == single.snippets("haunted castle", doc_ids)
+    assert len(sharded.docmap) == len(records)
+    assert sorted(sharded.docmap) == sorted(record["id"] for record in records)
+    for record in records[:20]:
+        assert sharded.docmap[record["id"]]["title"] == record["title"]
+        assert sharded.docmap.field(record["id"], "title") == record["title"]
+    assert 0 not in sharded.docmap
+
+
+def test_sharded_index_rejects_fuzzy_search(sharded):
+    with pytest.raises(ValueError):
+        sharded.search("spcae", 5, fuzzy=True)
+
+
+def test_shard_of_is_stable():
+    assert [shard_of(doc_id, 4) for doc_id in range(8)] == [shard_of(doc_id, 4) for doc_id in range(8)]
+    assert {shard_of(doc_id, 4) for doc_id in range(100)} == {0, 1, 2, 3}
+    documents = ShardedDocuments([{}, {}])
+    assert len(documents) == 0 and "1" not in documents
+
+
+@pytest.mark.parametrize("argv", [
+    ["search", "space", "--sharded", "--fuzzy"],
+    ["--server", "http://127.0.0.1:1", "search", "space", "--sharded"],
+])
+def test_cli_rejects_options_unsupported_on_shards(monkeypatch, capsys, argv):
+    with pytest.raises(SystemExit) as excinfo:
+        run_cli(monkeypatch, capsys, *argv)
+    assert excinfo.value.code == 2
+    assert "--sharded" in capsys.readouterr().err
+
+
+def test_cli_sharded_search(monkeypatch, capsys, corpus_file):
+    run_cli(monkeypatch, capsys, "build", "--data-file", str(corpus_file), "--shards", "3")
+    run_cli(monkeypatch, capsys, "build", "--data-file", str(corpus_file))
+    single = run_cli(monkeypatch, capsys, "search", "space robot", "--cache-size", "0")
+    sharded = run_cli(monkeypatch, capsys, "search", "space robot", "--cache-size", "0", "--sharded")
+    assert sharded == single
+    assert len(sharded.splitlines()) == 6
+    assert keyword_search_cli.InvertedIndex.cache_path().joinpath(SHARDS_DIRNAME, "manifest.json").exists()
@@ -0,0 +1,88 @@
+import string
+from typing import Any, Dict, List
+
+import pytest
+
+from keyword_search_cli import InvertedIndex
+from snippets import ELLIPSIS, best_window, make_snippet
+
+RECORDS = [
+    {"id": 1, "title": "Space Robot", "description": "A robot travels to space, then   the robot  returns."},
+    {"id": 2, "title": "  The   Space  Robot  ", "description": "  Robots\tin space:\n\n(robot) wars!  "},
+    {"id": 3, "title": "", "description": "Space robot story."},
+    {"id": 4, "description": "No title, only a space robot."},
+    {"id": 5, "title": "1984", "description": "The robot of 1984 in space."},
+    {"id": 6, "title": "Space Robot", "description": ""},
+    {"id": 7, "title": "Robot Space", "description": "The  (space)  of robots; robot-like  spaces."},
+    {"id": 8, "title": "The Of And", "description": "Space robot."},
+    {"id": 9, "title": "Café Space", "description": "Ünïcode café, then space robot."},
+]
+
+
+def expected_snippet(analyzer, description: str, query: str) -> str:
+    """Highlight every description word that analyzes to a query term; for texts shorter than a snippet."""
+    terms = set(analyzer.analyze(query))
+    words = []
+    for word in description.split():
+        token = analyzer.clean(word.lower())
+        if token and token not in analyzer.stopwords and analyzer._stem(token) in terms:
+            core = word.strip(string.punctuation)
+            begin = word.index(core)
+            word = word[:begin] + "**" + core + "**" + word[begin + len(core):]
+        words.append(word)
+    return " ".join(words)
+
+
+@pytest.fixture(params=["built", "loaded"])
+def index(request, cache_dir) -> InvertedIndex:
+    index = InvertedIndex(cache_dir=cache_dir)
+    for record in RECORDS:
+        index.add_document(record)
+    if request.param == "loaded":
+        index.save()
+        index = InvertedIndex(cache_dir=cache_dir)
+        index.load()
+    return index
+
+
+@pytest.mark.parametrize("query", ["space robot", "robot", "space", "1984", "café", "missing"])
+def test_highlights_only_description_words(index, analyzer, query):
+    doc_ids = [record["id"] for record in RECORDS]
+    snippets = index.snippets(query, doc_ids)
+    for record, snippet in zip(RECORDS, snippets):
+        assert snippet == expected_snippet(analyzer, record.get("description", ""), query), record["id"]
+
+
+def test_highlight_offsets_with_custom_markers(index):
+    assert index.snippets("robot", [2], markers=("<b>", "</b>")) == ["<b>Robots</b> in space: (<b>robot</b>) wars!"]
+    assert index.snippets("space", [7], markers=("[", "]")) == ["The ([space]) of robots; robot-like [spaces]."]
+
+
+def test_long_descriptions_are_cut_around_the_matches(cache_dir, analyzer):
+    filler = " ".join(f"word{i}" for i in range(100))
+    description = f"{filler}  Haunted   castle,   dragon!  {filler}"
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.add_document({"id": 1, "title": "Haunted Castle Dragon", "description": description})
+    [snippet] = index.snippets("dragon castle", [1], size=7)
+    assert snippet == f"{ELLIPSIS}word99 Haunted **castle**, **dragon**! word0 word1 word2{ELLIPSIS}"
+    assert index.snippets("dragon", [1], size=0) == [""]
+    with pytest.raises(ValueError):
+        index.snippets("dragon", [2])
+
+
+def test_best_window_prefers_rare_terms():
+    matches = [(0, "common"), (1, "common"), (10, "rare"), (12, "common"), (40, "common")]
+    weights: Dict[str, float] = {"common": 0.1, "rare": 2.0}
+    assert best_window(matches, weights, 5) == (10, 12)
+    assert best_window(matches, weights, 2) == (10, 10)
+    assert best_window([(3, "common")], weights, 5) == (3, 3)
+
+
+def test_make_snippet_reads_from_the_text_offset():
+    # "Title " precedes the text in the indexed document
+    text = "one  two\tthree four"
+    starts: List[Any] = [0] + [6 + i for i in (0, 5, 9, 15)]
+    assert make_snippet(text, 6, starts, 1, [(2, "two")], {"two": 1.0}, size=2) == "...**two** three..."
+    assert make_snippet(text, 6, starts, 1, [(4, "four")], {"four": 1.0}, size=2) == "...three **four**"
+    assert make_snippet(text, 6, starts, 1, [], {}, size=10) == "one two three four"
+    assert make_snippet(text, 6, starts, 5, [], {}, size=10) == ""
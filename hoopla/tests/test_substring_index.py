@@ -0,0 +1,65 @@
+from typing import Any, Dict, List
+
+import pytest
+
+from keyword_search_cli import InvertedIndex
+from substring_index import SubstringIndex, merge_substring_indexes
+
+QUERIES = ("spa", "Space", "ace", "ob", "dragon", "knight castle", "runn", "run", "s", "the", "hau", "xyz",
+           "ghost kni", "", "e")
+
+
+def brute_force(analyzer, records: List[Dict[str, Any]], query: str) -> List[int]:
+    """Scan every title for a stemmed term containing a stemmed query term."""
+    fragments = analyzer.analyze(query)
+    return sorted(record["id"] for record in records
+                  if any(fragment in term for fragment in fragments for term in analyzer.analyze(record["title"])))
+
+
+@pytest.fixture(params=["built", "loaded", "spilled"])
+def index(request, cache_dir, corpus_file) -> InvertedIndex:
+    index = InvertedIndex(cache_dir=cache_dir)
+    if request.param == "spilled":
+        # A small memory budget merges the title indexes of several partial segments
+        index.build(filename=str(corpus_file), memory_budget=20_000)
+    else:
+        index.build(filename=str(corpus_file))
+    if request.param != "built":
+        index.save()
+        index = InvertedIndex(cache_dir=cache_dir)
+        index.load()
+    return index
+
+
+def test_partial_search_matches_a_title_scan(index, analyzer, records):
+    for query in QUERIES:
+        assert index.partial_search(query) == brute_force(analyzer, records, query), query
+
+
+def test_partial_search_follows_document_changes(index, analyzer, records):
+    changed = dict(records[0], title="Spaceship Dragonfly")
+    added = {"id": 10_000_000, "title": "The Ghostly Knights", "description": "Haunted."}
+    index.update_document(changed)
+    index.delete_document(records[1]["id"])
+    index.add_document(added)
+    remaining = [changed, added] + records[2:]
+    for query in ("spa", "dragonfl", "ghostli", "knight", "hau"):
+        assert index.partial_search(query) == brute_force(analyzer, remaining, query)
+
+
+def test_find_terms():
+    titles = SubstringIndex.from_terms({1: ["space", "ace"], 2: ["race", "café"], 3: ["spa"]})
+    assert [titles.term(term_id) for term_id in titles.find_terms("ace")] == ["ace", "race", "space"]
+    assert [titles.term(term_id) for term_id in titles.find_terms("é")] == ["café"]
+    assert titles.find_terms("") == []
+    assert titles.find_terms("zz") == []
+    assert titles.find_documents(["spa", "caf"]) == [1, 2, 3]
+
+
+def test_merge_substring_indexes():
+    first = SubstringIndex.from_terms({1: ["space"], 4: ["robot", "space"]})
+    second = SubstringIndex.from_terms({2: ["space", "ghost"]})
+    merged = merge_substring_indexes([first, second])
+    assert [(term, list(doc_ids)) for term, doc_ids in merged.items()] == \
+        [("ghost", [2]), ("robot", [4]), ("space", [1, 2, 4])]
+    assert merged.find_documents(["pac"]) == [1, 2, 4]
@@ -0,0 +1,99 @@
+import random
+from typing import List, Sequence, Tuple
+
+from keyword_search_cli import InvertedIndex
+from suggest import SUGGESTIONS_PER_NODE, CompletionTrie, build_suggesters, normalize_prefix, normalize_words
+
+Entry = Tuple[str, int, Sequence[str]]
+
+
+def brute_force(entries: List[Entry], prefix: str, limit: int, size: int = SUGGESTIONS_PER_NODE):
+    """Rank every entry with a key starting with prefix: weight, then shorter, then alphabetical."""
+    matching = [(display, weight) for display, weight, keys in entries if any(key.startswith(prefix) for key in keys)]
+    matching.sort(key=lambda item: (-item[1], len(item[0]), item[0]))
+    return matching[:min(size, max(limit, 0))]
+
+
+def all_prefixes(entries: List[Entry]) -> List[str]:
+    return sorted({key[:i] for _, _, keys in entries for key in keys for i in range(len(key) + 1)})
+
+
+def test_completes_every_prefix():
+    rng = random.Random(13)
+    # A small alphabet with a multi-byte letter makes long shared prefixes and splits inside utf-8 sequences
+    alphabet = "abé"
+    entries = [(f"Entry {i}", rng.randint(1, 5), ["".join(rng.choices(alphabet, k=rng.randint(1, 8)))
+                                                   for _ in range(rng.randint(1, 3))])
+               for i in range(300)]
+    trie = CompletionTrie.from_entries(entries)
+    misses = ["".join(rng.choices(alphabet + "c", k=rng.randint(1, 9))) for _ in range(200)]
+    for prefix in all_prefixes(entries) + misses:
+        for limit in (1, 3, SUGGESTIONS_PER_NODE, 50):
+            assert trie.complete(prefix, limit) == brute_force(entries, prefix, limit), (prefix, limit)
+
+
+def test_ranking_after_node_splits():
+    entries = [("Roman", 2, ["roman"]), ("Romance", 5, ["romance"]), ("Rome", 1, ["rome"]),
+               ("Romantic", 5, ["romantic"]), ("Rom", 1, ["rom"]), ("Robot", 3, ["robot"])]
+    trie = CompletionTrie.from_entries(entries, size=3)
+    # "ro" branches into "m" and "bot"; "rom" ends a key and branches into "an" and "e"
+    assert trie.complete("ro", 10) == [("Romance", 5), ("Romantic", 5), ("Robot", 3)]
+    assert trie.complete("rom", 10) == [("Romance", 5), ("Romantic", 5), ("Roman", 2)]
+    assert trie.complete("roma", 10) == [("Romance", 5), ("Romantic", 5), ("Roman", 2)]
+    assert trie.complete("romanc", 10) == [("Romance", 5)]
+    assert trie.complete("rome", 10) == [("Rome", 1)]
+    assert trie.complete("rob", 10) == trie.complete("robo", 10) == [("Robot", 3)]
+    # Mismatches at an edge and inside a merged label
+    assert trie.complete("rox", 10) == []
+    assert trie.complete("robe", 10) == []
+    assert trie.complete("romantics", 10) == []
+    for prefix in all_prefixes(entries) + ["", "r"]:
+        assert trie.complete(prefix, 10) == brute_force(entries, prefix, 10, size=3), prefix
+
+
+def test_limits_and_empty_tries():
+    trie = CompletionTrie.from_entries([("Space", 1, ["space"]), ("Spa", 1, ["spa"])])
+    assert trie.complete("sp", 1) == [("Spa", 1)]
+    assert trie.complete("sp", 0) == []
+    assert trie.complete("sp", -1) == []
+    assert CompletionTrie().complete("sp") == []
+    assert CompletionTrie.from_entries([]).complete("") == []
+
+
+def test_normalization():
+    assert normalize_words("  Star   WARS: Episode-IV! ") == ["star", "wars", "episodeiv"]
+    assert normalize_prefix("Star  Wa") == "star wa"
+    assert normalize_prefix("Star ") == "star "
+    assert normalize_prefix("  ") == ""
+    assert normalize_prefix("!!") == ""
+
+
+def test_build_suggesters():
+    titles, words = build_suggesters(["Star Wars", "star wars!", "Star Trek", "The Wars", "  Wars of Stars ", 7, "..."])
+    # A title completes from any of its words and weighs the documents with that normalized title
+    assert titles.complete("wars", 10) == [("Star Wars", 2), ("The Wars", 1), ("Wars of Stars", 1)]
+    assert titles.complete("star", 10) == [("Star Wars", 2), ("Star Trek", 1), ("Wars of Stars", 1)]
+    assert titles.complete("star ", 10) == [("Star Wars", 2), ("Star Trek", 1)]
+    assert titles.complete("of s", 10) == [("Wars of Stars", 1)]
+    assert words.complete("st", 10) == [("star", 3), ("stars", 1)]
+    assert words.complete("wars", 10) == [("wars", 4)]
+
+
+def test_index_suggestions_survive_save_and_load(cache_dir, corpus_file, records):
+    built = InvertedIndex(cache_dir=cache_dir)
+    built.build(filename=str(corpus_file))
+    built.save()
+    loaded = InvertedIndex(cache_dir=cache_dir)
+    loaded.load()
+    title_entries = {}
+    for record in records:
+        words = normalize_words(record["title"])
+        key = " ".join(words)
+        display, count, _ = title_entries.get(key, (record["title"].strip(), 0, None))
+        title_entries[key] = (display, count + 1, [" ".join(words[i:]) for i in range(len(words))])
+    entries = list(title_entries.values())
+    for prefix in ("s", "space", "space r", "robot", "haunted c", "x", "dragon ", "the"):
+        expected = brute_force(entries, normalize_prefix(prefix), 5)
+        assert built.suggest(prefix)["titles"] == loaded.suggest(prefix)["titles"] == expected, prefix
+        assert built.suggest(prefix)["words"] == loaded.suggest(prefix)["words"]
+    assert loaded.suggest(" ") == {"titles": [], "words": []}
@@ -0,0 +1,73 @@
+from typing import Dict, List, Tuple
+
+import pytest
+
+from corpus_stats import bm25_idf, bm25_saturation
+from keyword_search_cli import InvertedIndex
+
+QUERIES = (
+    "space", "space robot", "haunted castle", "brave knight treasure", "dragon wizard pirate ocean",
+    "space robot dragon wizard pirate ocean castle knight", "hero future time", "hero", "space space robot",
+    "the space", "missing", "missing hero",
+)
+LIMITS = (1, 3, 10, 50, 1000)
+
+
+def brute_force(terms: List[str], reference: Dict[str, Dict[int, List[int]]], limit: int,
+                idfs: Dict[str, float], avg_doc_length: float) -> List[Tuple[int, float]]:
+    """Score every posting of the terms, summing in top_k_scores' (-idf, term) order."""
+    doc_lengths: Dict[int, int] = {}
+    for postings in reference.values():
+        for doc_id, positions in postings.items():
+            doc_lengths[doc_id] = doc_lengths.get(doc_id, 0) + len(positions)
+    scores: Dict[int, float] = {}
+    for term in sorted(set(terms) & set(idfs), key=lambda term: (-idfs[term], term)):
+        for doc_id, positions in reference.get(term, {}).items():
+            score = bm25_saturation(len(positions), doc_lengths[doc_id], avg_doc_length) * idfs[term]
+            scores[doc_id] = scores.get(doc_id, 0.0) + score
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def corpus_idfs(reference: Dict[str, Dict[int, List[int]]], doc_count: int) -> Dict[str, float]:
+    return {term: bm25_idf(doc_count, len(postings)) for term, postings in reference.items()}
+
+
+def assert_same_ranking(actual: List[Tuple[int, float]], expected: List[Tuple[int, float]]) -> None:
+    assert [doc_id for doc_id, _ in actual] == [doc_id for doc_id, _ in expected]
+    assert [score for _, score in actual] == pytest.approx([score for _, score in expected])
+
+
+@pytest.fixture(params=["built", "loaded"])
+def index(request, cache_dir, corpus_file) -> InvertedIndex:
+    index = InvertedIndex(cache_dir=cache_dir)
+    index.build(filename=str(corpus_file))
+    if request.param == "loaded":
+        index.save()
+        index = InvertedIndex(cache_dir=cache_dir)
+        index.load()
+    return index
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+@pytest.mark.parametrize("query", QUERIES)
+def test_search_matches_brute_force(index, analyzer, reference, records, query, limit):
+    idfs = corpus_idfs(reference, len(records))
+    avg_doc_length = index.avg_doc_length
+    expected = brute_force(analyzer.analyze(query), reference, limit, idfs, avg_doc_length)
+    assert_same_ranking(index.search(query, limit), expected)
+
+
+@pytest.mark.parametrize("avg_scale", [0.5, 1.0, 3.0])
+@pytest.mark.parametrize("limit", LIMITS)
+def test_score_terms_matches_brute_force(index, analyzer, reference, records, limit, avg_scale):
+    # Statistics of a larger corpus, as a shard would be given
+    idfs = corpus_idfs(reference, len(records) * 3)
+    avg_doc_length = index.avg_doc_length * avg_scale
+    terms = analyzer.analyze("space robot dragon haunted castle hero")
+    expected = brute_force(terms, reference, limit, idfs, avg_doc_length)
+    assert_same_ranking(index.score_terms({term: idfs[term] for term in terms}, limit, avg_doc_length), expected)
+
+
+def test_search_without_limit_or_query(index):
+    assert index.search("space", 0) == []
+    assert index.search("", 10) == []
@@ -0,0 +1,185 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import keyword_search_cli
+import vector_index
+from keyword_search_cli import VECTOR_FILENAME, InvertedIndex, build_vector_index, update_vector_index
+from segment import record_hash
+from test_cli import run_cli
+from vector_index import HashingEncoder, VectorIndex, get_encoder, register_encoder
+
+TEXTS = ["space robot adventure", "haunted castle dragon", "robot space adventure", "", "the of and",
+         "space robot adventure"]
+
+
+def test_hashing_encoder_is_deterministic():
+    first = HashingEncoder(64).encode(TEXTS)
+    assert first.shape == (len(TEXTS), 64) and first.dtype == np.float32
+    assert np.array_equal(HashingEncoder(64).encode(TEXTS), first)
+    # A text's vector does not depend on the batch it is encoded in
+    for i, text in enumerate(TEXTS):
+        assert np.array_equal(HashingEncoder(64).encode([text])[0], first[i])
+    assert np.array_equal(first[0], first[5])
+    # Adjacent pairs are features too, so word order matters
+    assert not np.array_equal(first[0], first[2])
+    assert not first[3].any() and not first[4].any()
+    with pytest.raises(ValueError):
+        HashingEncoder(0)
+
+
+def test_hashing_encoder_does_not_depend_on_the_hash_seed(analyzer):
+    # Runs under other string hash seeds, with the tests' stopwords
+    script = (f"import sys, text_analysis; from pathlib import Path; "
+              f"text_analysis._default_analyzer = text_analysis.TextAnalyzer(Path({str(analyzer.stopwords_path)!r})); "
+              f"from vector_index import HashingEncoder; "
+              f"print(HashingEncoder(32).encode({TEXTS!r}).tolist())")
+    cli = Path(keyword_search_cli.__file__).parent
+    expected = HashingEncoder(32).encode(TEXTS).tolist()
+    for seed in ("1", "2"):
+        result = subprocess.run([sys.executable, "-c", script], cwd=cli, capture_output=True, text=True, check=True,
+                                env={"PYTHONHASHSEED": seed, "PATH": ""})
+        assert json.loads(result.stdout) == expected
+
+
+def clustered_vectors(count: int, dimensions: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions))
+    noise = 0.4 * rng.standard_normal((count, dimensions))
+    return (centers[rng.integers(clusters, size=count)] + noise).astype(np.float32)
+
+
+def assert_same_results(actual, expected) -> None:
+    for got, want in zip(actual, expected, strict=True):
+        assert [doc_id for doc_id, _ in got] == [doc_id for doc_id, _ in want]
+        assert [score for _, score in got] == pytest.approx([score for _, score in want], abs=1e-6)
+
+
+def test_ivf_recall_against_an_exact_scan():
+    vectors = clustered_vectors(6000, 32, 60)
+    doc_ids = np.arange(10, 6010)
+    index = VectorIndex.build(doc_ids, vectors.copy(), partitions=64)
+    exact = VectorIndex.build(doc_ids, vectors.copy(), partitions=0)
+    assert index.partitions == 64 and exact.partitions == 0
+    assert sorted(index.doc_ids.tolist()) == doc_ids.tolist()
+    queries = clustered_vectors(200, 32, 60, seed=1)
+    expected = exact.search_vectors(queries, 10)
+    assert index.search_vectors(queries, 10, nprobe=None) == expected
+    assert index.search_vectors(queries, 10, nprobe=64) == expected
+    for nprobe, min_recall in ((1, 0.5), (8, 0.9)):
+        found = index.search_vectors(queries, 10, nprobe)
+        hits = sum(len({doc_id for doc_id, _ in got} & {doc_id for doc_id, _ in want})
+                   for got, want in zip(found, expected))
+        assert hits / (10 * len(queries)) >= min_recall, nprobe
+    # Probed results are exact scores, in rank order
+    for got in index.search_vectors(queries, 10, 8):
+        assert [score for _, score in got] == sorted((score for _, score in got), reverse=True)
+
+
+def test_partitions_default_to_exact_below_the_ivf_threshold():
+    vectors = clustered_vectors(100, 8, 4)
+    assert VectorIndex.build(range(100), vectors).partitions == 0
+    assert VectorIndex.build(range(100), vectors, partitions=200).partitions == 100
+    with pytest.raises(ValueError):
+        VectorIndex.build(range(99), vectors)
+    assert VectorIndex.build(range(100), vectors).search_vectors(vectors[:2], 0) == [[], []]
+
+
+def test_save_and_load(tmp_path):
+    vectors = clustered_vectors(300, 16, 5)
+    index = VectorIndex.build(range(300), vectors, partitions=8, encoder_spec={"name": "hashing", "dimensions": 16},
+                              doc_hashes=range(1000, 1300))
+    path = tmp_path / VECTOR_FILENAME
+    index.save(path)
+    loaded = VectorIndex.load(path)
+    for name in ("doc_ids", "doc_hashes", "vectors", "centroids", "list_offsets"):
+        assert np.array_equal(getattr(loaded, name), getattr(index, name)), name
+    assert loaded.encoder_spec == {"name": "hashing", "dimensions": 16}
+    assert loaded.search_vectors(vectors[:5], 3, 2) == index.search_vectors(vectors[:5], 3, 2)
+
+    path.write_bytes(path.read_bytes()[:100])
+    with pytest.raises(ValueError):
+        VectorIndex.load(path)
+    with pytest.raises(FileNotFoundError):
+        VectorIndex.load(tmp_path / "missing.seg")
+
+
+@pytest.mark.parametrize("partitions", [0, 8])
+def test_updated_matches_a_fresh_build(partitions):
+    vectors = clustered_vectors(400, 16, 6)
+    index = VectorIndex.build(range(400), vectors.copy(), partitions, doc_hashes=range(400))
+    replacement = clustered_vectors(10, 16, 6, seed=2)
+    removed = list(range(0, 400, 7))
+    changed = list(range(3, 30, 3))
+    updated = index.updated(removed + changed, changed + [500], replacement.copy(), [1] * len(changed) + [2])
+    assert updated.partitions == index.partitions
+    if partitions:
+        assert np.array_equal(updated.centroids, index.centroids)
+        assert updated.list_offsets[-1] == len(updated.doc_ids)
+
+    kept = [doc_id for doc_id in range(400) if doc_id not in removed and doc_id not in changed]
+    fresh = VectorIndex.build(kept + changed + [500], np.concatenate((vectors[kept], replacement)), partitions=0)
+    assert sorted(updated.doc_ids.tolist()) == sorted(fresh.doc_ids.tolist())
+    hashes = dict(zip(updated.doc_ids.tolist(), updated.doc_hashes.tolist()))
+    assert [hashes[doc_id] for doc_id in changed + [500, kept[0]]] == [1] * len(changed) + [2, kept[0]]
+    queries = clustered_vectors(20, 16, 6, seed=3)
+    assert_same_results(updated.search_vectors(queries, 10, None), fresh.search_vectors(queries, 10))
+    with pytest.raises(ValueError):
+        index.updated([], [1], replacement[:1], [0])
+
+
+def make_encoder(dimensions: int) -> HashingEncoder:
+    encoder = HashingEncoder(dimensions)
+    encoder.name = "plugin"
+    return encoder
+
+
+def test_encoders_resolve_by_name_or_module_factory(monkeypatch, tmp_path):
+    monkeypatch.setattr(vector_index, "_encoders", dict(vector_index._encoders))
+    assert isinstance(get_encoder("hashing", 8), HashingEncoder)
+    register_encoder("plugin", make_encoder)
+    assert get_encoder("plugin", 12).name == "plugin"
+    assert get_encoder("plugin", 12).dimensions == 12
+
+    (tmp_path / "my_encoders.py").write_text(
+        "from vector_index import HashingEncoder\n"
+        "def small(dimensions):\n"
+        "    encoder = HashingEncoder(dimensions)\n"
+        "    encoder.name = 'small'\n"
+        "    return encoder\n", encoding="utf-8")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    encoder = get_encoder("my_encoders:small", 16)
+    assert (encoder.name, encoder.dimensions) == ("small", 16)
+    for name in ("my_encoders:missing", "no_such_module:factory", "unknown"):
+        with pytest.raises(ValueError):
+            get_encoder(name, 16)
+
+
+def test_builds_keep_the_vector_index_in_line(monkeypatch, capsys, cache_dir, corpus_file, records):
+    run_cli(monkeypatch, capsys, "build", "--data-file", str(corpus_file))
+    index = InvertedIndex()
+    index.load()
+    # Without a vector index there is nothing to update
+    assert update_vector_index(index) is None
+    run_cli(monkeypatch, capsys, "vector-build", "--data-file", str(corpus_file), "--dimensions", "64")
+    assert "Vector index updated: 0 encoded, 0 deleted." in \
+        run_cli(monkeypatch, capsys, "build", "--data-file", str(corpus_file), "--incremental")
+
+    changed = dict(records[0], description="A haunted castle on a haunted island.")
+    added = {"id": 10_000_000, "title": "Pirate Treasure", "description": "Pirates find the ocean treasure."}
+    remaining = [changed, added] + records[2:]
+    corpus_file.write_text(json.dumps({"movies": remaining}), encoding="utf-8")
+    output = run_cli(monkeypatch, capsys, "build", "--data-file", str(corpus_file), "--incremental")
+    assert "Vector index updated: 2 encoded, 1 deleted." in output
+
+    updated = VectorIndex.load(cache_dir / VECTOR_FILENAME)
+    hashes = dict(zip(updated.doc_ids.tolist(), updated.doc_hashes.tolist()))
+    assert hashes == {record["id"]: record_hash(record) for record in remaining}
+    fresh = build_vector_index(str(corpus_file), dimensions=64)
+    for query in ("haunted castle island", "pirate treasure", "space robot"):
+        assert_same_results(updated.search([query], 10, None), fresh.search([query], 10, None))
+    assert updated.search(["haunted castle island"], 1, None)[0][0][0] == changed["id"]